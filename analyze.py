@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# Multi-survey analytics: load many survey logs into columns and aggregate per location, BSSID,
+# band and channel with vectorized group-bys.
+#
+# Parsed surveys are cached as one columnar file each, keyed by log mtime/size. Re-running over
+# a growing archive only parses new files, and only the new tail of a log that was appended to.
+import os
+import sys
+import json
+import hashlib
+import argparse
+
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError:
+    sys.exit("pandas and numpy are needed for analysis. Run 'pip install -r requirements.txt'")
+
+from survey_schema import FIELD_ORDER, field_type
+from survey_log import MANIFEST, segment_paths, find_logs
+from survey_binary import is_binary, read_records
+
+INDEX_DIRNAME = ".analyze_index"
+INDEX_VERSION = 1
+HEAD_BYTES = 4096  # Fingerprint of the start of a log, tells an appended file from a replaced one
+
+DIMENSIONS = {"location": ["location"], "bssid": ["bssid", "ssid"], "band": ["channel_band"],
+              "channel": ["channel_band", "channel"]}
+PANDAS_TYPES = {"int": "Int64", "float": "float64", "str": "string"}
+
+
+# --- Loading ---
+def find_surveys(paths):
+    # Files and survey directories as given, other directories expanded to their finished surveys
+    logs = []
+    for path in paths:
+        path = path.rstrip(os.sep)
+        if os.path.isdir(path) and not os.path.exists(os.path.join(path, MANIFEST)):
+            logs += find_logs(path)
+        else:
+            logs.append(path)
+    return sorted(p for p in set(logs) if "_running" not in os.path.basename(p))
+
+
+def head_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(HEAD_BYTES)).hexdigest()
+
+
+def parse_log(path, offset=0, survey=None):
+    # Returns (frame, offset after the last complete line), a torn last line is left for next time
+    if is_binary(path):
+        records, offset = read_records(path, offset)
+        return to_frame([r for r in records if "event" not in r], survey or os.path.basename(path)), offset
+    records = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "event" not in record:
+                records.append(record)
+    return to_frame(records, survey or os.path.basename(path)), offset
+
+
+def parse_survey(path):
+    survey = os.path.basename(path)
+    frames = [f for seg in segment_paths(path) if len(f := parse_log(seg, survey=survey)[0])]
+    return pd.concat(frames, ignore_index=True) if frames else to_frame([], survey)
+
+
+def to_frame(records, survey):
+    df = pd.DataFrame.from_records(records)
+    columns = list(FIELD_ORDER) + [c for c in df.columns if c not in FIELD_ORDER]
+    df = df.reindex(columns=columns)
+    for col in df.columns:
+        ftype = field_type(col)
+        if ftype == "str":
+            df[col] = df[col].astype("string")
+        else:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(PANDAS_TYPES[ftype])
+    df.insert(0, "survey", pd.Series([survey] * len(df), dtype="string"))
+    return df
+
+
+class SurveyIndex:
+    # One cached frame per survey plus a manifest of what each was built from
+    def __init__(self, index_dir):
+        self.dir = index_dir
+        self.manifest_path = os.path.join(index_dir, "index.json")
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path) as f:
+                    data = json.load(f)
+                if data.get("version") == INDEX_VERSION:
+                    self.manifest = data["surveys"]
+            except (OSError, ValueError, KeyError):
+                pass
+        self.parsed = 0
+        self.appended = 0
+        self.cached = 0
+
+    def _cache_path(self, name):
+        return os.path.join(self.dir, os.path.splitext(name)[0] + ".parquet")
+
+    def _save(self, name, df):
+        try:
+            df.to_parquet(self._cache_path(name), index=False)
+        except ImportError:
+            df.to_pickle(self._cache_path(name))
+
+    def _load(self, name):
+        try:
+            return pd.read_parquet(self._cache_path(name))
+        except ImportError:
+            return pd.read_pickle(self._cache_path(name))
+
+    def load(self, path):
+        if not os.path.isdir(path):
+            return self._load_file(path, os.path.basename(path))
+        # Segmented survey: one cache entry per segment, only the last one is ever still growing
+        survey = os.path.basename(path)
+        frames = [self._load_file(seg, f"{survey}__{os.path.basename(seg)}", survey) for seg in segment_paths(path)]
+        frames = [f for f in frames if len(f)]
+        return pd.concat(frames, ignore_index=True) if frames else to_frame([], survey)
+
+    def _load_file(self, path, name, survey=None):
+        st = os.stat(path)
+        entry = self.manifest.get(name)
+        fresh = entry and entry["mtime"] == st.st_mtime and entry["size"] == st.st_size
+        if fresh and os.path.exists(self._cache_path(name)):
+            self.cached += 1
+            return self._load(name)
+
+        head = head_hash(path)
+        if entry and st.st_size >= entry["offset"] and entry["head"] == head and os.path.exists(self._cache_path(name)):
+            # Same log, more lines: parse only the tail
+            new, offset = parse_log(path, entry["offset"], survey)
+            df = pd.concat([self._load(name), new], ignore_index=True) if len(new) else self._load(name)
+            self.appended += 1
+        else:
+            df, offset = parse_log(path, survey=survey)
+            self.parsed += 1
+        self._save(name, df)
+        self.manifest[name] = {"mtime": st.st_mtime, "size": st.st_size, "offset": offset, "head": head, "rows": len(df)}
+        return df
+
+    def flush(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": INDEX_VERSION, "surveys": self.manifest}, f, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+
+def load_surveys(paths, use_cache=True, rebuild=False):
+    logs = find_surveys(paths)
+    if not logs:
+        return pd.DataFrame(columns=["survey"] + FIELD_ORDER), None
+    index = None
+    if use_cache:
+        index_dir = os.path.join(os.path.dirname(os.path.abspath(logs[0])), INDEX_DIRNAME)
+        os.makedirs(index_dir, exist_ok=True)
+        index = SurveyIndex(index_dir)
+        if rebuild:
+            index.manifest = {}
+        frames = [index.load(p) for p in logs]
+        index.flush()
+    else:
+        frames = [parse_survey(p) for p in logs]
+    frames = [f for f in frames if len(f)]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["survey"] + FIELD_ORDER)
+    return df, index
+
+
+# --- Aggregation ---
+def fresh_mask(df, value_col, age_col):
+    # iperf values repeat in every record until the next test, count each test once.
+    # A new test shows up as its sample age dropping (or, for old logs, the value changing).
+    # Merged multi-agent surveys interleave agents, each one has its own test sequence
+    keys = ["survey", "agent"] if "agent" in df.columns else "survey"
+    by_survey = df.groupby(keys, sort=False, dropna=False)
+    if age_col in df.columns and df[age_col].notna().any():
+        prev_age = by_survey[age_col].shift()
+        mask = prev_age.isna() | (df[age_col] < prev_age)
+    else:
+        mask = by_survey[value_col].shift() != df[value_col]
+    return (mask & df[value_col].notna()).fillna(False).astype(bool)
+
+
+def prepare(df):
+    df = df.copy()
+    for col in ("rssi_dbm", "noise_dbm", "snr", "bss_transition", "iperf_rx_mbps", "iperf_tx_mbps",
+                "icmp_lan_ms", "icmp_lan_lost", "icmp_wan_ms", "icmp_wan_lost"):
+        if col not in df.columns:
+            df[col] = np.nan
+        df[col] = df[col].astype("float64")
+    # Pings that overlapped a throughput test (load_policy "tag") measured iperf's queue, not the link
+    if "under_load" in df.columns:
+        tags = df["under_load"].fillna("").astype(str)
+        for prefix in ("lan", "wan"):
+            loaded = tags.str.contains(f"icmp_{prefix}", regex=False)
+            df.loc[loaded, [f"icmp_{prefix}_ms", f"icmp_{prefix}_lost"]] = np.nan
+        for name in app_probe_names(df):
+            df.loc[tags.str.contains(f"app_{name},", regex=False) | tags.str.endswith(f"app_{name}"),
+                   f"app_{name}_ms"] = np.nan
+    # snr was logged as 0 when noise was missing
+    df["snr"] = (df["rssi_dbm"] - df["noise_dbm"]).where(df["noise_dbm"].notna(), np.nan)
+    for direction in ("rx", "tx"):
+        col = f"iperf_{direction}_mbps"
+        df[col] = df[col].where(fresh_mask(df, col, f"age_iperf_{direction}_ms"))
+    return df
+
+
+def app_probe_names(df):
+    # Application probes (app_<name>_ms columns), whatever the surveys configured
+    return [c[4:-3] for c in df.columns if c.startswith("app_") and c.endswith("_ms")
+            and not c.endswith(("_connect_ms", "_total_ms"))]
+
+
+def quantiles(grouped, col, qs, prefix):
+    out = grouped[col].quantile(qs).unstack()
+    out.columns = [f"{prefix}_p{int(q * 100)}" for q in out.columns]
+    return out
+
+
+def aggregate(df, keys):
+    # One row per group, every statistic computed column-wise over all groups at once
+    df = df.dropna(subset=keys)
+    g = df.groupby(keys, sort=True, observed=True)
+    out = pd.DataFrame({
+        "samples": g.size(),
+        "surveys": g["survey"].nunique(),
+        "roams": g["bss_transition"].sum(min_count=1),
+        "lan_loss_pct": g["icmp_lan_lost"].mean(),
+        "wan_loss_pct": g["icmp_wan_lost"].mean(),
+        "iperf_tests": g["iperf_rx_mbps"].count() + g["iperf_tx_mbps"].count(),
+    })
+    parts = [out,
+             quantiles(g, "rssi_dbm", [0.1, 0.5, 0.9], "rssi"),
+             quantiles(g, "snr", [0.1, 0.5, 0.9], "snr"),
+             quantiles(g, "icmp_lan_ms", [0.5, 0.95], "lan_ms"),
+             quantiles(g, "icmp_wan_ms", [0.5, 0.95], "wan_ms"),
+             quantiles(g, "iperf_rx_mbps", [0.1, 0.5, 0.9], "rx_mbps"),
+             quantiles(g, "iperf_tx_mbps", [0.1, 0.5, 0.9], "tx_mbps")]
+    for name in app_probe_names(df):
+        parts.append(quantiles(g, f"app_{name}_ms", [0.5, 0.95], f"{name}_ms"))
+        if f"app_{name}_error" in df.columns:
+            # Share of logged samples with a failed probe
+            parts.append(df[f"app_{name}_error"].notna().groupby([df[k] for k in keys], sort=True, observed=True)
+                         .mean().mul(100).rename(f"{name}_fail_pct"))
+    return pd.concat(parts, axis=1).round(2).reset_index()
+
+
+def analyze(df, dimensions=DIMENSIONS):
+    df = prepare(df)
+    return {name: aggregate(df, keys) for name, keys in dimensions.items()}
+
+
+# --- Output ---
+def write_reports(reports, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for name, table in reports.items():
+        path = os.path.join(out_dir, f"by_{name}.csv")
+        table.to_csv(path, index=False, encoding="utf-8-sig")
+        paths.append(path)
+    try:
+        xlsx = os.path.join(out_dir, "analysis.xlsx")
+        with pd.ExcelWriter(xlsx) as writer:
+            for name, table in reports.items():
+                table.to_excel(writer, sheet_name=f"by_{name}", index=False)
+        paths.append(xlsx)
+    except ImportError:
+        print("Warning: openpyxl is not installed, skipping XLSX. Run 'pip install openpyxl'")
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate many survey logs per location, BSSID, band and channel.")
+    parser.add_argument("paths", nargs="+", help="surveys (directories or .jsonl files) or directories of them")
+    parser.add_argument("--by", nargs="+", choices=list(DIMENSIONS), default=list(DIMENSIONS),
+                        help="aggregations to compute (default: all)")
+    parser.add_argument("--out", metavar="DIR", help="write by_<dimension>.csv and analysis.xlsx to DIR")
+    parser.add_argument("--no-cache", action="store_true", help="parse every log, don't read or write the index")
+    parser.add_argument("--rebuild", action="store_true", help="re-parse every log and rewrite the index")
+    args = parser.parse_args()
+
+    df, index = load_surveys(args.paths, use_cache=not args.no_cache, rebuild=args.rebuild)
+    summary = f"{len(df)} records from {df['survey'].nunique()} surveys"
+    if index:
+        summary += f" ({index.parsed} parsed, {index.appended} appended, {index.cached} from index)"
+    print(summary)
+    if df.empty:
+        sys.exit(0)
+
+    reports = analyze(df, {name: DIMENSIONS[name] for name in args.by})
+    if args.out:
+        for path in write_reports(reports, args.out):
+            print(f"-> Saved {path}")
+    else:
+        with pd.option_context("display.max_rows", 200, "display.max_columns", 40, "display.width", 250):
+            for name, table in reports.items():
+                print(f"\n--- By {name} ---")
+                print(table.to_string(index=False))
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# Application-layer latency probes: TCP handshake, DNS query and HTTP(S) time to first byte,
+# all on one asyncio loop next to the ICMP engine.
+#
+# Targets are URLs, keyed by a name that becomes the column prefix (app_<name>_*):
+#   tcp://10.0.0.5:22                TCP connect time
+#   dns://1.1.1.1/example.com        query time against that resolver (?type=AAAA, port 53 by default)
+#   https://intranet/health          time to first byte, connect/TLS time when the connection is new
+# "gateway" as the host is replaced with the current default gateway, like for ICMP targets.
+#
+# Hostnames are resolved before the clock starts, so connect and TTFB times are the network only.
+# HTTP connections are kept alive between runs (TTFB then is one round trip plus the server),
+# DNS uses one UDP socket per resolver.
+import re
+import ssl
+import sys
+import time
+import random
+import socket
+import struct
+import asyncio
+import argparse
+from urllib.parse import urlsplit, parse_qs
+
+from probe_coordinator import ping_airtime_s
+
+PROBE_KINDS = ("tcp", "dns", "http")
+DNS_QTYPES = {"A": 1, "NS": 2, "CNAME": 5, "MX": 15, "TXT": 16, "AAAA": 28}
+DNS_RCODES = {0: "NOERROR", 1: "FORMERR", 2: "SERVFAIL", 3: "NXDOMAIN", 4: "NOTIMP", 5: "REFUSED"}
+MAX_HEADER_BYTES = 64 * 1024
+USER_AGENT = "wifi-survey"
+_NAME = re.compile(r"^[A-Za-z0-9]+$")
+
+
+# --- Targets ---
+class AppProbe:
+    __slots__ = ("name", "kind", "url", "host", "port", "path", "tls", "query", "qtype")
+
+    def __init__(self, name, kind, url, host, port, path=None, tls=False, query=None, qtype=1):
+        self.name = name
+        self.kind = kind
+        self.url = url
+        self.host = host
+        self.port = port
+        self.path = path
+        self.tls = tls
+        self.query = query
+        self.qtype = qtype
+
+
+def parse_probe(name, url):
+    # "https://host/path" -> AppProbe, ValueError on anything we can't probe
+    if not _NAME.match(name):
+        raise ValueError(f"probe name {name!r} must be letters and digits (it becomes a column prefix)")
+    u = urlsplit(url)
+    scheme = u.scheme.lower()
+    try:
+        port = u.port
+    except ValueError:
+        raise ValueError(f"{name}: bad port in {url!r}")
+    if not u.hostname:
+        raise ValueError(f"{name}: no host in {url!r}")
+    if scheme in ("http", "https"):
+        path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        return AppProbe(name, "http", url, u.hostname, port or (443 if scheme == "https" else 80), path,
+                        tls=scheme == "https")
+    if scheme == "tcp":
+        if not port:
+            raise ValueError(f"{name}: tcp:// needs a port, e.g. tcp://{u.hostname}:443")
+        return AppProbe(name, "tcp", url, u.hostname, port)
+    if scheme == "dns":
+        query = u.path.strip("/")
+        qtype = (parse_qs(u.query).get("type") or ["A"])[0].upper()
+        if not query:
+            raise ValueError(f"{name}: dns:// needs a name to look up, e.g. dns://{u.hostname}/example.com")
+        if qtype not in DNS_QTYPES:
+            raise ValueError(f"{name}: query type must be one of {', '.join(DNS_QTYPES)}")
+        try:
+            encode_name(query)
+        except ValueError as e:
+            raise ValueError(f"{name}: {e}")
+        return AppProbe(name, "dns", url, u.hostname, port or 53, query=query, qtype=DNS_QTYPES[qtype])
+    raise ValueError(f"{name}: {url!r} is not a tcp://, dns://, http:// or https:// URL")
+
+
+def parse_probes(targets):
+    # {name: url} from config.json -> {name: AppProbe}
+    return {name: parse_probe(name, url) for name, url in targets.items()}
+
+
+class AppResult:
+    __slots__ = ("name", "kind", "ms", "connect_ms", "total_ms", "status", "rcode", "error",
+                 "round_trips", "bytes")
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.ms = None          # Handshake (tcp), query (dns) or time to first byte (http)
+        self.connect_ms = None  # http: TCP + TLS handshake, None when the connection was reused
+        self.total_ms = None    # http: request sent to last body byte
+        self.status = None
+        self.rcode = None
+        self.error = None
+        self.round_trips = 0    # Small frame exchanges, for the airtime estimate
+        self.bytes = 0
+
+    def airtime_s(self, rate_mbps):
+        return ping_airtime_s(self.round_trips, rate_mbps) + self.bytes * 8 / ((rate_mbps or 6) * 1e6)
+
+
+def error_kind(exc):
+    if isinstance(exc, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(exc, socket.gaierror):
+        return "resolve"
+    if isinstance(exc, ssl.SSLError):
+        return "tls"
+    if isinstance(exc, ConnectionRefusedError):
+        return "refused"
+    if isinstance(exc, (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError)):
+        return "protocol"
+    return "network"
+
+
+def probe_fields(name, kind, result):
+    # Flatten an AppResult into the app_<name>_* log columns (survey_schema.app_fields)
+    r = result or AppResult(name, kind)
+    fields = {f"app_{name}_ms": r.ms, f"app_{name}_error": r.error.split(":")[0] if r.error else None}
+    if kind == "dns":
+        fields[f"app_{name}_rcode"] = r.rcode
+    elif kind == "http":
+        fields.update({f"app_{name}_connect_ms": r.connect_ms, f"app_{name}_total_ms": r.total_ms,
+                       f"app_{name}_status": r.status})
+    return fields
+
+
+# --- DNS ---
+def encode_name(name):
+    # Wire format of a name, each label IDNA encoded first so the length byte counts the encoded bytes
+    wire = b""
+    for label in name.rstrip(".").split("."):
+        if not label:
+            continue
+        data = label.encode("idna")  # UnicodeError (a ValueError) on a label idna can't encode
+        if len(data) > 63:
+            raise ValueError(f"DNS label {label!r} is {len(data)} bytes, at most 63 allowed")
+        wire += bytes([len(data)]) + data
+    if len(wire) + 1 > 255:
+        raise ValueError(f"DNS name {name!r} is longer than 255 bytes")
+    return wire + b"\x00"
+
+
+def build_query(qid, name, qtype):
+    # Recursion desired, one question
+    return struct.pack("!HHHHHH", qid, 0x0100, 1, 0, 0, 0) + encode_name(name) + struct.pack("!HH", qtype, 1)
+
+
+def parse_response(packet):
+    # (id, rcode name, answer count), None for anything that isn't a DNS response
+    if len(packet) < 12:
+        return None
+    qid, flags, _qd, answers = struct.unpack("!HHHH", packet[:8])
+    if not flags & 0x8000:
+        return None
+    return qid, DNS_RCODES.get(flags & 0x0F, str(flags & 0x0F)), answers
+
+
+class _DnsProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.transport = None
+        self.pending = {}  # id -> future of (recv_ns, rcode)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        recv_ns = time.perf_counter_ns()
+        parsed = parse_response(data)
+        fut = self.pending.pop(parsed[0], None) if parsed else None
+        if fut and not fut.done():
+            fut.set_result((recv_ns, parsed[1]))
+
+    def error_received(self, exc):
+        # ICMP port unreachable and the like, fails whatever is waiting on this resolver
+        for fut in self.pending.values():
+            if not fut.done():
+                fut.set_exception(exc)
+        self.pending.clear()
+
+    def connection_lost(self, exc):
+        self.error_received(exc or ConnectionResetError("resolver socket closed"))
+
+
+# --- Engine ---
+class AppProbeEngine:
+    def __init__(self, timeout_s=3.0, verify_tls=True):
+        self.timeout_s = timeout_s
+        self.tls_context = ssl.create_default_context()
+        if not verify_tls:
+            self.tls_context.check_hostname = False
+            self.tls_context.verify_mode = ssl.CERT_NONE
+        self.http_conns = {}  # probe name -> (reader, writer), kept alive between runs
+        self.resolvers = {}   # (address, port) -> _DnsProtocol
+
+    def close(self):
+        for _reader, writer in self.http_conns.values():
+            writer.close()
+        self.http_conns.clear()
+        for proto in self.resolvers.values():
+            if proto.transport:
+                proto.transport.close()
+        self.resolvers.clear()
+
+    async def resolve(self, host, port):
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, family=socket.AF_INET, type=socket.SOCK_STREAM)
+        return infos[0][4][0]
+
+    async def probe(self, probe, host=None):
+        # host overrides probe.host, e.g. the current gateway
+        result = AppResult(probe.name, probe.kind)
+        try:
+            address = await self.resolve(host or probe.host, probe.port)
+            run = {"tcp": self._tcp, "dns": self._dns, "http": self._http}[probe.kind]
+            await asyncio.wait_for(run(probe, address, host or probe.host, result), self.timeout_s)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+            result.error = f"{error_kind(e)}: {str(e) or type(e).__name__}"
+        return result
+
+    async def probe_many(self, probes, hosts=None):
+        # probes: {name: AppProbe}, hosts: {name: host to use instead}, all run concurrently
+        hosts = hosts or {}
+        names = list(probes)
+        results = await asyncio.gather(*(self.probe(probes[n], hosts.get(n)) for n in names))
+        return dict(zip(names, results))
+
+    async def _tcp(self, probe, address, _host, result):
+        t0 = time.perf_counter_ns()
+        _reader, writer = await asyncio.open_connection(address, probe.port)
+        result.ms = round((time.perf_counter_ns() - t0) / 1e6, 2)
+        result.round_trips = 2  # Handshake and close
+        writer.close()
+
+    async def _dns(self, probe, address, _host, result):
+        loop = asyncio.get_running_loop()
+        proto = self.resolvers.get((address, probe.port))
+        if proto is None or proto.transport is None or proto.transport.is_closing():
+            _transport, proto = await loop.create_datagram_endpoint(_DnsProtocol, remote_addr=(address, probe.port))
+            self.resolvers[(address, probe.port)] = proto
+        qid = random.randrange(1 << 16)
+        while qid in proto.pending:
+            qid = random.randrange(1 << 16)
+        query = build_query(qid, probe.query, probe.qtype)
+        fut = proto.pending[qid] = loop.create_future()
+        t0 = time.perf_counter_ns()
+        try:
+            proto.transport.sendto(query)
+            recv_ns, result.rcode = await fut
+        finally:
+            proto.pending.pop(qid, None)
+        result.ms = round((recv_ns - t0) / 1e6, 2)
+        result.round_trips = 1
+        if result.rcode != "NOERROR":
+            result.error = f"rcode: {result.rcode}"
+
+    async def _http(self, probe, address, host, result):
+        conn = self.http_conns.pop(probe.name, None)
+        if conn and not conn[0].at_eof():
+            try:
+                return await self._exchange(probe, host, conn, result)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn[1].close()  # Server closed the idle connection, one retry on a new one
+        elif conn:
+            conn[1].close()
+        t0 = time.perf_counter_ns()
+        conn = await asyncio.open_connection(address, probe.port, ssl=self.tls_context if probe.tls else None,
+                                             server_hostname=host if probe.tls else None, limit=MAX_HEADER_BYTES)
+        result.connect_ms = round((time.perf_counter_ns() - t0) / 1e6, 2)
+        result.round_trips += 3 if probe.tls else 1
+        await self._exchange(probe, host, conn, result)
+
+    async def _exchange(self, probe, host, conn, result):
+        reader, writer = conn
+        try:
+            host_header = host if probe.port in (80, 443) else f"{host}:{probe.port}"
+            writer.write(f"GET {probe.path} HTTP/1.1\r\nHost: {host_header}\r\nUser-Agent: {USER_AGENT}\r\n"
+                         f"Accept: */*\r\nConnection: keep-alive\r\n\r\n".encode())
+            t0 = time.perf_counter_ns()
+            await writer.drain()
+            first = await reader.read(1)
+            if not first:
+                raise ConnectionResetError("connection closed before the response")
+            result.ms = round((time.perf_counter_ns() - t0) / 1e6, 2)
+            head = first + await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            parts = lines[0].split(" ", 2)
+            if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+                raise ValueError(f"bad status line {lines[0][:40]!r}")
+            result.status = int(parts[1])
+            headers = {}
+            for line in lines[1:]:
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+            keep = await self._read_body(reader, headers, result)
+            result.total_ms = round((time.perf_counter_ns() - t0) / 1e6, 2)
+            result.round_trips += 1
+            result.bytes += len(head)
+        except BaseException:
+            writer.close()
+            raise
+        if keep and headers.get("connection", "").lower() != "close":
+            self.http_conns[probe.name] = conn
+        else:
+            writer.close()
+        if result.status >= 400:
+            result.error = f"http: {result.status}"
+
+    async def _read_body(self, reader, headers, result):
+        # Reads and drops the body so the connection can be reused, False if it can't be
+        if result.status in (204, 304) or result.status < 200:
+            return True
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if not size:
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass  # Trailers
+                    return True
+                await reader.readexactly(size + 2)
+                result.bytes += size
+        if "content-length" in headers:
+            remaining = int(headers["content-length"])
+            while remaining:
+                chunk = await reader.read(min(remaining, 65536))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                remaining -= len(chunk)
+                result.bytes += len(chunk)
+            return True
+        while chunk := await reader.read(65536):  # Body ends with the connection
+            result.bytes += len(chunk)
+        return False
+
+
+# --- Local stand-ins ---
+async def serve(host="127.0.0.1", http_port=8080, dns_port=5353, delay_ms=0):
+    # An HTTP server (keep-alive, small body) and a DNS server answering every A query with 127.0.0.1,
+    # for trying the probes without a network. delay_ms is added before every response.
+    async def on_http(reader, writer):
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                await asyncio.sleep(delay_ms / 1000)
+                body = b"ok\n"
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    class DnsServer(asyncio.DatagramProtocol):
+        def connection_made(self, transport):
+            self.transport = transport
+
+        def datagram_received(self, data, addr):
+            asyncio.get_running_loop().call_later(delay_ms / 1000, self.answer, data, addr)
+
+        def answer(self, data, addr):
+            if len(data) < 12:
+                return
+            qid = struct.unpack("!H", data[:2])[0]
+            question = data[12:]
+            # Answer: pointer to the question name, A, IN, TTL 60, 127.0.0.1
+            answer = struct.pack("!HHHIH", 0xC00C, 1, 1, 60, 4) + socket.inet_aton("127.0.0.1")
+            self.transport.sendto(struct.pack("!HHHHHH", qid, 0x8180, 1, 1, 0, 0) + question + answer, addr)
+
+    http = await asyncio.start_server(on_http, host, http_port)
+    dns, _ = await asyncio.get_running_loop().create_datagram_endpoint(DnsServer, local_addr=(host, dns_port))
+    return http, dns
+
+
+async def _main(targets, count, interval_s, timeout_s, verify_tls):
+    probes = parse_probes(targets)
+    engine = AppProbeEngine(timeout_s, verify_tls)
+    try:
+        for i in range(count):
+            if i:
+                await asyncio.sleep(interval_s)
+            for name, r in (await engine.probe_many(probes)).items():
+                extra = (f" connect {r.connect_ms} total {r.total_ms} status {r.status}" if r.kind == "http"
+                         else f" {r.rcode}" if r.kind == "dns" else "")
+                print(f"{name} ({r.kind}): {r.ms} ms{extra}" + (f" [{r.error}]" if r.error else ""))
+    finally:
+        engine.close()
+
+
+async def _serve_forever(args):
+    http, dns = await serve(args.bind, args.http_port, args.dns_port, args.delay_ms)
+    print(f"HTTP on http://{args.bind}:{args.http_port}/ (also a tcp:// target), "
+          f"DNS on dns://{args.bind}:{args.dns_port}/example.com, Ctrl+C to stop")
+    try:
+        await http.serve_forever()
+    finally:
+        dns.close()
+
+
+if __name__ == "__main__":
+    # python3 app_probes.py name=url ...   |   app_probes.py serve   (local stand-in servers)
+    if len(sys.argv) >= 2 and sys.argv[1] == "serve":
+        parser = argparse.ArgumentParser(prog="app_probes.py serve", description="Local HTTP and DNS stand-ins.")
+        parser.add_argument("--bind", default="127.0.0.1")
+        parser.add_argument("--http-port", type=int, default=8080)
+        parser.add_argument("--dns-port", type=int, default=5353)
+        parser.add_argument("--delay-ms", type=float, default=0, help="added before every response")
+        try:
+            asyncio.run(_serve_forever(parser.parse_args(sys.argv[2:])))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Run application-layer probes, e.g. web=https://example.com/ "
+                                                 "dns=dns://1.1.1.1/example.com ssh=tcp://10.0.0.5:22")
+    parser.add_argument("targets", nargs="+", metavar="name=url")
+    parser.add_argument("-c", "--count", type=int, default=3)
+    parser.add_argument("-i", "--interval", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=3.0)
+    parser.add_argument("--insecure", action="store_true", help="don't verify TLS certificates")
+    args = parser.parse_args()
+    try:
+        targets = dict(t.split("=", 1) for t in args.targets)
+        asyncio.run(_main(targets, args.count, args.interval, args.timeout, not args.insecure))
+    except ValueError as e:
+        sys.exit(f"Bad target: {e}")
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# Benchmarks for the survey hot paths, results written as JSON so runs can be compared.
+#
+#   python3 bench.py                             # all benchmarks, 100k-record files
+#   python3 bench.py --records 1000000 --json before.json
+#   python3 bench.py --baseline before.json      # exit 1 if anything got >20% worse
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import platform
+import argparse
+import contextlib
+
+from survey_schema import FIELD_ORDER
+from sample_store import SampleStore
+from synth_survey import generate_records, write_log
+
+MAX_REGRESSION = 0.20
+
+
+def timed(fn, n):
+    # ns per call over n calls, after a short warm-up
+    for _ in range(min(n, 100)):
+        fn()
+    t0 = time.perf_counter_ns()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter_ns() - t0) / n
+
+
+def per_op(ns, **extra):
+    return {"metric": "ns_per_op", "value": round(ns, 1), "better": "lower", **extra}
+
+
+def throughput(records, seconds, size=None):
+    out = {"metric": "records_per_s", "value": round(records / seconds), "better": "higher",
+           "seconds": round(seconds, 3), "records": records}
+    if size:
+        out["mb_per_s"] = round(size / 1e6 / seconds, 1)
+    return out
+
+
+# --- Per tick ---
+def bench_store_update(ctx):
+    store = SampleStore()
+    wifi = {k: ctx["record"][k] for k in ("ssid", "bssid", "channel", "rssi_dbm", "noise_dbm", "tx_rate_mbps",
+                                          "phy_mode", "auth_mode", "nic_mac", "country_code", "channel_band",
+                                          "channel_width")}
+    return per_op(timed(lambda: store.update("wifi", wifi), 20000))
+
+
+def bench_log_tick(ctx):
+    # Same steps as log_task in wifi-survey.py: snapshot, ages/stale, FIELD_ORDER, json.dumps, write + flush
+    store = SampleStore()
+    rec = ctx["record"]
+    sources = {"wifi": ("ssid", "bssid", "channel", "rssi_dbm", "noise_dbm", "tx_rate_mbps", "phy_mode"),
+               "icmp_lan": [k for k in rec if k.startswith("icmp_lan")],
+               "icmp_wan": [k for k in rec if k.startswith("icmp_wan")],
+               "iperf_rx": ("iperf_rx_mbps", "iperf_rx_min_mbps"), "iperf_tx": ("iperf_tx_mbps", "iperf_tx_min_mbps"),
+               "location": ("location",)}
+    for src, keys in sources.items():
+        store.update(src, {k: rec[k] for k in keys})
+    max_age = {"wifi": 5, "icmp": 10, "iperf": 60}
+
+    with tempfile.TemporaryFile("w") as f:
+        def tick():
+            snap = store.snapshot()
+            values = snap.values()
+            for src, age_ms in snap.source_ages_ms().items():
+                values[f"age_{src}_ms"] = age_ms
+            values["stale"] = ",".join(snap.stale_sources(max_age)) or None
+            values["epoch"] = round(time.time(), 3)
+            f.write(json.dumps({k: values.get(k) for k in FIELD_ORDER}) + "\n")
+            f.flush()
+        return per_op(timed(tick, 20000))
+
+
+def bench_live_view(ctx):
+    from live_view import LiveView
+    out = io.StringIO()
+    view = LiveView("bench", out=out)
+    records = ctx["records"][:2000]
+    state = {"i": 0}
+
+    def frame():
+        rec = records[state["i"] % len(records)]
+        state["i"] += 1
+        view.push(rec)
+        view.render(rec)
+        if out.tell() > 1 << 20:
+            out.seek(0)
+            out.truncate()
+    ns = timed(frame, 5000)
+    return per_op(ns)
+
+
+# --- Probes ---
+def bench_icmp_packet(ctx):
+    from icmp_engine import build_echo, parse_echo_reply
+    reply = b"\x00" + build_echo(0x1234, 7)[1:]
+    return per_op(timed(lambda: (build_echo(0x1234, 7), parse_echo_reply(reply)), 50000))
+
+
+def bench_ping_stats(ctx):
+    from icmp_engine import ping_stats
+    rtts = [2.1, 2.4, 1.9, 3.3]
+    return per_op(timed(lambda: ping_stats(rtts, 4), 50000))
+
+
+def bench_iperf_json(ctx):
+    # Legacy iperf3 engine: parse the --json report and pull the summary
+    report = json.dumps({
+        "start": {"connected": [{"socket": 5, "local_host": "10.0.0.23", "remote_host": "10.0.0.2"}],
+                  "test_start": {"protocol": "TCP", "num_streams": 1, "duration": 2}},
+        "intervals": [{"streams": [{"socket": 5, "start": i, "end": i + 1, "bytes": 61234567,
+                                    "bits_per_second": 489876536.0}],
+                       "sum": {"start": i, "end": i + 1, "bytes": 61234567, "bits_per_second": 489876536.0}}
+                      for i in range(2)],
+        "end": {"sum_sent": {"bytes": 122469134, "bits_per_second": 489876536.0},
+                "sum_received": {"bytes": 122001234, "bits_per_second": 488004936.0}},
+    })
+
+    def parse():
+        data = json.loads(report)
+        return data["end"]["sum_received"]["bits_per_second"] / 1e6
+    return per_op(timed(parse, 20000))
+
+
+def bench_udp_accounting(ctx):
+    import struct
+    from throughput import StreamStats
+    stats = StreamStats(1, False)
+    now = time.time()
+    state = {"n": 0}
+
+    def packet():
+        state["n"] += 1
+        stats.udp_received(struct.pack("!IIQ", int(now), 0, state["n"]) + b"\x00" * 1432, True)
+    return per_op(timed(packet, 50000))
+
+
+def bench_radio_fast(ctx):
+    from radio import SyntheticBackend
+    radio = SyntheticBackend()
+    return per_op(timed(radio.sample_fast, 50000))
+
+
+def bench_roam_buffer(ctx):
+    from roam_capture import RingBuffer
+    buf = RingBuffer(250)
+    return per_op(timed(lambda: buf.append(time.monotonic_ns(), "02:00:00:00:00:10", -55), 50000))
+
+
+# --- Files ---
+def bench_generate(ctx):
+    t0 = time.perf_counter()
+    size = write_log(ctx["log_path"], ctx["n"])
+    ctx["log_size"] = size
+    return throughput(ctx["n"], time.perf_counter() - t0, size)
+
+
+def bench_segmented_log(ctx):
+    # Survey log writer: enqueue, group commit, interval fsync, segment rotation
+    from survey_log import SegmentedLog
+    records = ctx["records"]
+    log = SegmentedLog(os.path.join(ctx["tmp"], "survey_bench_running"), int(time.time()),
+                       segment_bytes=16 << 20, commit_interval_s=0.05).start()
+    t0 = time.perf_counter()
+    for i in range(ctx["n"]):
+        log.write(records[i % len(records)])
+    log.close(timeout_s=600)
+    res = throughput(ctx["n"], time.perf_counter() - t0, sum(s["bytes"] for s in log.manifest["segments"]))
+    res["commits"] = log.commits
+    return res
+
+
+def bench_binary_write(ctx):
+    # Binary log segment from the generated log: struct packing, string dictionary, sparse index
+    from survey_log import iter_segment
+    from survey_binary import Encoder
+    records = list(iter_segment(ctx["log_path"]))
+    path = ctx["srec_path"] = os.path.join(ctx["tmp"], "seg_00000.srec")
+    t0 = time.perf_counter()
+    enc = Encoder(FIELD_ORDER)
+    with open(path, "wb") as f:
+        f.write(enc.header())
+        for i in range(0, len(records), 1000):
+            f.write(enc.encode(records[i:i + 1000]))
+        f.write(enc.footer())
+    size = os.path.getsize(path)
+    res = throughput(len(records), time.perf_counter() - t0, size)
+    res["size_vs_jsonl"] = round(size / ctx["log_size"], 3)
+    return res
+
+
+def bench_binary_read(ctx):
+    # Full mmap decode, plus a one minute time range from the middle via the sparse index
+    from survey_binary import BinaryReader
+    t0 = time.perf_counter()
+    with BinaryReader(ctx["srec_path"]) as reader:
+        n = sum(1 for _ in reader.iter_records())
+        seconds = time.perf_counter() - t0
+        mid = reader.index[len(reader.index) // 2][0]
+        t1 = time.perf_counter()
+        in_range = sum(1 for _ in reader.time_range(mid, mid + 60))
+        seek_ms = (time.perf_counter() - t1) * 1e3
+    res = throughput(n, seconds, os.path.getsize(ctx["srec_path"]))
+    res.update({"range_records": in_range, "range_ms": round(seek_ms, 3)})
+    return res
+
+
+def bench_convert(ctx):
+    from convert_logs import convert_log
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ok = convert_log(ctx["log_path"])
+    res = throughput(ctx["n"], time.perf_counter() - t0, ctx["log_size"])
+    res["ok"] = ok
+    return res
+
+
+def bench_convert_csv(ctx):
+    # CSV only, no XLSX/Parquet: the cost of reading + coercing
+    from convert_logs import iter_batches, resolve_columns, to_rows, CsvSink
+    t0 = time.perf_counter()
+    sink = None
+    for batch in iter_batches(ctx["log_path"]):
+        if sink is None:
+            columns = resolve_columns(batch)
+            sink = CsvSink(os.path.join(ctx["tmp"], "bench.csv"), columns)
+        sink.write(to_rows(batch, columns))
+    sink.close()
+    return throughput(ctx["n"], time.perf_counter() - t0, ctx["log_size"])
+
+
+def bench_analyze(ctx):
+    try:
+        from analyze import load_surveys, analyze
+    except SystemExit:
+        return None  # pandas missing
+    t0 = time.perf_counter()
+    df, _ = load_surveys([ctx["log_path"]], use_cache=False)
+    analyze(df)
+    return throughput(ctx["n"], time.perf_counter() - t0, ctx["log_size"])
+
+
+def bench_heatmap(ctx):
+    # IDW of 10k points onto a 1M cell grid, the size of a large floor at 10 cm cells
+    try:
+        import numpy as np
+        from heatmap import Grid, interpolate
+    except SystemExit:
+        return None  # numpy/pandas missing
+    rng = np.random.default_rng(1)
+    points = rng.uniform(0, 100, (10_000, 2))
+    values = -40 - 0.4 * np.hypot(*(points - 30).T)
+    grid = Grid.around(points, cells=1_000_000)
+    t0 = time.perf_counter()
+    interpolate(grid, points, values)
+    seconds = time.perf_counter() - t0
+    return {"metric": "cells_per_s", "value": round(grid.nx * grid.ny / seconds), "better": "higher",
+            "seconds": round(seconds, 3), "cells": grid.nx * grid.ny, "points": len(points)}
+
+
+BENCHMARKS = {
+    "store_update": bench_store_update,
+    "log_tick": bench_log_tick,
+    "live_view_frame": bench_live_view,
+    "icmp_packet": bench_icmp_packet,
+    "ping_stats": bench_ping_stats,
+    "iperf_json_parse": bench_iperf_json,
+    "udp_accounting": bench_udp_accounting,
+    "radio_sample_fast": bench_radio_fast,
+    "roam_buffer_append": bench_roam_buffer,
+    # File benchmarks run in this order, later ones read the generated log
+    "generate_log": bench_generate,
+    "segmented_log": bench_segmented_log,
+    "binary_write": bench_binary_write,
+    "binary_read": bench_binary_read,
+    "convert_all": bench_convert,
+    "convert_csv": bench_convert_csv,
+    "analyze": bench_analyze,
+    "heatmap_idw": bench_heatmap,
+}
+FILE_BENCHMARKS = ["generate_log", "binary_write", "binary_read", "convert_all", "convert_csv", "analyze"]
+
+
+def compare(results, baseline, max_regression=MAX_REGRESSION):
+    # Regressions beyond max_regression, as (name, old, new, change)
+    worse = []
+    for name, new in results.items():
+        old = baseline.get("results", {}).get(name)
+        if not new or not old or old.get("metric") != new["metric"] or not old["value"]:
+            continue
+        change = (new["value"] - old["value"]) / old["value"]
+        if new["better"] == "higher":
+            change = -change
+        if change > max_regression:
+            worse.append((name, old["value"], new["value"], change))
+    return worse
+
+
+def run(names, n, keep_dir=None):
+    tmp = keep_dir or tempfile.mkdtemp(prefix="wifi-survey-bench-")
+    records = list(generate_records(2000, seed=2))
+    ctx = {"n": n, "tmp": tmp, "log_path": os.path.join(tmp, "survey_bench.jsonl"),
+           "records": records, "record": records[0]}
+    if any(name in FILE_BENCHMARKS for name in names) and "generate_log" not in names:
+        names = ["generate_log"] + names
+    if "binary_read" in names and "binary_write" not in names:
+        names = ["binary_write"] + names
+    results = {}
+    try:
+        for name in BENCHMARKS:
+            if name not in names:
+                continue
+            res = BENCHMARKS[name](ctx)
+            results[name] = res
+            if res:
+                unit = {"ns_per_op": "ns/op", "cells_per_s": "cells/s"}.get(res["metric"], "records/s")
+                print(f"  {name:<20} {res['value']:>12,} {unit}" + (f"  ({res['mb_per_s']} MB/s)" if "mb_per_s" in res else ""))
+    finally:
+        if not keep_dir:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the survey hot paths.")
+    parser.add_argument("--records", type=int, default=100000, help="records in the generated log (default: 100000)")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--json", metavar="FILE", default="bench_results.json", help="where to write results")
+    parser.add_argument("--baseline", metavar="FILE", help="compare against an earlier results file")
+    parser.add_argument("--max-regression", type=float, default=MAX_REGRESSION,
+                        help="allowed slowdown vs the baseline (default: 0.2 = 20%%)")
+    parser.add_argument("--keep", metavar="DIR", help="keep the generated log and exports in DIR")
+    args = parser.parse_args()
+
+    if args.keep:
+        os.makedirs(args.keep, exist_ok=True)
+    print(f"Benchmarking ({args.records} records, Python {platform.python_version()})")
+    results = run(args.only or list(BENCHMARKS), args.records, args.keep)
+
+    doc ={"time": round(time.time()), "python": platform.python_version(), "platform": platform.platform(),
+           "machine": platform.machine(), "records": args.records, "results": results}
+    with open(args.json, "w") as f:
+        json.dump(doc, f, indent=2)
+    print(f"-> Saved {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            worse = compare(results, json.load(f), args.max_regression)
+        for name, old, new, change in worse:
+            print(f"REGRESSION {name}: {old:,} -> {new:,} ({change:+.0%})")
+        if worse:
+            sys.exit(1)
+        print(f"No regressions over {args.max_regression:.0%} vs {args.baseline}")
@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+# Multi-agent surveys: every laptop streams its records to one collector over TCP.
+#
+#   agent      wifi-survey.py with "stream_to": "host:port", StreamAgent on a background thread
+#   collector  python3 collector.py [--port 9300]: ingests any number of agents, one combined live view
+#
+# Records go out in batches (zlib compressed), numbered per survey so a reconnect resumes exactly
+# where the collector left off. While the collector is unreachable batches pile up in memory,
+# then in a spool file next to the log, and are sent once it is back. The collector keeps one
+# crash-safe log per agent and, when stopped, merges them by time into a regular survey with an
+# "agent" column, which every other tool reads as usual.
+#
+#   frame    1 byte kind, u32 payload length, payload
+#     H      hello, agent -> collector: JSON {"agent", "session", "host", "token"}
+#     R      resume, collector -> agent: JSON {"next": index of the next record it needs} or {"error"}
+#     B / b  batch, agent -> collector: u64 first record index, u32 records, zlib (B) or plain (b) JSON list
+#     A      ack, collector -> agent: JSON {"next"}
+import os
+import sys
+import json
+import time
+import zlib
+import heapq
+import queue
+import collections
+import bisect
+import signal
+import socket
+import struct
+import asyncio
+import argparse
+import threading
+
+from survey_log import SegmentedLog, segment_paths, iter_segment, read_manifest
+
+DEFAULT_PORT = 9300
+SPILL_FRAMES = 16     # Unacknowledged batches kept in memory while disconnected before they go to the spool
+RECENT_RECORDS = 200  # Combined time-ordered window for the live view
+_FRAME = struct.Struct("<cI")
+_BATCH = struct.Struct("<QI")
+_STOP = object()
+
+
+# --- Protocol ---
+def frame(kind, payload):
+    return _FRAME.pack(kind, len(payload)) + payload
+
+
+def encode_batch(first, records, compress=True):
+    # (frame, uncompressed size)
+    body = json.dumps(records, separators=(",", ":")).encode()
+    if compress:
+        return frame(b"B", _BATCH.pack(first, len(records)) + zlib.compress(body, 6)), len(body)
+    return frame(b"b", _BATCH.pack(first, len(records)) + body), len(body)
+
+
+def decode_batch(kind, payload):
+    first, count = _BATCH.unpack_from(payload)
+    body = payload[_BATCH.size:]
+    records = json.loads(zlib.decompress(body) if kind == b"B" else body)
+    return first, records
+
+
+def parse_address(text, default_port=DEFAULT_PORT):
+    host, _, port = text.rpartition(":")
+    return (host, int(port)) if host else (text, default_port)
+
+
+def read_spool(path):
+    # Batch frames appended while disconnected: [(first, count, frame)]. A torn last frame is dropped.
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    frames, pos = [], 0
+    while pos + _FRAME.size + _BATCH.size <= len(data):
+        kind, n = _FRAME.unpack_from(data, pos)
+        end = pos + _FRAME.size + n
+        if end > len(data):
+            break
+        first, count = _BATCH.unpack_from(data, pos + _FRAME.size)
+        frames.append((first, count, data[pos:end]))
+        pos = end
+    return frames
+
+
+# --- Agent ---
+class StreamAgent:
+    """Streams records to a collector from a background thread, never blocks the survey on the network."""
+
+    def __init__(self, address, agent, session, spool_path=None, batch_s=1.0, batch_records=500, compress=True,
+                 spool_max_bytes=64 << 20, token="", timeout_s=5.0, retry_max_s=30.0):
+        self.address = address
+        self.agent = agent
+        self.session = session          # Survey start epoch, record numbering restarts with every survey
+        self.spool_path = spool_path    # None: no spooling, batches wait in memory only
+        self.batch_s = batch_s
+        self.batch_records = batch_records
+        self.compress = compress
+        self.spool_max_bytes = spool_max_bytes
+        self.token = token
+        self.timeout_s = timeout_s
+        self.retry_max_s = retry_max_s
+        self.queue = queue.Queue()
+        self.outbox = []                # [(first, count, frame)] not acknowledged yet, oldest first
+        self.next_index = 0
+        self.sock = None
+        self.connected = False
+        self.retry_at = 0.0
+        self.retry_s = 1.0
+        self.sent = 0                   # Records acknowledged by the collector
+        self.bytes_sent = 0
+        self.raw_bytes = 0              # JSON size before compression
+        self.spool_bytes = 0
+        self.dropped = 0                # Records lost to a full spool
+        self.connects = 0
+        self.last_error = None
+        self._thread = threading.Thread(target=self._run, name="stream-agent", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def write(self, record):
+        # Any thread
+        self.queue.put(record)
+
+    def close(self, timeout_s=10.0):
+        # Sends what's left if the collector is there, spools it otherwise
+        self.queue.put(_STOP)
+        self._thread.join(timeout_s)
+
+    def pending(self):
+        return sum(count for _, count, _ in self.outbox) + self.queue.qsize()
+
+    def stats(self):
+        return {"connected": self.connected, "sent": self.sent, "pending": self.pending(),
+                "spool_bytes": self.spool_bytes, "dropped": self.dropped, "connects": self.connects,
+                "ratio": round(self.bytes_sent / self.raw_bytes, 3) if self.raw_bytes else None,
+                "last_error": self.last_error}
+
+    # --- Thread ---
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = []
+            deadline = time.monotonic() + self.batch_s
+            while len(batch) < self.batch_records:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                self._enqueue(batch)
+            self._pump(force=stop)
+        if self.outbox:
+            self._spill()
+        self._disconnect()
+
+    def _enqueue(self, records):
+        data, raw = encode_batch(self.next_index, records, self.compress)
+        self.raw_bytes += raw
+        self.outbox.append((self.next_index, len(records), data))
+        self.next_index += len(records)
+        if not self.connected and len(self.outbox) > SPILL_FRAMES:
+            self._spill()
+
+    def _spill(self):
+        # Memory -> spool file, oldest batches first so the file stays in order
+        if not self.spool_path:
+            return
+        with open(self.spool_path, "ab") as f:
+            for first, count, data in self.outbox:
+                if self.spool_bytes + len(data) > self.spool_max_bytes:
+                    self.dropped += count
+                    continue
+                f.write(data)
+                self.spool_bytes += len(data)
+        self.outbox = []
+
+    def _pump(self, force=False):
+        if not self.connected:
+            if time.monotonic() < self.retry_at and not force:
+                return
+            if not self._connect():
+                return
+        try:
+            self._send_outbox()
+        except (OSError, ValueError) as e:
+            self._failed(e)
+
+    def _connect(self):
+        try:
+            self.sock = socket.create_connection(self.address, timeout=self.timeout_s)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            hello = {"agent": self.agent, "session": self.session, "host": socket.gethostname(), "token": self.token}
+            self.sock.sendall(frame(b"H", json.dumps(hello).encode()))
+            kind, payload = self._read_frame()
+            reply = json.loads(payload)
+            if kind != b"R" or "error" in reply:
+                raise ValueError(reply.get("error", "unexpected reply"))
+        except (OSError, ValueError) as e:
+            self._failed(e)
+            return False
+        self.connected = True
+        self.connects += 1
+        self.retry_s = 1.0
+        # What was spooled goes first, then the in-memory batches, minus what the collector already has
+        spooled = read_spool(self.spool_path) if self.spool_path else []
+        self.outbox = [b for b in spooled + self.outbox if b[0] + b[1] > reply["next"]]
+        if spooled:
+            os.remove(self.spool_path)
+            self.spool_bytes = 0
+        return True
+
+    def _send_outbox(self):
+        # Pipelined: everything out, then acks until the last batch is confirmed
+        if not self.outbox:
+            return
+        for _, _, data in self.outbox:
+            self.sock.sendall(data)
+            self.bytes_sent += len(data)
+        last = self.outbox[-1][0] + self.outbox[-1][1]
+        while self.outbox:
+            kind, payload = self._read_frame()
+            if kind != b"A":
+                raise ValueError(f"unexpected frame {kind!r}")
+            acked = json.loads(payload)["next"]
+            while self.outbox and self.outbox[0][0] + self.outbox[0][1] <= acked:
+                self.sent += self.outbox.pop(0)[1]
+            if acked >= last:
+                break
+
+    def _read_frame(self):
+        header = self._recv(_FRAME.size)
+        kind, n = _FRAME.unpack(header)
+        return kind, self._recv(n)
+
+    def _recv(self, n):
+        data = b""
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("collector closed the connection")
+            data += chunk
+        return data
+
+    def _failed(self, e):
+        self.last_error = f"{type(e).__name__}: {e}"
+        self._disconnect()
+        self.retry_at = time.monotonic() + self.retry_s
+        self.retry_s = min(self.retry_s * 2, self.retry_max_s)
+        if len(self.outbox) > SPILL_FRAMES:
+            self._spill()
+
+    def _disconnect(self):
+        self.connected = False
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+
+# --- Collector ---
+class Collector:
+    def __init__(self, log_dir, token="", clock=time.time):
+        self.log_dir = log_dir
+        self.token = token
+        self.clock = clock
+        self.start_epoch = int(clock())
+        self.dir = os.path.join(log_dir, f"collected_{self.start_epoch}")
+        self.agents = {}      # "<agent>_<session>" -> state dict
+        self.recent = []      # (epoch, key, record), time-ordered across agents
+        self.connections = 0
+        self.rejected = 0
+        self.loop = None
+
+    async def serve(self, host, port):
+        os.makedirs(self.dir, exist_ok=True)
+        self.loop = asyncio.get_running_loop()
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def _read_frame(self, reader):
+        header = await reader.readexactly(_FRAME.size)
+        kind, n = _FRAME.unpack(header)
+        return kind, await reader.readexactly(n)
+
+    def _agent(self, hello, peer):
+        key = f"{hello['agent']}_{hello['session']}"
+        st = self.agents.get(key)
+        if st is None:
+            path = os.path.join(self.dir, key)
+            st = self.agents[key] = {
+                "agent": hello["agent"], "session": hello["session"], "host": hello.get("host"), "peer": peer,
+                "path": path, "next": 0, "records": 0, "missing": 0, "duplicates": 0, "bytes": 0,
+                "written": 0, "committed": 0, "checkpoints": collections.deque(), "durable": 0, "wake": None, "resumed_at": 0,
+                "connected": False, "connects": 0, "last": None, "last_seen": None, "lag_s": None}
+            st["log"] = SegmentedLog(path, hello["session"], on_commit=lambda n, _s: self._committed(st, n)).start()
+        return st
+
+    def _committed(self, st, records):
+        # Log writer thread: records up to a checkpoint are on disk, the agent may forget them now
+        st["committed"] += records
+        while st["checkpoints"] and st["checkpoints"][0][0] <= st["committed"]:
+            st["durable"] = st["checkpoints"].popleft()[1]
+        wake = st["wake"]  # Read once, the connection handler may clear it meanwhile
+        if wake:
+            self.loop.call_soon_threadsafe(wake.set)
+
+    async def _acks(self, st, writer):
+        # Acks follow the log commits, a collector crash never loses what an agent was told is safe
+        acked, wake = -1, st["wake"]
+        try:
+            while True:
+                await wake.wait()
+                wake.clear()
+                if st["durable"] != acked:
+                    acked = st["durable"]
+                    writer.write(frame(b"A", json.dumps({"next": acked}).encode()))
+                    await writer.drain()
+        except ConnectionError:
+            pass  # The reader side notices too and cleans up
+
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        st = acks = None
+        try:
+            kind, payload = await self._read_frame(reader)
+            hello = json.loads(payload) if kind == b"H" else {}
+            if kind != b"H" or not hello.get("agent") or hello.get("session") is None:
+                raise ValueError("expected hello")
+            if self.token and hello.get("token") != self.token:
+                self.rejected += 1
+                writer.write(frame(b"R", json.dumps({"error": "bad token"}).encode()))
+                await writer.drain()
+                return
+            st = self._agent(hello, peer)
+            st.update({"connected": True, "peer": peer})
+            st["connects"] += 1
+            self.connections += 1
+            writer.write(frame(b"R", json.dumps({"next": st["next"]}).encode()))
+            await writer.drain()
+            st["wake"] = asyncio.Event()
+            acks = asyncio.create_task(self._acks(st, writer))
+            while True:
+                kind, payload = await self._read_frame(reader)
+                if kind not in (b"B", b"b"):
+                    raise ValueError(f"unexpected frame {kind!r}")
+                first, records = decode_batch(kind, payload)
+                st["bytes"] += len(payload) + _FRAME.size
+                self.ingest(st, first, records)
+                st["wake"].set()  # A batch of duplicates is acked right away
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # Agent went away, it resumes from st["next"] when it's back
+        except (ValueError, KeyError, zlib.error) as e:
+            print(f"Dropped connection from {peer}: {type(e).__name__}: {e}", file=sys.stderr)
+        finally:
+            if st:
+                st["connected"] = False
+                st["wake"] = None
+            if acks:
+                acks.cancel()
+            writer.close()
+
+    def ingest(self, st, first, records):
+        # Records are numbered per survey: skip what we have, count what never arrived (full agent spool)
+        skip = st["next"] - first
+        if skip > 0:
+            st["duplicates"] += min(skip, len(records))
+            records = records[skip:]
+        elif skip < 0 and st["written"]:
+            st["missing"] += -skip
+        elif skip < 0:
+            st["resumed_at"] = first  # Earlier records went to another collector (or an earlier run of this one)
+        if not records:
+            return
+        st["next"] = first + max(skip, 0) + len(records)
+        for record in records:
+            record["agent"] = st["agent"]
+            st["log"].write(record)
+            epoch = record.get("epoch")
+            if epoch is not None:
+                bisect.insort(self.recent, (epoch, st["agent"], record), key=lambda r: r[0])
+        del self.recent[:-RECENT_RECORDS]
+        st["records"] += len(records)
+        st["written"] += len(records)
+        st["checkpoints"].append((st["written"], st["next"]))
+        st["last"] = records[-1]
+        st["last_seen"] = self.clock()
+        if records[-1].get("epoch") is not None:
+            st["lag_s"] = round(st["last_seen"] - records[-1]["epoch"], 1)
+
+    def close(self):
+        # Stop the per-agent writers, their directories stay as the raw record of who sent what
+        for st in self.agents.values():
+            st["log"].close()
+            st["log"].finalize(st["path"], int(self.clock()))
+        return [st["path"] for st in self.agents.values()]
+
+
+def merge_agent_logs(agent_dirs, log_dir):
+    # Time-ordered merge of per-agent logs into one survey, streaming (one record per agent in memory)
+    def records(path):
+        for seg in segment_paths(path):
+            for record in iter_segment(seg):
+                if "event" not in record and record.get("epoch") is not None:
+                    yield record
+
+    agent_dirs = [d for d in agent_dirs if read_manifest(d).get("segments")]
+    if not agent_dirs:
+        return None, 0
+    start = min(int(read_manifest(d)["start_epoch"]) for d in agent_dirs)
+    # "_merged" keeps it apart from the survey an agent on this machine logged locally
+    running = os.path.join(log_dir, f"survey_{start}_merged_running")
+    writer = SegmentedLog(running, start).start()
+    writer.manifest["agents"] = sorted(os.path.basename(d) for d in agent_dirs)
+    last = start
+    for record in heapq.merge(*(records(d) for d in agent_dirs), key=lambda r: r["epoch"]):
+        writer.write(record)
+        last = record["epoch"]
+    writer.close(timeout_s=None)
+    final = os.path.join(log_dir, f"survey_{start}_merged-{int(last)}")
+    writer.finalize(final, int(last))
+    return final, writer.records
+
+
+# --- Combined live view ---
+def format_view(collector, now=None):
+    now = now or time.time()
+    lines = [f"--- Survey Collector ({len(collector.agents)} agents, {collector.connections} connections) ---", ""]
+    lines.append(f"{'Agent':<16} {'Link':<5} {'Location':<18} {'SSID':<14} {'BSSID':<17} {'RSSI':>5} {'SNR':>4} "
+                 f"{'LAN ms':>7} {'Rx/Tx Mbps':>13} {'Records':>8} {'Lag s':>6}")
+    for st in sorted(collector.agents.values(), key=lambda s: s["agent"]):
+        r = st["last"] or {}
+        rx, tx = r.get("iperf_rx_mbps"), r.get("iperf_tx_mbps")
+        speed = f"{rx or 0:.0f}/{tx or 0:.0f}" if rx is not None or tx is not None else "-"
+        lines.append(f"{st['agent'][:16]:<16} {'up' if st['connected'] else 'down':<5} {str(r.get('location') or '-')[:18]:<18} "
+                     f"{str(r.get('ssid') or '-')[:14]:<14} {r.get('bssid') or '-':<17} {r.get('rssi_dbm') if r.get('rssi_dbm') is not None else '-':>5} "
+                     f"{r.get('snr') if r.get('snr') is not None else '-':>4} {r.get('icmp_lan_ms') if r.get('icmp_lan_ms') is not None else '-':>7} "
+                     f"{speed:>13} {st['records']:>8} {st['lag_s'] if st['lag_s'] is not None else '-':>6}")
+    lines += ["", "Latest records, all agents by time:"]
+    for epoch, agent, r in collector.recent[-10:]:
+        lines.append(f"  {time.strftime('%H:%M:%S', time.localtime(epoch))}  {agent[:16]:<16} {str(r.get('location') or '-')[:18]:<18} "
+                     f"RSSI {r.get('rssi_dbm')}  LAN {r.get('icmp_lan_ms')} ms")
+    lines.append("")
+    return lines
+
+
+async def run_collector(args):
+    collector = Collector(args.log_dir, args.token)
+    server = await collector.serve(args.bind, args.port)
+    print(f"Collecting on {args.bind}:{args.port}, agent logs in {collector.dir}/")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    view = None
+    if not args.no_view and sys.stdout.isatty():
+        from live_view import LiveView
+        view = LiveView("collector", prompt="")
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), 1.0)
+        except asyncio.TimeoutError:
+            pass
+        if view:
+            view.render_lines(format_view(collector))
+    server.close()
+    await server.wait_closed()
+    return collector
+
+
+if __name__ == "__main__":
+    # python3 collector.py [--port 9300]   |   collector.py send host:port <survey>   |   collector.py merge <collected dirs>
+    if len(sys.argv) >= 2 and sys.argv[1] == "send":
+        parser = argparse.ArgumentParser(prog="collector.py send", description="Stream a finished survey to a collector (backfill).")
+        parser.add_argument("address", help="collector host:port")
+        parser.add_argument("survey", help="survey directory or .jsonl")
+        parser.add_argument("--agent", default=socket.gethostname(), help="agent name (default: hostname)")
+        parser.add_argument("--token", default="")
+        args = parser.parse_args(sys.argv[2:])
+        session = read_manifest(args.survey).get("start_epoch") or int(os.path.basename(args.survey)[len("survey_"):].split("-")[0].split("_")[0])
+        agent = StreamAgent(parse_address(args.address), args.agent, session, token=args.token).start()
+        for seg in segment_paths(args.survey):
+            for record in iter_segment(seg):
+                if "event" not in record:
+                    agent.write(record)
+        agent.close(timeout_s=None)
+        st = agent.stats()
+        print(f"Sent {st['sent']} records" + (f", {st['pending']} not delivered ({st['last_error']})" if st["pending"] else ""))
+        sys.exit(1 if st["pending"] else 0)
+    if len(sys.argv) >= 2 and sys.argv[1] == "merge":
+        parser = argparse.ArgumentParser(prog="collector.py merge",
+                                         description="Merge agent logs by time, e.g. after a collector crash or restart.")
+        parser.add_argument("dirs", nargs="+", help="collected_<START> directories")
+        parser.add_argument("--log-dir", default="surveys", help="where the merged survey goes")
+        args = parser.parse_args(sys.argv[2:])
+        dirs = [p for d in args.dirs for p in sorted(os.path.join(d, a) for a in os.listdir(d)) if os.path.isdir(p)]
+        try:
+            final, n = merge_agent_logs(dirs, args.log_dir)
+        except OSError as e:
+            sys.exit(f"Merge failed: {e}")
+        print(f"-> Saved {final}/ ({n} records)" if final else "Nothing to merge")
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Collect survey records streamed by several wifi-survey.py agents.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--bind", default="0.0.0.0", help="address to listen on (default: all)")
+    parser.add_argument("--token", default="", help="shared secret agents must send (stream_token)")
+    parser.add_argument("--log-dir", default="surveys", help="where agent logs and the merged survey go")
+    parser.add_argument("--no-view", action="store_true", help="no live view, just collect")
+    args = parser.parse_args()
+
+    collector = asyncio.run(run_collector(args))
+    print("\n--- Collector Stopped ---")
+    for st in sorted(collector.agents.values(), key=lambda s: s["agent"]):
+        print(f"  {st['agent']} (survey {st['session']}): {st['records']} records, {st['connects']} connections, "
+              f"{st['bytes'] / 1e3:.0f} kB received" + (f", {st['missing']} missing" if st["missing"] else "")
+              + (f", from record {st['resumed_at']}" if st["resumed_at"] else ""))
+    if len(collector.agents) and any(st["resumed_at"] for st in collector.agents.values()):
+        print("Some agents started before this collector, merge with the earlier run: "
+              "python3 collector.py merge <collected dirs>")
+    final, n = merge_agent_logs(collector.close(), args.log_dir)
+    if final:
+        print(f"Merged survey saved to: {final}/ ({n} records from {len(collector.agents)} agents)")
+        print(f"Export it with: python3 convert_logs.py {final}")
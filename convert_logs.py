@@ -1,54 +1,403 @@
 #!/usr/bin/env python3
-import pandas as pd
-
 import sys
 import os
+import csv
 import json
+import time
+import queue
+import argparse
+import threading
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from survey_schema import FIELD_ORDER, field_type, coerce
+from survey_log import segment_paths, iter_segment, log_mtime, find_logs
+from rollup import TIERS, rollup_path
+
+BATCH_SIZE = 10000
+LIVE_FLUSH_S = 5.0  # Live exports are written at least this often during a survey
+XLSX_MAX_ROWS = 1048575  # Excel sheet limit minus header row
+
+
+# --- Reading ---
+def iter_batches(jsonl_path, batch_size=BATCH_SIZE):
+    # Stream the log in fixed-size batches, never holding more than one in memory.
+    # A segmented survey directory reads as its segments back to back, JSONL or binary.
+    batch = []
+    for record in chain.from_iterable(iter_segment(p) for p in segment_paths(jsonl_path)):
+        if "event" in record:
+            continue  # Metrics summaries and other non-sample lines
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def resolve_columns(first_batch, base=FIELD_ORDER):
+    # Schema columns first, then anything unknown seen in the first batch
+    columns = list(base)
+    for record in first_batch:
+        for key in record:
+            if key not in columns:
+                columns.append(key)
+    return columns
+
+
+def scan_columns(jsonl_path, base=FIELD_ORDER):
+    # First pass over the whole log: schema columns, then unknown ones in the order they show up.
+    # Columns that only start later (an app probe or ping target added mid-survey) aren't lost.
+    columns = list(base)
+    seen = set(columns)
+    for record in chain.from_iterable(iter_segment(p) for p in segment_paths(jsonl_path)):
+        if "event" in record or seen.issuperset(record):
+            continue
+        for key in record:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    return columns
+
+
+def to_rows(batch, columns):
+    types = [field_type(c) for c in columns]
+    return [[coerce(record.get(c), t) for c, t in zip(columns, types)] for record in batch]
+
+
+# --- Writers ---
+class CsvSink:
+    # Apple Numbers / Excel compatible CSV
+    def __init__(self, path, columns):
+        self.path = path
+        self.f = open(path, 'w', newline='', encoding='utf-8-sig')
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class XlsxSink:
+    # openpyxl write-only mode streams rows to disk instead of building cells in memory
+    def __init__(self, path, columns):
+        from openpyxl import Workbook
+        self.path = path
+        self.columns = columns
+        self.wb = Workbook(write_only=True)
+        self.sheet_rows = 0
+        self._new_sheet()
+
+    def _new_sheet(self):
+        n = len(self.wb.worksheets)
+        self.ws = self.wb.create_sheet("survey" if n == 0 else f"survey_{n + 1}")
+        self.ws.append(self.columns)
+        self.sheet_rows = 0
+
+    def write(self, rows):
+        for row in rows:
+            if self.sheet_rows >= XLSX_MAX_ROWS:
+                self._new_sheet()
+            self.ws.append(row)
+            self.sheet_rows += 1
+
+    def close(self):
+        self.wb.save(self.path)
+
+
+class ColumnarSink:
+    # Compressed columnar output (Parquet or Arrow IPC). Rows are buffered into row groups of
+    # row_group_rows, live exports hand over a few rows at a time and tiny groups bloat the footer.
+    ARROW_TYPES = {"int": "int64", "float": "float64", "str": "string"}
+
+    def __init__(self, path, columns, fmt="parquet", row_group_rows=BATCH_SIZE):
+        import pyarrow as pa
+        self.pa = pa
+        self.path = path
+        self.columns = columns
+        self.row_group_rows = row_group_rows
+        self.pending = []
+        self.schema = pa.schema([(c, getattr(pa, self.ARROW_TYPES[field_type(c)])()) for c in columns])
+        if fmt == "arrow":
+            self.writer = pa.ipc.new_file(path, self.schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+        else:
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, rows):
+        self.pending.extend(rows)
+        if len(self.pending) >= self.row_group_rows:
+            self._write_group()
+
+    def _write_group(self):
+        if not self.pending:
+            return
+        cols = list(zip(*self.pending))
+        arrays = [self.pa.array(list(col), type=field.type) for col, field in zip(cols, self.schema)]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+        self.pending = []
+
+    def close(self):
+        self._write_group()
+        self.writer.close()
+
+
+class JsonlSink:
+    # Plain JSON lines, for tools that want the text log of a binary survey
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        self.f = open(path, 'w')
+
+    def write(self, rows):
+        self.f.writelines(json.dumps(dict(zip(self.columns, row))) + "\n" for row in rows)
+
+    def close(self):
+        self.f.close()
 
-def convert_log(jsonl_path):
-    if not os.path.exists(jsonl_path):
-        print(f"Error: File {jsonl_path} not found.")
-        return
 
+COLUMNAR_EXT = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def output_paths(jsonl_path, columnar="parquet", jsonl=False):
+    base_name = os.path.splitext(jsonl_path)[0]
+    paths = {"csv": f"{base_name}.csv", "xlsx": f"{base_name}.xlsx"}
+    if columnar in COLUMNAR_EXT:
+        paths[columnar] = base_name + COLUMNAR_EXT[columnar]
+    if jsonl and f"{base_name}.jsonl" != jsonl_path:
+        paths["jsonl"] = f"{base_name}.jsonl"
+    return paths
+
+
+def open_sinks(paths, columns, row_group_rows=BATCH_SIZE):
+    sinks = [CsvSink(paths["csv"], columns)]
+    if "jsonl" in paths:
+        sinks.append(JsonlSink(paths["jsonl"], columns))
     try:
-        import pandas as pd
+        sinks.append(XlsxSink(paths["xlsx"], columns))
     except ImportError:
-        print("Error: pandas is not installed. Please run 'pip install pandas'")
-        return
+        print("Warning: openpyxl is not installed, skipping XLSX. Run 'pip install openpyxl'")
+    for fmt in COLUMNAR_EXT:
+        if fmt in paths:
+            try:
+                sinks.append(ColumnarSink(paths[fmt], columns, fmt, row_group_rows))
+            except ImportError:
+                print(f"Warning: pyarrow is not installed, skipping {fmt}. Run 'pip install pyarrow'")
+    return sinks
+
+
+def close_sinks(sinks):
+    # Close every sink even if one fails, a half-written export still gets its XLSX saved and Parquet footer
+    error = None
+    for sink in sinks:
+        try:
+            sink.close()
+        except Exception as e:
+            error = error or e
+    if error:
+        raise error
+
+
+# --- Conversion ---
+def convert_rollups(survey_dir, batch_size=BATCH_SIZE, columnar="parquet"):
+    # 1 m / 1 h rollups (rollup.py) of a survey directory, saved next to it as <survey>_rollup_1m.csv ...
+    converted = False
+    for tier in TIERS:
+        path = rollup_path(survey_dir, tier)
+        if not os.path.exists(path):
+            continue
+        batches = iter_batches(path, batch_size)
+        first = next(batches, None)
+        if first is None:
+            continue
+        columns = resolve_columns(first, base=())  # Every row of a tier has the same columns
+        sinks = open_sinks(output_paths(f"{survey_dir.rstrip(os.sep)}_rollup_{tier}", columnar), columns)
+        count = 0
+        try:
+            for batch in chain([first], batches):
+                rows = to_rows(batch, columns)
+                for sink in sinks:
+                    sink.write(rows)
+                count += len(rows)
+        finally:
+            close_sinks(sinks)
+        for sink in sinks:
+            print(f"-> Saved {sink.path}")
+        print(f"{count} {tier} rollup rows converted.")
+        converted = True
+    return converted
+
+
+def convert_log(jsonl_path, batch_size=BATCH_SIZE, columnar="parquet", jsonl=False, rollups="also"):
+    # rollups: "also" exports a survey directory's rollups too, "only" just them, "no" skips them
+    if not os.path.exists(jsonl_path):
+        print(f"Error: File {jsonl_path} not found.")
+        return False
+    if rollups == "only":
+        print(f"Converting rollups of {jsonl_path}...")
+        try:
+            if not convert_rollups(jsonl_path, batch_size, columnar):
+                print("No rollups found.")
+                return False
+            return True
+        except Exception as e:
+            print(f"Conversion failed: {e}")
+            return False
 
     print(f"Converting {jsonl_path}...")
 
     try:
-        # Read JSONL
-        data = []
-        with open(jsonl_path, 'r') as f:
-            for line in f:
-                if line.strip(): data.append(json.loads(line))
-        
-        if not data:
+        batches = iter_batches(jsonl_path, batch_size)
+        first = next(batches, None)
+        if first is None:
             print("Log file is empty.")
-            return
+            return False
+
+        columns = scan_columns(jsonl_path)
+        paths = output_paths(jsonl_path, columnar, jsonl)
+        sinks = open_sinks(paths, columns)
+
+        count = 0
+        try:
+            for batch in chain([first], batches):
+                rows = to_rows(batch, columns)
+                for sink in sinks:
+                    sink.write(rows)
+                count += len(rows)
+        finally:
+            close_sinks(sinks)
+
+        for sink in sinks:
+            print(f"-> Saved {sink.path}")
+        print(f"{count} records converted.")
+        if rollups == "also" and os.path.isdir(jsonl_path):
+            convert_rollups(jsonl_path, batch_size, columnar)
+        return True
 
-        df = pd.DataFrame(data)
-        
-        # Base filename
-        base_name = os.path.splitext(jsonl_path)[0]
-        
-        # Apple Numbers / Excel compatible CSV
-        csv_path = f"{base_name}.csv"
-        df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-        print(f"-> Saved {csv_path}")
-        
-        # Excel
-        xlsx_path = f"{base_name}.xlsx"
-        df.to_excel(xlsx_path, index=False)
-        print(f"-> Saved {xlsx_path}")
-        
     except Exception as e:
         print(f"Conversion failed: {e}")
+        return False
+
+
+# --- Live export ---
+_STOP = object()
+
+
+class LiveExporter:
+    """Keeps the exports of a running survey up to date from a background thread, so stopping only closes them."""
+
+    def __init__(self, jsonl_path, columns, columnar="parquet", flush_s=LIVE_FLUSH_S, batch_size=BATCH_SIZE):
+        self.paths = output_paths(jsonl_path, columnar)
+        self.columns = columns
+        self.columnar = columnar
+        self.flush_s = flush_s
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.sinks = []
+        self.rows = 0
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="exporter", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def add(self, record):
+        self.queue.put(record)
+
+    def _run(self):
+        try:
+            # Opened here, so the openpyxl/pyarrow imports don't hold up the survey start
+            self.sinks = open_sinks(self.paths, self.columns, self.batch_size)
+            batch = []
+            next_flush = time.monotonic() + self.flush_s
+            try:
+                while True:
+                    try:
+                        item = self.queue.get(timeout=self.flush_s)
+                    except queue.Empty:
+                        item = None
+                    if item is not None and item is not _STOP:
+                        batch.append(item)
+                    if batch and (item is _STOP or len(batch) >= self.batch_size or time.monotonic() >= next_flush):
+                        rows = to_rows(batch, self.columns)
+                        for sink in self.sinks:
+                            sink.write(rows)
+                        self.rows += len(rows)
+                        batch = []
+                        next_flush = time.monotonic() + self.flush_s
+                    if item is _STOP:
+                        break
+            finally:
+                close_sinks(self.sinks)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+    def finish(self, final_jsonl_path=None, timeout_s=10.0):
+        # Write what's queued, close the files (XLSX save, Parquet footer) and give them the log's final name.
+        # Returns the saved paths, or None if it didn't finish in time or failed.
+        self.queue.put(_STOP)
+        self._thread.join(timeout_s)
+        if self._thread.is_alive() or self.error:
+            return None
+        saved = []
+        final = output_paths(final_jsonl_path, self.columnar) if final_jsonl_path else self.paths
+        for sink in self.sinks:
+            key = next(k for k, p in self.paths.items() if p == sink.path)
+            os.replace(sink.path, final[key])
+            saved.append(final[key])
+        return saved
+
+
+def is_up_to_date(jsonl_path, columnar="parquet", jsonl=False):
+    src_mtime = log_mtime(jsonl_path)
+    for path in output_paths(jsonl_path, columnar, jsonl).values():
+        if not os.path.exists(path) or os.path.getmtime(path) < src_mtime:
+            return False
+    return True
+
+
+def convert_batch(log_dir, jobs=None, columnar="parquet", force=False, jsonl=False, rollups="also"):
+    # Running surveys are still being written, leave them alone
+    logs = find_logs(log_dir)
+    todo = [p for p in logs if force or not is_up_to_date(p, columnar, jsonl)]
+    print(f"{len(logs)} surveys found, {len(logs) - len(todo)} up to date, {len(todo)} to convert.")
+    if not todo:
+        return True
+
+    ok = True
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(convert_log, p, BATCH_SIZE, columnar, jsonl, rollups): p for p in todo}
+        for future in as_completed(futures):
+            try:
+                ok = future.result() and ok
+            except Exception as e:
+                print(f"Conversion of {futures[future]} failed: {e}")
+                ok = False
+    return ok
+
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python3 convert_logs.py <path_to_jsonl>")
+    parser = argparse.ArgumentParser(description="Convert survey JSONL logs to CSV, XLSX and Parquet/Arrow.")
+    parser.add_argument("path", nargs="?", help="path to a survey directory or .jsonl file")
+    parser.add_argument("--batch", metavar="DIR", help="convert every finished survey in DIR in parallel")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes for --batch (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="with --batch, also convert up-to-date surveys")
+    parser.add_argument("--columnar", choices=["parquet", "arrow", "none"], default="parquet",
+                        help="columnar output format (default: parquet)")
+    parser.add_argument("--jsonl", action="store_true", help="also export JSON lines (for binary survey logs)")
+    parser.add_argument("--rollups", choices=["also", "only", "no"], default="also",
+                        help="1 m / 1 h rollups of survey directories: with the records (default), only them, or not")
+    args = parser.parse_args()
+
+    if args.batch:
+        sys.exit(0 if convert_batch(args.batch, args.jobs, args.columnar, args.force, args.jsonl, args.rollups) else 1)
+    elif args.path:
+        convert_log(args.path, columnar=args.columnar, jsonl=args.jsonl, rollups=args.rollups)
     else:
-        convert_log(sys.argv[1])
+        print("Usage: python3 convert_logs.py <survey dir or .jsonl>")
+        print("       python3 convert_logs.py --batch <dir>")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# Floorplan coordinates for survey locations.
+#
+# A floorplan file maps location names to (x, y) in any unit (meters, feet, image pixels):
+#   floorplan.json   {"Reception": [2.5, 14], "Kitchen": [11, 3.5], ...}
+#   floorplan.csv    name,x,y rows (a header line is skipped)
+# At the location prompt any of these work:
+#   Kitchen            looked up in the floorplan, no coordinates if it isn't there
+#   11, 3.5            a bare point, the text is kept as the location name
+#   Kitchen @ 11, 3.5  name plus point, the point is remembered for the rest of the survey
+import re
+import csv
+import sys
+import json
+
+_POINT = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*[,; ]\s*(-?\d+(?:\.\d+)?)\s*$")
+
+
+def load_floorplan(path):
+    # {name: (x, y)}, names matched case-insensitively later
+    if path.lower().endswith(".csv"):
+        points = {}
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for row in csv.reader(f):
+                if len(row) < 3:
+                    continue
+                try:
+                    points[row[0].strip()] = (float(row[1]), float(row[2]))
+                except ValueError:
+                    continue  # Header or a broken row
+        return points
+    with open(path) as f:
+        data = json.load(f)
+    return {str(name): (float(xy[0]), float(xy[1])) for name, xy in data.items()}
+
+
+def parse_point(text):
+    m = _POINT.match(text)
+    return (float(m.group(1)), float(m.group(2))) if m else None
+
+
+class Floorplan:
+    def __init__(self, points=None):
+        self.points = {}
+        for name, xy in (points or {}).items():
+            self.add(name, xy)
+
+    def add(self, name, xy):
+        self.points[name.strip().casefold()] = xy
+
+    def lookup(self, name):
+        return self.points.get(name.strip().casefold())
+
+    def resolve(self, text):
+        # Prompt text -> (location name, x, y), x and y None when the location has no coordinates
+        text = text.strip()
+        if "@" in text:
+            name, _, point = text.rpartition("@")
+            xy = parse_point(point)
+            if xy and name.strip():
+                self.add(name, xy)
+                return name.strip(), xy[0], xy[1]
+        xy = parse_point(text) or self.lookup(text)
+        return text, (xy[0] if xy else None), (xy[1] if xy else None)
+
+
+if __name__ == "__main__":
+    # python3 floorplan.py <floorplan.json|csv>   ->   the parsed points
+    if len(sys.argv) != 2:
+        sys.exit("usage: floorplan.py <floorplan.json|csv>")
+    for name, (x, y) in sorted(load_floorplan(sys.argv[1]).items()):
+        print(f"{name}: {x:g}, {y:g}")
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+# Coverage heatmaps: interpolate RSSI, SNR, ping and iperf from located samples onto a floorplan grid.
+#
+# Samples need coordinates, either logged (x/y from the location prompt, see floorplan.py) or
+# looked up from a floorplan file by location name for older surveys. Samples at the same point
+# are merged first, then every grid cell is interpolated from its k nearest points:
+#   idw      inverse-distance weighting, weights 1/d^power
+#   kriging  ordinary kriging on a fitted exponential variogram, solved per cell over the same neighbors
+# The neighbor search goes tile by tile through a spatial index (scipy's cKDTree if installed,
+# a bucket grid otherwise), so millions of cells and tens of thousands of points take seconds.
+# Each metric is written as <metric>.npy, <metric>.csv and <metric>.png, plus grid.json.
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import argparse
+
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError:
+    sys.exit("pandas and numpy are needed for heatmaps. Run 'pip install -r requirements.txt'")
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None  # Bucket grid index instead, same results
+
+from analyze import load_surveys, prepare
+from floorplan import Floorplan, load_floorplan
+
+METRICS = ["rssi_dbm", "snr", "icmp_lan_ms", "icmp_wan_ms", "iperf_rx_mbps", "iperf_tx_mbps"]
+LOWER_IS_BETTER = ("_ms", "_lost")
+TILE = 64           # Grid cells per tile side, one neighbor query per tile
+MAX_CELLS = 50_000_000
+
+# Red -> yellow -> green, worst to best
+RAMP = np.array([[215, 48, 39], [252, 141, 89], [254, 224, 139], [217, 239, 139], [145, 207, 96], [26, 152, 80]],
+                dtype=np.float64)
+BLANK_RGB = (230, 230, 230)
+POINT_RGB = (20, 20, 20)
+
+
+# --- Spatial index ---
+class SpatialIndex:
+    """k-nearest-neighbor queries over 2D points, cKDTree if available, else a bucket grid."""
+
+    def __init__(self, points, k):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.n = len(self.points)
+        self.tree = cKDTree(self.points) if cKDTree is not None else None
+        if self.tree is None:
+            self._build_buckets(k)
+
+    def _build_buckets(self, k):
+        # Buckets sized for about k points each, points sorted by bucket so a bucket row is one slice
+        lo, hi = self.points.min(axis=0), self.points.max(axis=0)
+        extent = np.maximum(hi - lo, 1e-9)
+        self.size = max(float(np.sqrt(extent[0] * extent[1] * k / max(self.n, 1))), float(extent.max()) / 4096, 1e-9)
+        self.lo, self.hi = lo, hi
+        self.nb = (extent // self.size).astype(np.int64) + 1
+        ix, iy = self._bucket(self.points)
+        key = iy * self.nb[0] + ix
+        self.order = np.argsort(key, kind="stable")
+        self.keys = key[self.order]
+
+    def _bucket(self, xy):
+        b = np.floor((xy - self.lo) / self.size).astype(np.int64)
+        return np.clip(b[:, 0], 0, self.nb[0] - 1), np.clip(b[:, 1], 0, self.nb[1] - 1)
+
+    def _candidates(self, lo, hi):
+        # Indexes of the points in the buckets overlapping [lo, hi]
+        (x0, x1), (y0, y1) = [np.clip(np.floor((np.array(v) - self.lo[i]) / self.size).astype(np.int64), 0, self.nb[i] - 1)
+                              for i, v in enumerate(((lo[0], hi[0]), (lo[1], hi[1])))]
+        rows = np.arange(y0, y1 + 1) * self.nb[0]
+        starts = np.searchsorted(self.keys, rows + x0, "left")
+        ends = np.searchsorted(self.keys, rows + x1, "right")
+        if not len(starts):
+            return np.empty(0, dtype=np.int64)
+        return self.order[np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])]
+
+    def query(self, queries, k, max_dist=None):
+        # (dist, idx) of shape (len(queries), k), nearest first. Missing neighbors: dist inf, idx -1.
+        k = min(k, self.n)
+        if self.tree is not None:
+            dist, idx = self.tree.query(queries, k, distance_upper_bound=max_dist or np.inf)
+            dist, idx = dist.reshape(len(queries), k), idx.reshape(len(queries), k)
+            idx = np.where(np.isfinite(dist), idx, -1)
+            return dist, idx
+        # Grow the search box around the query batch until every query's k-th neighbor is inside it.
+        # A point outside the box is further than r from every query, so the result is exact.
+        lo, hi = queries.min(axis=0), queries.max(axis=0)
+        r = self.size
+        full = float(np.hypot(*(np.maximum(hi, self.hi) - np.minimum(lo, self.lo))))
+        while True:
+            cand = self._candidates(lo - r, hi + r)
+            if len(cand) >= k:
+                px, py = self.points[cand, 0], self.points[cand, 1]
+                d2 = (queries[:, None, 0] - px) ** 2 + (queries[:, None, 1] - py) ** 2  # Squared, sqrt only for the k kept
+                part = np.argpartition(d2, k - 1, axis=1)[:, :k] if len(cand) > k else np.broadcast_to(np.arange(len(cand)), (len(queries), k))
+                dist = np.take_along_axis(d2, part, axis=1)
+                if dist.max() <= r * r or r >= full or (max_dist is not None and r >= max_dist):
+                    order = np.argsort(dist, axis=1)
+                    dist = np.sqrt(np.take_along_axis(dist, order, axis=1))
+                    idx = cand[np.take_along_axis(part, order, axis=1)]
+                    if max_dist is not None:
+                        far = dist > max_dist
+                        dist[far], idx[far] = np.inf, -1
+                    return dist, idx
+            elif r >= full:
+                break
+            r *= 2
+        return np.full((len(queries), k), np.inf), np.full((len(queries), k), -1)
+
+
+# --- Interpolation ---
+def idw(dist, idx, values, power=2.0):
+    # Per row: weighted mean of the neighbor values, a neighbor at distance 0 wins outright
+    valid = idx >= 0
+    v = values[np.where(valid, idx, 0)]
+    with np.errstate(divide="ignore"):
+        w = np.where(valid, 1.0 / dist ** power, 0.0)
+    exact = valid & (dist == 0)
+    hit = exact.any(axis=1)
+    w[hit] = exact[hit]
+    total = w.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = (w * v).sum(axis=1) / total
+    out[total == 0] = np.nan
+    return out
+
+
+def exponential(h, nugget, psill, rng):
+    return np.where(h > 0, nugget + psill * (1 - np.exp(-3 * h / rng)), 0.0)
+
+
+def fit_variogram(points, values, bins=15, max_pairs_points=2000, seed=0):
+    # Empirical semivariogram over point pairs, then least squares for nugget and partial sill per candidate range
+    if len(points) > max_pairs_points:
+        pick = np.random.default_rng(seed).choice(len(points), max_pairs_points, replace=False)
+        points, values = points[pick], values[pick]
+    i, j = np.triu_indices(len(points), 1)
+    h = np.hypot(*(points[i] - points[j]).T)
+    g = 0.5 * (values[i] - values[j]) ** 2
+    if not len(h) or h.max() == 0:
+        return 0.0, float(np.var(values)) or 1.0, 1.0
+    edges = np.linspace(0, h.max() / 2, bins + 1)
+    which = np.digitize(h, edges) - 1
+    keep = (which >= 0) & (which < bins)
+    counts = np.bincount(which[keep], minlength=bins)
+    sums = np.bincount(which[keep], g[keep], minlength=bins)
+    ok = counts > 0
+    lag, gamma, weight = ((edges[:-1] + edges[1:]) / 2)[ok], sums[ok] / counts[ok], counts[ok]
+    best = None
+    for rng in np.linspace(edges[1], edges[-1] * 2, 40):
+        basis = 1 - np.exp(-3 * lag / rng)
+        a = np.stack([np.ones_like(lag), basis], axis=1) * np.sqrt(weight)[:, None]
+        coef, *_ = np.linalg.lstsq(a, gamma * np.sqrt(weight), rcond=None)
+        nugget, psill = max(coef[0], 0.0), max(coef[1], 1e-9)
+        err = float((weight * (nugget + psill * basis - gamma) ** 2).sum())
+        if best is None or err < best[0]:
+            best = (err, nugget, psill, rng)
+    return best[1], best[2], best[3]
+
+
+def kriging(dist, idx, points, values, model):
+    # Ordinary kriging per row over its neighbors, all rows solved as one batch of small systems
+    nugget, psill, rng = model
+    valid = idx >= 0
+    safe = np.where(valid, idx, 0)
+    p = points[safe]                                            # (n, k, 2)
+    h = np.hypot(p[:, :, None, 0] - p[:, None, :, 0], p[:, :, None, 1] - p[:, None, :, 1])
+    n, k = idx.shape
+    a = np.ones((n, k + 1, k + 1))
+    a[:, :k, :k] = exponential(h, nugget, psill, rng)
+    a[:, k, k] = 0.0
+    b = np.ones((n, k + 1))
+    b[:, :k] = exponential(np.where(valid, dist, 0.0), nugget, psill, rng)
+    # Missing neighbors get an identity row/column and a 0 right-hand side, so weight 0
+    missing = ~valid
+    rows, cols = np.nonzero(missing)
+    a[rows, cols, :] = 0.0
+    a[rows, :, cols] = 0.0
+    a[rows, cols, cols] = 1.0
+    b[rows, cols] = 0.0
+    a[:, :k, :k] += np.eye(k) * 1e-9 * (psill + nugget)  # Duplicate-ish points would make it singular
+    try:
+        w = np.linalg.solve(a, b[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        w = (np.linalg.pinv(a) @ b[..., None])[..., 0]
+    out = (w[:, :k] * values[safe] * valid).sum(axis=1)
+    # A cell on a sample point takes its value, the nugget would otherwise smooth it
+    exact = valid & (dist == 0)
+    hit = exact.any(axis=1)
+    out[hit] = values[safe[hit, exact[hit].argmax(axis=1)]]
+    out[~valid.any(axis=1)] = np.nan
+    return out
+
+
+class Grid:
+    def __init__(self, x0, y0, cell, nx, ny):
+        self.x0, self.y0, self.cell, self.nx, self.ny = x0, y0, cell, nx, ny
+
+    @classmethod
+    def around(cls, points, cell=None, margin=None, bounds=None, cells=250_000):
+        # Sample bounding box plus a margin, cell size from the requested cell count if not given
+        if bounds:
+            x0, y0, x1, y1 = bounds
+        else:
+            (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+            pad = margin if margin is not None else 0.05 * max(x1 - x0, y1 - y0, 1e-9)
+            x0, y0, x1, y1 = x0 - pad, y0 - pad, x1 + pad, y1 + pad
+        w, h = max(x1 - x0, 1e-9), max(y1 - y0, 1e-9)
+        cell = cell or float(np.sqrt(w * h / cells))
+        nx, ny = int(np.ceil(w / cell)), int(np.ceil(h / cell))
+        if nx * ny > MAX_CELLS:
+            raise ValueError(f"{nx} x {ny} cells is more than {MAX_CELLS}, use a larger cell size")
+        return cls(x0, y0, cell, nx, ny)
+
+    def xs(self):
+        return self.x0 + (np.arange(self.nx) + 0.5) * self.cell
+
+    def ys(self):
+        return self.y0 + (np.arange(self.ny) + 0.5) * self.cell
+
+    def tiles(self, tile=TILE):
+        # (row slice, col slice, cell centers) per tile, row 0 is the lowest y
+        xs, ys = self.xs(), self.ys()
+        for r in range(0, self.ny, tile):
+            for c in range(0, self.nx, tile):
+                gx, gy = np.meshgrid(xs[c:c + tile], ys[r:r + tile])
+                yield slice(r, r + tile), slice(c, c + tile), np.column_stack([gx.ravel(), gy.ravel()])
+
+    def to_json(self):
+        return {"x0": self.x0, "y0": self.y0, "cell": self.cell, "nx": self.nx, "ny": self.ny}
+
+
+def interpolate(grid, points, values, method="idw", k=12, power=2.0, max_dist=None):
+    index = SpatialIndex(points, k)
+    model = fit_variogram(points, values) if method == "kriging" else None
+    out = np.full((grid.ny, grid.nx), np.nan, dtype=np.float32)
+    # Without a tree the cost per cell grows with the tile's candidate box, keep tiles about a bucket wide
+    tile = TILE if index.tree is not None else int(np.clip(index.size / grid.cell, 8, TILE))
+    for rows, cols, queries in grid.tiles(tile):
+        dist, idx = index.query(queries, k, max_dist)
+        if method == "kriging":
+            res = kriging(dist, idx, points, values, model)
+        else:
+            res = idw(dist, idx, values, power)
+        out[rows, cols] = res.reshape(out[rows, cols].shape)
+    return out, model
+
+
+# --- Samples ---
+def located_samples(df, floorplan=None):
+    # x/y as logged, missing ones from the floorplan by location name
+    for col in ("x", "y"):
+        if col not in df.columns:
+            df[col] = np.nan
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    if floorplan:
+        missing = df["x"].isna() | df["y"].isna()
+        names = df.loc[missing, "location"].astype("string").fillna("")
+        xy = {name: floorplan.lookup(name) for name in names.unique()}
+        df.loc[missing, "x"] = names.map(lambda n: xy[n][0] if xy[n] else np.nan).astype("float64")
+        df.loc[missing, "y"] = names.map(lambda n: xy[n][1] if xy[n] else np.nan).astype("float64")
+    return df.dropna(subset=["x", "y"])
+
+
+def point_values(df, metric, agg="median"):
+    # One value per distinct point, so a spot surveyed for ten minutes doesn't outweigh its neighbors
+    sub = df.loc[df[metric].notna(), ["x", "y", metric]]
+    if sub.empty:
+        return np.empty((0, 2)), np.empty(0)
+    per_point = sub.groupby(["x", "y"], sort=False)[metric].agg(agg)
+    points = np.array(per_point.index.tolist(), dtype=np.float64)
+    return points, per_point.to_numpy(dtype=np.float64)
+
+
+# --- Output ---
+def colorize(grid, lower_is_better=False, lo=None, hi=None):
+    lo = np.nanmin(grid) if lo is None else lo
+    hi = np.nanmax(grid) if hi is None else hi
+    t = (grid - lo) / (hi - lo) if hi > lo else np.full(grid.shape, 0.5)
+    t = np.clip(np.nan_to_num(t, nan=0.0), 0, 1)
+    if lower_is_better:
+        t = 1 - t
+    pos = t * (len(RAMP) - 1)
+    i = np.minimum(pos.astype(np.int64), len(RAMP) - 2)
+    f = (pos - i)[..., None]
+    rgb = (RAMP[i] * (1 - f) + RAMP[i + 1] * f).astype(np.uint8)
+    rgb[np.isnan(grid)] = BLANK_RGB
+    return rgb
+
+
+def write_png(path, rgb):
+    # 8-bit RGB PNG with zlib only, no imaging library needed
+    h, w, _ = rgb.shape
+    raw = np.hstack([np.zeros((h, 1), dtype=np.uint8), rgb.reshape(h, w * 3)]).tobytes()
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0)) +
+                chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b""))
+
+
+def render(values, grid, points, lower_is_better=False, scale=1, y_down=False):
+    rgb = colorize(values, lower_is_better)
+    if scale > 1:
+        rgb = rgb.repeat(scale, axis=0).repeat(scale, axis=1)
+    # Sample points as 5 px dots
+    h, w, _ = rgb.shape
+    px = ((points[:, 0] - grid.x0) / grid.cell * scale).astype(np.int64)
+    py = ((points[:, 1] - grid.y0) / grid.cell * scale).astype(np.int64)
+    for dx in range(-2, 3):
+        for dy in range(-2, 3):
+            x, y = px + dx, py + dy
+            inside = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+            rgb[y[inside], x[inside]] = POINT_RGB
+    return rgb if y_down else rgb[::-1]  # Image rows go down, y goes up unless the floorplan is in pixels
+
+
+def write_csv(path, values, grid):
+    # Matrix layout: first row the x of each column, first column the y of each row
+    with open(path, "w", encoding="utf-8-sig") as f:
+        f.write("y\\x," + ",".join(f"{x:g}" for x in grid.xs()) + "\n")
+        for y, row in zip(grid.ys(), values):
+            f.write(f"{y:g}," + ",".join("" if v != v else f"{v:.2f}" for v in row.tolist()) + "\n")
+
+
+def auto_scale(grid, target_px=800):
+    return max(1, target_px // max(grid.nx, grid.ny))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Interpolate survey metrics onto a floorplan grid.")
+    parser.add_argument("paths", nargs="+", help="surveys (directories or .jsonl files) or directories of them")
+    parser.add_argument("--metrics", nargs="+", default=METRICS, help=f"columns to map (default: {' '.join(METRICS)})")
+    parser.add_argument("--floorplan", metavar="FILE", help="location name -> x, y mapping (.json or .csv) for samples without x/y")
+    parser.add_argument("--method", choices=("idw", "kriging"), default="idw")
+    parser.add_argument("--neighbors", type=int, default=12, help="points used per cell (default: 12)")
+    parser.add_argument("--power", type=float, default=2.0, help="IDW distance power (default: 2)")
+    parser.add_argument("--cell", type=float, help="cell size in floorplan units (default: about 250k cells)")
+    parser.add_argument("--max-dist", type=float, help="leave cells further than this from every sample blank")
+    parser.add_argument("--bounds", type=float, nargs=4, metavar=("X0", "Y0", "X1", "Y1"), help="grid extent (default: samples + 5%%)")
+    parser.add_argument("--ssid", help="only samples connected to this SSID")
+    parser.add_argument("--band", help="only samples on this band, e.g. 5GHz")
+    parser.add_argument("--agg", choices=("median", "mean", "max", "min"), default="median", help="merge of samples at one point")
+    parser.add_argument("--scale", type=int, help="image pixels per cell (default: about 800 px wide)")
+    parser.add_argument("--y-down", action="store_true", help="y grows downwards (floorplan in image pixels)")
+    parser.add_argument("--out", metavar="DIR", default="heatmap", help="output directory (default: heatmap)")
+    parser.add_argument("--no-cache", action="store_true", help="don't use the analyze.py index")
+    args = parser.parse_args()
+
+    df, _ = load_surveys(args.paths, use_cache=not args.no_cache)
+    floorplan = Floorplan(load_floorplan(args.floorplan)) if args.floorplan else None
+    df = located_samples(prepare(df), floorplan)
+    if args.ssid:
+        df = df[df["ssid"] == args.ssid]
+    if args.band:
+        df = df[df["channel_band"] == args.band]
+    if df.empty:
+        sys.exit("No samples with coordinates. Type 'name @ x, y' at the location prompt, or pass --floorplan")
+
+    started = time.perf_counter()
+    all_points = df[["x", "y"]].drop_duplicates().to_numpy(dtype=np.float64)
+    try:
+        grid = Grid.around(all_points, args.cell, bounds=args.bounds)
+    except ValueError as e:
+        sys.exit(str(e))
+    scale = args.scale or auto_scale(grid)
+    os.makedirs(args.out, exist_ok=True)
+    summary = {"grid": grid.to_json(), "method": args.method, "neighbors": args.neighbors, "metrics": {}}
+    print(f"{len(df)} samples at {len(all_points)} points, grid {grid.nx} x {grid.ny} cells of {grid.cell:g}")
+    for metric in args.metrics:
+        if metric not in df.columns:
+            print(f"  {metric}: not in the logs, skipped")
+            continue
+        points, values = point_values(df, metric, args.agg)
+        if not len(points):
+            print(f"  {metric}: no samples, skipped")
+            continue
+        t0 = time.perf_counter()
+        surface, model = interpolate(grid, points, values, args.method, args.neighbors, args.power, args.max_dist)
+        np.save(os.path.join(args.out, f"{metric}.npy"), surface)
+        write_csv(os.path.join(args.out, f"{metric}.csv"), surface, grid)
+        write_png(os.path.join(args.out, f"{metric}.png"),
+                  render(surface, grid, points, metric.endswith(LOWER_IS_BETTER), scale, args.y_down))
+        summary["metrics"][metric] = {"points": len(points), "min": float(np.nanmin(surface)) if np.isfinite(surface).any() else None,
+                                      "max": float(np.nanmax(surface)) if np.isfinite(surface).any() else None,
+                                      "variogram": dict(zip(("nugget", "psill", "range"), map(float, model))) if model else None}
+        print(f"  {metric}: {len(points)} points, {np.nanmin(surface):.2f}..{np.nanmax(surface):.2f} "
+              f"({time.perf_counter() - t0:.2f}s)")
+    with open(os.path.join(args.out, "grid.json"), "w") as f:
+        json.dump(summary, f, indent=1)
+    print(f"-> Saved {args.out}/ ({time.perf_counter() - started:.1f}s)")
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# In-process ICMP echo prober, many targets multiplexed on one asyncio loop.
+#
+# Uses unprivileged ICMP datagram sockets where the OS allows them (macOS, Linux with
+# net.ipv4.ping_group_range set) and falls back to a raw socket (root) otherwise.
+import os
+import sys
+import time
+import socket
+import struct
+import asyncio
+import argparse
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+PAYLOAD = b"wifi-survey-icmp"
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo(ident, seq):
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum(header + PAYLOAD), ident, seq) + PAYLOAD
+
+
+def parse_echo_reply(packet):
+    # Raw sockets (and datagram sockets on macOS) hand us the IP header too
+    if len(packet) >= 20 and packet[0] >> 4 == 4:
+        packet = packet[(packet[0] & 0x0F) * 4:]
+    if len(packet) < 8:
+        return None
+    icmp_type, _code, _csum, ident, seq = struct.unpack("!BBHHH", packet[:8])
+    if icmp_type != ICMP_ECHO_REPLY:
+        return None
+    return ident, seq
+
+
+def open_icmp_socket():
+    try:
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP), False
+    except (PermissionError, OSError):
+        return socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP), True
+
+
+# --- Statistics ---
+def percentile(sorted_vals, pct):
+    if not sorted_vals:
+        return None
+    k = (len(sorted_vals) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+def ping_stats(rtts, sent):
+    # rtts: per-packet round trip times in ms, in send order (lost packets omitted)
+    lost = 100.0 * (sent - len(rtts)) / sent if sent else 100.0
+    if not rtts:
+        return {"min": None, "avg": None, "p95": None, "max": None, "jitter": None, "lost": round(lost, 1)}
+    ordered = sorted(rtts)
+    # Mean absolute difference between consecutive packets (RFC 3550 style, unsmoothed)
+    jitter = sum(abs(b - a) for a, b in zip(rtts, rtts[1:])) / (len(rtts) - 1) if len(rtts) > 1 else 0.0
+    return {
+        "min": round(ordered[0], 2),
+        "avg": round(sum(rtts) / len(rtts), 2),
+        "p95": round(percentile(ordered, 95), 2),
+        "max": round(ordered[-1], 2),
+        "jitter": round(jitter, 2),
+        "lost": round(lost, 1),
+    }
+
+
+class PingResult:
+    __slots__ = ("target", "address", "sent", "rtts", "error")
+
+    def __init__(self, target, address=None, sent=0, rtts=None, error=None):
+        self.target = target
+        self.address = address
+        self.sent = sent
+        self.rtts = rtts if rtts is not None else []
+        self.error = error
+
+    def stats(self):
+        return ping_stats(self.rtts, self.sent)
+
+
+# --- Engine ---
+class IcmpEngine:
+    def __init__(self, spacing_s=0.1, timeout_s=1.0):
+        self.spacing_s = spacing_s
+        self.timeout_s = timeout_s
+        self.sock = None
+        self.is_raw = False
+        self.ident = os.getpid() & 0xFFFF
+        self.seq = 0
+        self.pending = {}  # seq -> (address, send_ns, future)
+        self.on_reply = None  # optional callback(address, rtt_ms) for every reply received
+        self._loop = None
+
+    def open(self):
+        if self.sock is None:
+            self.sock, self.is_raw = open_icmp_socket()
+            self.sock.setblocking(False)
+            self._loop = asyncio.get_running_loop()
+            self._loop.add_reader(self.sock.fileno(), self._on_readable)
+
+    def close(self):
+        if self.sock is not None:
+            self._loop.remove_reader(self.sock.fileno())
+            self.sock.close()
+            self.sock = None
+        for _addr, _sent, fut in self.pending.values():
+            if not fut.done():
+                fut.cancel()
+        self.pending.clear()
+
+    def _on_readable(self):
+        recv_ns = time.monotonic_ns()
+        while True:
+            try:
+                packet, (src, _port) = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            parsed = parse_echo_reply(packet)
+            if parsed is None:
+                continue
+            ident, seq = parsed
+            # Datagram sockets get their id rewritten by the kernel, only raw sockets see everyone's replies
+            if self.is_raw and ident != self.ident:
+                continue
+            entry = self.pending.get(seq)
+            if entry is None or entry[0] != src:
+                continue
+            del self.pending[seq]
+            rtt_ms = (recv_ns - entry[1]) / 1e6
+            if not entry[2].done():
+                entry[2].set_result(rtt_ms)
+            if self.on_reply:
+                self.on_reply(src, rtt_ms)
+
+    def _next_seq(self):
+        self.seq = (self.seq + 1) & 0xFFFF
+        while self.seq in self.pending:
+            self.seq = (self.seq + 1) & 0xFFFF
+        return self.seq
+
+    async def resolve(self, target):
+        infos = await asyncio.get_running_loop().getaddrinfo(target, None, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        return infos[0][4][0]
+
+    async def probe(self, target, count=4):
+        self.open()
+        result = PingResult(target)
+        try:
+            address = await self.resolve(target)
+        except OSError as e:
+            result.error = f"resolve: {e}"
+            return result
+        result.address = address
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for i in range(count):
+            if i:
+                await asyncio.sleep(self.spacing_s)
+            seq = self._next_seq()
+            fut = loop.create_future()
+            self.pending[seq] = (address, time.monotonic_ns(), fut)
+            futures.append((seq, fut))
+            try:
+                self.sock.sendto(build_echo(self.ident, seq), (address, 0))
+                result.sent += 1
+            except OSError as e:
+                result.error = f"send: {e}"
+                self.pending.pop(seq, None)
+                fut.cancel()
+
+        # Last packet gets the full timeout, earlier ones had their spacing on top
+        waiting = [f for _, f in futures if not f.done()]
+        if waiting:
+            await asyncio.wait(waiting, timeout=self.timeout_s)
+        for seq, fut in futures:
+            if fut.done() and not fut.cancelled():
+                result.rtts.append(fut.result())
+            else:
+                self.pending.pop(seq, None)
+                fut.cancel()
+        return result
+
+    async def probe_many(self, targets, count=4):
+        # targets: {name: host}, probed concurrently on the shared socket
+        names = list(targets)
+        results = await asyncio.gather(*(self.probe(targets[n], count) for n in names))
+        return dict(zip(names, results))
+
+
+def stats_fields(prefix, result, count):
+    # Flatten a PingResult into the icmp_<prefix>_* log columns
+    stats = result.stats() if result is not None else ping_stats([], 0)
+    return {
+        f"icmp_{prefix}_count": count,
+        f"icmp_{prefix}_ms": stats["avg"],
+        f"icmp_{prefix}_lost": stats["lost"],
+        f"icmp_{prefix}_min_ms": stats["min"],
+        f"icmp_{prefix}_p95_ms": stats["p95"],
+        f"icmp_{prefix}_max_ms": stats["max"],
+        f"icmp_{prefix}_jitter_ms": stats["jitter"],
+    }
+
+
+async def _main(hosts, count):
+    engine = IcmpEngine()
+    try:
+        results = await engine.probe_many({h: h for h in hosts}, count)
+    finally:
+        engine.close()
+    for host, res in results.items():
+        print(f"{host} ({res.address}): sent {res.sent}, rtts {[round(r, 3) for r in res.rtts]} -> {res.stats()}"
+              + (f" [{res.error}]" if res.error else ""))
+    return all(r.rtts for r in results.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ping several hosts concurrently with the in-process ICMP engine.")
+    parser.add_argument("hosts", nargs="*", default=["127.0.0.1"])
+    parser.add_argument("-c", "--count", type=int, default=4)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(_main(args.hosts, args.count)) else 1)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# Terminal live view fed from memory: ring buffer of recent records, differential redraw.
+#
+# Only the part of each line that changed since the last frame is rewritten (ANSI cursor
+# addressing), so the screen never flickers and nothing is re-read from the log file.
+import sys
+import time
+import shutil
+from collections import deque
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+HISTORY_LEN = 60
+
+# Metrics shown with a rolling sparkline and min/max
+TREND_METRICS = [
+    ("RSSI", "rssi_dbm", "dBm"),
+    ("SNR", "snr", "dB"),
+    ("LAN", "icmp_lan_ms", "ms"),
+    ("WAN", "icmp_wan_ms", "ms"),
+    ("Rx", "iperf_rx_mbps", "Mbps"),
+    ("Tx", "iperf_tx_mbps", "Mbps"),
+]
+
+PROMPT = "Enter new location and press Enter, or Ctrl+C to save and quit > "
+
+
+def sparkline(values):
+    nums = [v for v in values if v is not None]
+    if not nums:
+        return " " * len(values)
+    lo, hi = min(nums), max(nums)
+    span = (hi - lo) or 1
+    top = len(SPARK_CHARS) - 1
+    return "".join(" " if v is None else SPARK_CHARS[int((v - lo) / span * top)] for v in values)
+
+
+def snr_of(record):
+    try:
+        return int(record["rssi_dbm"]) - int(record["noise_dbm"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class History:
+    # Last N logged records plus a per-metric column for the trends
+    def __init__(self, size=HISTORY_LEN):
+        self.records = deque(maxlen=size)
+        self.series = {key: deque(maxlen=size) for _label, key, _unit in TREND_METRICS}
+
+    def push(self, record):
+        self.records.append(record)
+        for key, series in self.series.items():
+            val = record.get(key)
+            series.append(val if isinstance(val, (int, float)) else None)
+
+    def last(self):
+        return self.records[-1] if self.records else None
+
+
+class LiveView:
+    def __init__(self, title, ping_targets=(), app_probes=None, out=sys.stdout, prompt=PROMPT, clock=time.time):
+        self.title = title
+        self.clock = clock  # Header time, the replay clock shows when the record was taken
+        self.prompt = prompt
+        self.ping_targets = [("LAN", "lan"), ("WAN", "wan")] + [(p.upper(), p) for p in ping_targets]
+        self.app_probes = app_probes or {}  # name -> tcp / dns / http
+        self.out = out
+        self.history = History()
+        self.prev_lines = None
+        self.term_size = None
+
+    def push(self, record):
+        self.history.push(record)
+
+    def invalidate(self):
+        # Next frame is a full repaint (e.g. after the user pressed Enter)
+        self.prev_lines = None
+
+    def format_lines(self, record):
+        last = self.history.last() or {}
+        lines = [f"--- Definitive Wi-Fi Survey v{self.title} ---", ""]
+
+        # Header Info
+        point = f" ({record['x']:g}, {record['y']:g})" if record.get('x') is not None and record.get('y') is not None else ""
+        lines.append(f"Time: {time.strftime('%H:%M:%S', time.localtime(self.clock()))}  |  Location: {record.get('location', 'Unknown')}{point}")
+        lines.append("-" * 60)
+
+        # Network ID Section (The "Identifiers")
+        roam = "!! ROAM !!" if last.get('bss_transition') else ""
+        ssid_str = record.get('ssid') or "N/A"
+        bssid_str = record.get('bssid') or "N/A"
+        auth_str = record.get('auth_mode') or "N/A"
+        chan_str = str(record.get('channel'))
+        if record.get('channel_band') and record.get('channel_width'):
+            chan_str += f" ({record.get('channel_band')}, {record.get('channel_width')})"
+
+        lines.append(f"SSID:    {ssid_str:<20}  BSSID:   {bssid_str} {roam}")
+        lines.append(f"Channel: {chan_str:<20}  Mode:    {record.get('phy_mode')}")
+        lines.append(f"Country: {record.get('country_code') or 'N/A':<20}  Auth:    {auth_str}")
+        lines.append(f"NIC IP:  {record.get('nic_ip') or 'N/A':<20}  NIC MAC: {record.get('nic_mac') or 'N/A'}")
+        if record.get('neighbor_count') is not None:
+            lines.append(f"Nearby:  {record['neighbor_count']} BSS / {record.get('neighbor_ssids')} SSIDs, "
+                         f"strongest {record.get('neighbor_best_rssi_dbm')} dBm")
+
+        # RF Section
+        rssi = record.get('rssi_dbm')
+        snr = snr_of(record)
+        lines.append("-" * 60)
+        quality = "" if rssi is None else ("(Good)" if rssi > -65 else "(Poor)")
+        lines.append(f"RSSI:    {rssi if rssi is not None else 'N/A'} dBm {quality}")
+        lines.append(f"Noise:   {record.get('noise_dbm') if record.get('noise_dbm') is not None else 'N/A'} dBm")
+        lines.append(f"SNR:     {snr if snr is not None else 'N/A'} dB")
+        lines.append(f"Tx Rate: {record.get('tx_rate_mbps') or 0} Mbps")
+
+        # Performance Section
+        lines.append("-" * 60)
+        under_load = (record.get('under_load') or "").split(",")
+        for label, prefix in self.ping_targets:
+            load_label = " [under load]" if f"icmp_{prefix}" in under_load else ""
+            lines.append(f"{label} Ping: {record.get(f'icmp_{prefix}_ms', 'N/A')} ms "
+                         f"(p95: {record.get(f'icmp_{prefix}_p95_ms')}, jitter: {record.get(f'icmp_{prefix}_jitter_ms')}, "
+                         f"Lost: {record.get(f'icmp_{prefix}_lost')}%){load_label}")
+            if f"icmp_{prefix}_loaded_ms" in record:
+                lines.append(f"{'':<{len(label)}} Loaded: {record.get(f'icmp_{prefix}_loaded_ms')} ms "
+                             f"(p95: {record.get(f'icmp_{prefix}_loaded_p95_ms')}, "
+                             f"Lost: {record.get(f'icmp_{prefix}_loaded_lost')}%)")
+
+        # Application probes, one line each
+        for name, kind in self.app_probes.items():
+            p = f"app_{name}"
+            ms = record.get(f"{p}_ms")
+            detail = {"tcp": "connect",
+                      "dns": f"{record.get(f'{p}_rcode') or 'no answer'}",
+                      "http": f"TTFB, connect: {record.get(f'{p}_connect_ms') or ('reused' if ms is not None else 'N/A')}, "
+                              f"total: {record.get(f'{p}_total_ms')}, status: {record.get(f'{p}_status')}"}[kind]
+            error = f" !! {record[f'{p}_error']}" if record.get(f"{p}_error") else ""
+            load_label = " [under load]" if p in under_load else ""
+            lines.append(f"{name.upper()} {kind.upper()}: {ms if ms is not None else 'N/A'} ms ({detail}){error}{load_label}")
+
+        # Iperf Staleness Check
+        iperf_age = record.get('age_iperf_tx_ms') or record.get('age_iperf_rx_ms')
+        stale_label = " (cached)" if iperf_age and iperf_age > 10000 else ""
+        rx = int(record.get('iperf_rx_mbps') or 0)
+        tx = int(record.get('iperf_tx_mbps') or 0)
+        lines.append(f"Speed:    Rx {rx} Mbps  /  Tx {tx} Mbps{stale_label}")
+
+        # Trends over the last N logged records
+        lines.append("-" * 60)
+        for label, key, unit in TREND_METRICS:
+            series = self.history.series[key]
+            nums = [v for v in series if v is not None]
+            rng = f"{min(nums):g}..{max(nums):g} {unit}" if nums else "N/A"
+            lines.append(f"{label:<5} {sparkline(series):<{HISTORY_LEN}}  {rng}")
+
+        lines.append("")
+        return lines
+
+    def _diff(self, lines):
+        # Rewrite each changed line from its first differing cell, then clear the tail
+        out = []
+        for row, text in enumerate(lines):
+            old = self.prev_lines[row] if row < len(self.prev_lines) else None
+            if text == old:
+                continue
+            col = 0
+            if old is not None:
+                while col < min(len(old), len(text)) and old[col] == text[col]:
+                    col += 1
+            out.append(f"\x1b[{row + 1};{col + 1}H{text[col:]}\x1b[K")
+        for row in range(len(lines), len(self.prev_lines)):
+            out.append(f"\x1b[{row + 1};1H\x1b[K")
+        return out
+
+    def render(self, record):
+        self.render_lines(self.format_lines(record))
+
+    def render_lines(self, lines):
+        size = shutil.get_terminal_size()
+        if self.prev_lines is None or size != self.term_size:
+            # Full paint, prompt goes last so typed locations echo after it
+            self.term_size = size
+            self.out.write("\x1b[2J\x1b[H" + "\n".join(lines) + "\n" + self.prompt)
+        else:
+            changes = self._diff(lines)
+            if changes:
+                # Save/restore cursor so the location being typed stays where it is
+                self.out.write("\x1b7" + "".join(changes) + "\x1b8")
+        self.prev_lines = lines
+        self.out.flush()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# Metrics about the survey tool itself: counters, gauges and histograms in a registry that
+# renders Prometheus text format, a tiny /metrics HTTP endpoint, and a sampling profiler.
+#
+# No prometheus_client dependency, everything here is a few dicts and bisect.
+import sys
+import asyncio
+import bisect
+import threading
+import subprocess
+import collections
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+FAST_BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 0.001, 0.005, 0.01, 0.05)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        return [(self.name, _labels(self.labels, k), v) for k, v in sorted(self.values.items())]
+
+    def summary(self):
+        return {",".join(map(str, k)) or "total": v for k, v in self.values.items()}
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), fn=None):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.fn = fn  # () -> {label_values: value}, evaluated at scrape time
+        self.values = {}
+
+    def set(self, value, *label_values):
+        self.values[label_values] = value
+
+    def _current(self):
+        return self.fn() if self.fn else self.values
+
+    def samples(self):
+        return [(self.name, _labels(self.labels, k), v) for k, v in sorted(self._current().items()) if v is not None]
+
+    def summary(self):
+        return {",".join(map(str, k)) or "value": v for k, v in self._current().items()}
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}  # label_values -> [bucket counts..., +Inf count, sum, max]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self.series.get(label_values)
+            if s is None:
+                s = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0.0]
+            s[i] += 1
+            s[-2] += value
+            s[-1] = max(s[-1], value)
+
+    def samples(self):
+        out = []
+        for key, s in sorted(self.series.items()):
+            running = 0
+            for bound, n in zip(self.buckets + ("+Inf",), s[:-2]):
+                running += n
+                out.append((self.name + "_bucket", _labels(self.labels + ("le",), key + (bound,)), running))
+            out.append((self.name + "_sum", _labels(self.labels, key), round(s[-2], 6)))
+            out.append((self.name + "_count", _labels(self.labels, key), running))
+        return out
+
+    def quantile(self, s, q):
+        # Upper bucket bound holding the q-th observation, good enough for summaries
+        total = sum(s[:-2])
+        if not total:
+            return None
+        running = 0
+        for bound, n in zip(self.buckets + (s[-1],), s[:-2]):
+            running += n
+            if running >= q * total:
+                return min(bound, s[-1])
+        return s[-1]
+
+    def summary(self):
+        out = {}
+        for key, s in self.series.items():
+            count = sum(s[:-2])
+            out[",".join(map(str, key)) or "all"] = {
+                "count": count, "avg_ms": round(s[-2] / count * 1e3, 3) if count else None,
+                "p95_ms": round(self.quantile(s, 0.95) * 1e3, 3) if count else None,
+                "max_ms": round(s[-1] * 1e3, 3)}
+        return out
+
+
+class Registry:
+    def __init__(self, prefix="survey_"):
+        self.prefix = prefix
+        self.metrics = {}
+
+    def _add(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(self.prefix + name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=(), fn=None):
+        return self._add(Gauge(self.prefix + name, help_text, labels, fn))
+
+    def histogram(self, name, help_text, labels=(), buckets=DURATION_BUCKETS):
+        return self._add(Histogram(self.prefix + name, help_text, labels, buckets))
+
+    def render(self):
+        # Prometheus text exposition format 0.0.4
+        lines = []
+        for m in self.metrics.values():
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines += [f"{name}{labels} {value}" for name, labels, value in m.samples()]
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        # Compact dict for the periodic "metrics" line in the survey log
+        return {m.name[len(self.prefix):]: s for m in self.metrics.values() if (s := m.summary())}
+
+
+REGISTRY = Registry()
+SPAWNS = REGISTRY.counter("subprocess_total", "Subprocesses started, by command and result", ("cmd", "result"))
+
+
+def run_subprocess(cmd, **kwargs):
+    # subprocess.run, counted by outcome: ok, exit_<code>, timeout or not_found/oserror
+    name = cmd[0].rsplit("/", 1)[-1]
+    try:
+        res = subprocess.run(cmd, **kwargs)
+    except subprocess.TimeoutExpired:
+        SPAWNS.inc(name, "timeout")
+        raise
+    except FileNotFoundError:
+        SPAWNS.inc(name, "not_found")
+        raise
+    except OSError:
+        SPAWNS.inc(name, "oserror")
+        raise
+    SPAWNS.inc(name, "ok" if res.returncode == 0 else f"exit_{res.returncode}")
+    return res
+
+
+# --- HTTP endpoint ---
+class MetricsServer:
+    def __init__(self, registry=REGISTRY, host="127.0.0.1", port=9101):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        return self
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass  # Headers, not needed
+            parts = request.decode(errors="replace").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, ctype, body = "200 OK", "text/plain; version=0.0.4; charset=utf-8", self.registry.render()
+            else:
+                status, ctype, body = "404 Not Found", "text/plain", "Try /metrics\n"
+            data = body.encode()
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(data)}\r\n"
+                         f"Connection: close\r\n\r\n".encode() + data)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        if self.server:
+            self.server.close()
+
+
+# --- Profiler ---
+class SamplingProfiler:
+    """Samples one thread's Python stack at a fixed interval, output as folded stacks (flamegraph.pl / speedscope)."""
+
+    def __init__(self, thread_id=None, interval_s=0.01):
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.interval_s = interval_s
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+
+    def top(self, n=10):
+        # Leaf functions with the most samples, select() there means the loop was idle
+        leaves = collections.Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return [(fn, count, count / self.samples) for fn, count in leaves.most_common(n)] if self.samples else []
+
+
+if __name__ == "__main__":
+    # Quick look at what a running survey exposes: python3 metrics.py [port]
+    import urllib.request
+    port = sys.argv[1] if len(sys.argv) > 1 else "9101"
+    try:
+        print(urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=2).read().decode())
+    except OSError as e:
+        sys.exit(f"No metrics on port {port}: {e}")
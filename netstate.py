@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# Event-driven interface IP / default gateway / DNS tracking.
+#
+# Subscribes to kernel change notifications (rtnetlink on Linux, a PF_ROUTE socket on macOS)
+# and only re-reads state when something changed. Linux reads /proc/net/route and an ioctl,
+# no subprocesses. Without a notification socket it falls back to polling the cheap readers.
+import re
+import sys
+import time
+import fcntl
+import socket
+import struct
+import asyncio
+import subprocess
+
+from metrics import run_subprocess
+
+# rtnetlink multicast groups: link, IPv4 address and IPv4 route changes
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+NETLINK_ROUTE = 0
+
+SIOCGIFADDR = 0xc0206921 if sys.platform == "darwin" else 0x8915
+RTF_GATEWAY = 0x2
+RTF_HOST = 0x4
+
+# PF_ROUTE (macOS): route add/delete/change, interface address and link messages
+RTM_ADD, RTM_DELETE, RTM_CHANGE = 0x1, 0x2, 0x3
+RTM_NEWADDR, RTM_DELADDR, RTM_IFINFO = 0xc, 0xd, 0xe
+RTA_DST = 0x1
+RT_MSGHDR = struct.Struct("=HBBH2xiiiiiiI56x")  # struct rt_msghdr, rt_metrics skipped
+DEBOUNCE_S = 0.05  # Route/address messages arrive in bursts
+REIP_WINDOW_S = 30  # Address events later than this after a roam aren't attributed to it
+
+
+# --- Readers ---
+def parse_proc_route(text, interface=None):
+    # Returns (iface, gateway) of the default route, /proc/net/route stores addresses little-endian hex
+    for line in text.splitlines()[1:]:
+        cols = line.split()
+        if len(cols) < 4 or cols[1] != "00000000":
+            continue
+        if interface and cols[0] != interface:
+            continue
+        if int(cols[3], 16) & RTF_GATEWAY:
+            return cols[0], socket.inet_ntoa(struct.pack("<I", int(cols[2], 16)))
+    return None, None
+
+
+def parse_resolv_conf(text):
+    return [cols[1] for cols in (line.split() for line in text.splitlines())
+            if len(cols) >= 2 and cols[0] == "nameserver"]
+
+
+def interface_ip(interface):
+    # SIOCGIFADDR works on both Linux and macOS, no ipconfig/ip subprocess
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        req = struct.pack("256s", interface.encode()[:15])
+        res = fcntl.ioctl(s.fileno(), SIOCGIFADDR, req)
+        return socket.inet_ntoa(res[20:24])
+    except OSError:
+        return None
+    finally:
+        s.close()
+
+
+def macos_gateway():
+    # Only called on a routing socket event, not polled
+    try:
+        res = run_subprocess(["route", "-n", "get", "default"], capture_output=True, text=True, timeout=2)
+        match = re.search(r"gateway:\s+([\d\.]+)", res.stdout)
+        iface = re.search(r"interface:\s+(\S+)", res.stdout)
+        return (iface.group(1) if iface else None), (match.group(1) if match else None)
+    except (OSError, subprocess.SubprocessError):
+        return None, None
+
+
+def route_message_relevant(msg):
+    # macOS routing socket message that can change the IPv4 gateway, address or link. ARP and
+    # neighbor churn (host routes, cloned link-layer entries) is skipped, re-reading it means a route(8) spawn.
+    if len(msg) < 4:
+        return False
+    msg_type = msg[3]
+    if msg_type in (RTM_NEWADDR, RTM_DELADDR, RTM_IFINFO):
+        return True
+    if msg_type not in (RTM_ADD, RTM_DELETE, RTM_CHANGE):
+        return False
+    if len(msg) < RT_MSGHDR.size:
+        return True  # Can't tell, re-read to be safe
+    _len, _ver, _type, _index, flags, addrs = RT_MSGHDR.unpack_from(msg)[:6]
+    if not flags & RTF_GATEWAY or flags & RTF_HOST or not addrs & RTA_DST:
+        return False
+    dst = msg[RT_MSGHDR.size:RT_MSGHDR.size + 8]  # sockaddr_in: len, family, port, address
+    return len(dst) == 8 and dst[1] == socket.AF_INET and dst[4:8] == b"\0\0\0\0"
+
+
+def read_file(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def read_state(interface=None):
+    if sys.platform == "darwin":
+        route_iface, gateway = macos_gateway()
+        interface = interface or route_iface or "en0"
+    else:
+        route_iface, gateway = parse_proc_route(read_file("/proc/net/route"), interface)
+        interface = interface or route_iface
+    return {
+        "interface": interface,
+        "ip": interface_ip(interface) if interface else None,
+        "gateway": gateway,
+        "dns": parse_resolv_conf(read_file("/etc/resolv.conf")),
+    }
+
+
+def open_notify_socket():
+    if sys.platform.startswith("linux"):
+        s = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        s.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE))
+    else:
+        s = socket.socket(getattr(socket, "AF_ROUTE", 17), socket.SOCK_RAW, 0)
+    s.setblocking(False)
+    return s
+
+
+# --- Watcher ---
+class NetStateWatcher:
+    def __init__(self, interface=None, on_change=None, poll_s=5.0):
+        self.interface = interface or None
+        self.on_change = on_change  # callback(state, changed_keys, reip_ms)
+        self.poll_s = poll_s
+        self.state = {"interface": self.interface, "ip": None, "gateway": None, "dns": []}
+        self.sock = None
+        self.roam_ns = None
+        self.events = 0
+        self.ignored = 0  # Routing socket messages that couldn't change the state (macOS)
+        self._pending = None
+        self._pending_reason = None
+        self._poller = None
+        self._loop = None
+
+    async def start(self):
+        loop = self._loop = asyncio.get_running_loop()
+        try:
+            self.sock = open_notify_socket()
+            loop.add_reader(self.sock.fileno(), self._on_readable)
+        except OSError:
+            self.sock = None
+            self._poller = asyncio.create_task(self._poll())
+        await self.refresh()
+        return self
+
+    def close(self):
+        if self.sock is not None:
+            asyncio.get_running_loop().remove_reader(self.sock.fileno())
+            self.sock.close()
+            self.sock = None
+        if self._poller:
+            self._poller.cancel()
+
+    def roamed(self, monotonic_ns):
+        # Called from the radio sampler thread, the next address/gateway change is timed against it
+        self.roam_ns = monotonic_ns
+        if self._loop:  # Not started in a replay, the recorded addresses are fed in instead
+            self._loop.call_soon_threadsafe(self.schedule_refresh, "roam")
+
+    def _on_readable(self):
+        # Linux re-reads are cheap (/proc, an ioctl), macOS ones spawn route(8), so only for messages that matter
+        relevant = False
+        try:
+            while True:
+                msg = self.sock.recv(65536)
+                if not msg:
+                    break
+                self.events += 1
+                if sys.platform != "darwin" or route_message_relevant(msg):
+                    relevant = True
+                else:
+                    self.ignored += 1
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            return
+        if relevant:
+            self.schedule_refresh("event")
+
+    def schedule_refresh(self, reason):
+        # A kernel event outranks a roam-triggered re-read queued in the same debounce window
+        if reason == "event" or self._pending_reason is None:
+            self._pending_reason = reason
+        if self._pending is None or self._pending.done():
+            self._pending = asyncio.get_running_loop().create_task(self._debounced_refresh())
+
+    async def _debounced_refresh(self):
+        await asyncio.sleep(DEBOUNCE_S)
+        reason, self._pending_reason = self._pending_reason, None
+        await self.refresh(reason)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_s)
+            await self.refresh("poll")
+
+    async def refresh(self, reason="poll"):
+        # macOS gateway lookup spawns route(8), keep it off the loop
+        if sys.platform == "darwin":
+            new = await asyncio.to_thread(read_state, self.interface)
+        else:
+            new = read_state(self.interface)
+        changed = [k for k in ("ip", "gateway", "dns") if new[k] != self.state.get(k)]
+        self.state = new
+
+        # First address event after a roam (DHCP renew/re-IP), even if the address stayed the same
+        reip_ms = None
+        if self.roam_ns is not None:
+            since_ms = int((time.monotonic_ns() - self.roam_ns) / 1e6)
+            if since_ms > REIP_WINDOW_S * 1000:
+                self.roam_ns = None
+            elif new["ip"] and (changed or reason == "event"):
+                reip_ms = since_ms
+                self.roam_ns = None
+        if (changed or reip_ms is not None) and self.on_change:
+            self.on_change(new, changed, reip_ms)
+
+
+if __name__ == "__main__":
+    async def _main():
+        def show(state, changed, reip_ms):
+            print(f"{time.strftime('%H:%M:%S')} {','.join(changed)} -> {state}" + (f" (re-IP {reip_ms} ms)" if reip_ms else ""))
+        watcher = await NetStateWatcher(sys.argv[1] if len(sys.argv) > 1 else None, show).start()
+        print(f"Watching via {'notifications' if watcher.sock else 'polling'}, Ctrl+C to stop")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass
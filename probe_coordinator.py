@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# Probe coordination: keeps throughput tests from contaminating latency and RF samples, and
+# decides how often the probes that cost airtime run.
+#
+# A throughput test saturates the link, pings taken meanwhile measure the queue it builds and
+# the radio reports the rate the test pushed it to. With load_policy
+#   gate    latency probes skip while a test runs (and a test waits for pings in flight)
+#   tag     probes run on schedule, sources whose sample overlapped a test go in "under_load"
+#   loaded  gate, plus pings alongside every test, logged as icmp_<target>_loaded_* columns
+# RF samples are never gated (roam detection needs them), they are tagged in every mode.
+#
+# Intervals follow what the surveyor does: a burst after a roam or location change, a slow
+# back-off while standing still. Everything measured is charged to one airtime budget, but only the
+# heavy probes (throughput tests) are stretched when it runs over, pings and app probes keep their rate.
+import time
+import asyncio
+import collections
+import contextlib
+
+LOAD_POLICIES = ("gate", "tag", "loaded")
+GUARD_S = 1.0            # Queues drain and rate control settles after a test
+BUDGET_WINDOW_S = 300
+FRAME_OVERHEAD_US = 100  # Preamble, IFS, backoff and ack of one small frame, roughly
+ICMP_FRAME_BYTES = 80    # Echo with our payload plus IP/802.11 headers
+
+
+def ping_airtime_s(packets, rate_mbps):
+    # Echo request + reply, one frame each way
+    rate = rate_mbps or 6  # Lowest OFDM rate when the rate is unknown
+    return 2 * packets * (FRAME_OVERHEAD_US * 1e-6 + ICMP_FRAME_BYTES * 8 / (rate * 1e6))
+
+
+class AirtimeBudget:
+    def __init__(self, budget_pct, window_s=BUDGET_WINDOW_S, clock_ns=time.monotonic_ns):
+        self.budget = budget_pct / 100
+        self.window_ns = int(window_s * 1e9)
+        self.clock_ns = clock_ns
+        self.spent = collections.deque()    # (t_ns, airtime_s) in the window
+        self.total = collections.Counter()  # probe -> airtime_s since start
+
+    def charge(self, probe, airtime_s, now_ns=None):
+        self.spent.append((now_ns or self.clock_ns(), airtime_s))
+        self.total[probe] += airtime_s
+
+    def used(self, now_ns=None):
+        # Share of the window spent measuring
+        now_ns = now_ns or self.clock_ns()
+        while self.spent and self.spent[0][0] < now_ns - self.window_ns:
+            self.spent.popleft()
+        return sum(a for _, a in self.spent) / (self.window_ns / 1e9)
+
+    def factor(self, now_ns=None):
+        # Interval stretch, 1.0 while within budget
+        if not self.budget:
+            return 1.0
+        return max(1.0, self.used(now_ns) / self.budget)
+
+
+class ProbeCoordinator:
+    def __init__(self, policy="gate", budget_pct=25, burst_s=30, burst_factor=3, stationary_s=120,
+                 backoff_max=1, guard_s=GUARD_S, clock_ns=time.monotonic_ns):
+        if policy not in LOAD_POLICIES:
+            raise ValueError(f"load policy must be one of {', '.join(LOAD_POLICIES)}")
+        self.policy = policy
+        self.budget = AirtimeBudget(budget_pct, clock_ns=clock_ns)
+        self.burst_ns = int(burst_s * 1e9)
+        self.burst_factor = burst_factor
+        self.stationary_ns = int(stationary_s * 1e9)
+        self.backoff_max = backoff_max
+        self.guard_ns = int(guard_s * 1e9)
+        self.clock_ns = clock_ns
+        self.on_wake = None  # (probe name) to run a probe now, e.g. Scheduler.wake
+        self.probes = {}     # name -> (base interval s, burst, wake_on, heavy)
+        self.loads = collections.deque(maxlen=32)  # [start_ns, end_ns or None] of recent tests
+        self.under_load = {}  # source -> latest sample overlapped a test
+        self.in_flight = 0
+        self.motion_ns = clock_ns()
+        self.motion_kind = None
+        self.gated = collections.Counter()
+        self.tagged = collections.Counter()
+
+    # --- Rates ---
+    def register(self, name, interval_s, burst=True, wake_on=("roam", "location"), heavy=False):
+        # heavy: stretched by the airtime budget, a light probe never is
+        self.probes[name] = (interval_s, burst, tuple(wake_on), heavy)
+
+    def mode(self, now_ns=None):
+        since = (now_ns or self.clock_ns()) - self.motion_ns
+        if self.motion_kind and since < self.burst_ns:
+            return "burst"
+        return "stationary" if since >= self.stationary_ns and self.backoff_max > 1 else "normal"
+
+    def interval_s(self, name, now_ns=None):
+        now_ns = now_ns or self.clock_ns()
+        base, burst, _, heavy = self.probes[name]
+        since = now_ns - self.motion_ns
+        factor = 1.0
+        if burst and self.motion_kind and since < self.burst_ns:
+            factor = 1 / self.burst_factor
+        elif since >= self.stationary_ns:
+            # Grows with the time spent standing still, e.g. 2x after twice stationary_s
+            factor = min(self.backoff_max, since / self.stationary_ns)
+        return base * factor * (self.budget.factor(now_ns) if heavy else 1.0)
+
+    def motion(self, kind):
+        # A roam or location change: burst, and run the probes that care right away
+        self.motion_ns = self.clock_ns()
+        self.motion_kind = kind
+        for name, (_, _, wake_on, _) in self.probes.items():
+            if kind in wake_on and self.on_wake:
+                self.on_wake(name)
+
+    # --- Load ---
+    @contextlib.asynccontextmanager
+    async def load(self, probe="iperf", settle_s=2.0):
+        # One throughput test. Pings already in flight get to finish first, unless tagging only.
+        if self.policy != "tag":
+            deadline = self.clock_ns() + int(settle_s * 1e9)
+            while self.in_flight and self.clock_ns() < deadline:
+                await asyncio.sleep(0.05)
+        window = [self.clock_ns(), None]
+        self.loads.append(window)
+        try:
+            yield
+        finally:
+            window[1] = self.clock_ns()
+            self.budget.charge(probe, (window[1] - window[0]) / 1e9)
+
+    def loaded(self, now_ns=None):
+        now_ns = now_ns or self.clock_ns()
+        return self.overlaps(now_ns, now_ns)
+
+    def overlaps(self, start_ns, end_ns):
+        # A test (plus its guard time) intersects [start_ns, end_ns]
+        for s, e in list(self.loads):  # Read from the radio thread too
+            if s <= end_ns and (e is None or e + self.guard_ns >= start_ns):
+                return True
+        return False
+
+    # --- Probes ---
+    def gate(self, probe):
+        # True if a latency probe should skip this run
+        if self.policy != "tag" and self.loaded():
+            self.gated[probe] += 1
+            return True
+        return False
+
+    @contextlib.contextmanager
+    def probing(self):
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def tag(self, source, start_ns, end_ns=None):
+        # Remember whether the newest sample of a source overlapped a test
+        loaded = self.overlaps(start_ns, end_ns or self.clock_ns())
+        self.under_load[source] = loaded
+        if loaded:
+            self.tagged[source] += 1
+        return loaded
+
+    def under_load_sources(self):
+        return sorted(s for s, loaded in self.under_load.items() if loaded)
+
+    def stats(self):
+        return {"policy": self.policy, "mode": self.mode(), "airtime_pct": round(self.budget.used() * 100, 1),
+                "budget_factor": round(self.budget.factor(), 2),
+                "airtime_s": {k: round(v, 2) for k, v in self.budget.total.items()},
+                "gated": dict(self.gated), "tagged": dict(self.tagged)}
@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+# Radio backends: where the wifi_* fields come from.
+#
+# Every backend offers sample() (all wifi fields for the survey record) and sample_fast()
+# ((bssid, rssi) for high-rate roam capture), and counts what each call costs.
+import os
+import re
+import sys
+import time
+import fcntl
+import random
+import socket
+import struct
+import subprocess
+from array import array
+
+from metrics import run_subprocess
+
+# CoreWLAN enums
+PHY_MAP = {0: "Unknown", 1: "11a", 2: "11b", 3: "11g", 4: "11n", 5: "11ac", 6: "11ax", 7: "11be"}
+SEC_MAP = {
+    0: "Open",
+    1: "WEP",
+    2: "WPA-PSK",
+    3: "WPA/2-PSK",
+    4: "WPA2-PSK",
+    5: "Personal",
+    6: "Dynamic WEP",
+    7: "WPA-EAP",
+    8: "WPA/2-EAP",
+    9: "WPA2-EAP",
+    10: "Enterprise",
+    11: "WPA3-SAE",
+    12: "WPA3-EAP",
+    13: "WPA3-Mix"
+}
+BAND_MAP = {1: "2.4GHz", 2: "5GHz", 3: "6GHz"}
+WIDTH_MAP = {1: "20MHz", 2: "40MHz", 3: "80MHz", 4: "160MHz", 5: "320MHz"}
+
+
+class RadioError(Exception):
+    pass
+
+
+class CostCounter:
+    # Wall time spent per call kind, to see what a sample rate really costs
+    def __init__(self):
+        self.calls = {}
+        self.total_ns = {}
+        self.max_ns = {}
+        self.spawns = 0
+
+    def add(self, kind, ns):
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+        self.total_ns[kind] = self.total_ns.get(kind, 0) + ns
+        self.max_ns[kind] = max(self.max_ns.get(kind, 0), ns)
+
+    def summary(self):
+        return {kind: {"calls": n, "avg_us": round(self.total_ns[kind] / n / 1e3, 1),
+                       "max_us": round(self.max_ns[kind] / 1e3, 1)} for kind, n in self.calls.items()} | {
+            "spawns": self.spawns}
+
+
+class RadioBackend:
+    name = "base"
+
+    def __init__(self):
+        self.cost = CostCounter()
+
+    def sample(self):
+        t0 = time.perf_counter_ns()
+        try:
+            return self._sample()
+        finally:
+            self.cost.add("sample", time.perf_counter_ns() - t0)
+
+    def sample_fast(self):
+        t0 = time.perf_counter_ns()
+        try:
+            return self._sample_fast()
+        finally:
+            self.cost.add("sample_fast", time.perf_counter_ns() - t0)
+
+    def scan(self):
+        # Every visible BSS as {bssid: {ssid, rssi_dbm, channel, channel_band, channel_width, security}}, slow
+        t0 = time.perf_counter_ns()
+        try:
+            return self._scan()
+        finally:
+            self.cost.add("scan", time.perf_counter_ns() - t0)
+
+    def _sample(self):
+        raise NotImplementedError
+
+    def _sample_fast(self):
+        s = self._sample()
+        return s.get("bssid"), s.get("rssi_dbm")
+
+    def _scan(self):
+        raise RadioError(f"{self.name} backend can't scan")
+
+
+def empty_sample():
+    return {"ssid": None, "bssid": None, "channel": None, "rssi_dbm": None, "noise_dbm": None,
+            "tx_rate_mbps": None, "phy_mode": None, "auth_mode": None, "nic_mac": None,
+            "country_code": None, "channel_band": "Unknown", "channel_width": "Unknown"}
+
+
+# --- macOS ---
+def safe_get(obj, attr, default=None):
+    # Properties that might be missing on older OS
+    try:
+        val = getattr(obj, attr)
+        return val() if callable(val) else val
+    except Exception:
+        return default
+
+
+class CoreWLANBackend(RadioBackend):
+    name = "corewlan"
+
+    def __init__(self):
+        super().__init__()
+        try:
+            import objc
+        except ImportError:
+            raise RadioError("PyObjC is not installed. Please run 'pip3 install pyobjc-core'")
+        bundle = {}
+        objc.loadBundle('CoreWLAN', bundle_path='/System/Library/Frameworks/CoreWLAN.framework', module_globals=bundle)
+        self.client = bundle["CWWiFiClient"].sharedWiFiClient()
+        self.interface = None
+
+    def _iface(self):
+        # Cached handle, re-fetched only after it went away (e.g. Wi-Fi toggled)
+        if self.interface is None:
+            self.interface = self.client.interface()
+        return self.interface
+
+    def _sample(self):
+        interface = self._iface()
+        if interface is None:
+            return empty_sample()
+        try:
+            sec_raw = safe_get(interface, 'security')
+            cw_channel = safe_get(interface, 'wlanChannel')
+            return {
+                "ssid": interface.ssid(),
+                "bssid": interface.bssid(),
+                "channel": interface.channel(),
+                "rssi_dbm": interface.rssiValue(),
+                "noise_dbm": interface.noiseMeasurement(),
+                "tx_rate_mbps": interface.transmitRate(),
+                "phy_mode": PHY_MAP.get(safe_get(interface, 'activePHYMode'), "Other"),
+                "auth_mode": SEC_MAP.get(sec_raw, str(sec_raw) if sec_raw is not None else "Unknown"),
+                "nic_mac": safe_get(interface, 'hardwareAddress'),
+                "country_code": safe_get(interface, 'countryCode'),
+                "channel_band": BAND_MAP.get(safe_get(cw_channel, 'channelBand'), "Unknown") if cw_channel else "Unknown",
+                "channel_width": WIDTH_MAP.get(safe_get(cw_channel, 'channelWidth'), "Unknown") if cw_channel else "Unknown",
+            }
+        except Exception:
+            self.interface = None
+            raise
+
+    def _sample_fast(self):
+        interface = self._iface()
+        if interface is None:
+            return None, None
+        return interface.bssid(), interface.rssiValue()
+
+    def _scan(self):
+        interface = self._iface()
+        if interface is None:
+            return {}
+        networks, error = interface.scanForNetworksWithName_error_(None, None)
+        if networks is None:
+            raise RadioError(f"scan failed: {error}")
+        table = {}
+        for net in networks:
+            bssid = net.bssid()
+            if not bssid:
+                continue  # Hidden without Location permission
+            ch = safe_get(net, 'wlanChannel')
+            # CWNetwork has no security property, take the strongest mode it supports
+            security = next((SEC_MAP[v] for v in sorted(SEC_MAP, reverse=True)
+                             if v and net.supportsSecurity_(v)), "Open")
+            table[bssid] = {
+                "ssid": net.ssid(),
+                "rssi_dbm": net.rssiValue(),
+                "channel": safe_get(ch, 'channelNumber') if ch else None,
+                "channel_band": BAND_MAP.get(safe_get(ch, 'channelBand'), "Unknown") if ch else "Unknown",
+                "channel_width": WIDTH_MAP.get(safe_get(ch, 'channelWidth'), "Unknown") if ch else "Unknown",
+                "security": security,
+            }
+        return table
+
+
+# --- Linux ---
+SIOCGIWESSID = 0x8B1B
+SIOCGIWFREQ = 0x8B05
+SIOCGIWAP = 0x8B15
+
+
+def parse_proc_wireless(text, interface):
+    # " wlan0: 0000   54.  -56.  -256. ..." -> (level, noise), -256 means the driver has no noise figure
+    for line in text.splitlines()[2:]:
+        name, _, rest = line.partition(":")
+        if name.strip() != interface:
+            continue
+        cols = rest.split()
+        if len(cols) < 4:
+            return None, None
+        level, noise = (int(float(c.rstrip("."))) for c in cols[2:4])
+        return (level if level != 0 else None), (noise if -200 < noise < 0 else None)
+    return None, None
+
+
+def freq_to_channel(mhz):
+    if mhz is None:
+        return None, "Unknown"
+    if 2412 <= mhz <= 2484:
+        return (14 if mhz == 2484 else (mhz - 2407) // 5), "2.4GHz"
+    if 5925 < mhz <= 7125:
+        return (mhz - 5950) // 5, "6GHz"
+    if 4900 <= mhz <= 5925:
+        return (mhz - 5000) // 5, "5GHz"
+    return None, "Unknown"
+
+
+def parse_iw_link(text):
+    # Output of `iw dev <if> link`
+    if not text.strip() or text.startswith("Not connected"):
+        return {}
+    out = {}
+    m = re.search(r"Connected to ([0-9a-f:]{17})", text)
+    if m:
+        out["bssid"] = m.group(1)
+    m = re.search(r"^\s*SSID: (.*)$", text, re.M)
+    if m:
+        out["ssid"] = m.group(1)
+    m = re.search(r"freq: ([\d.]+)", text)
+    if m:
+        out["freq"] = int(float(m.group(1)))
+    m = re.search(r"signal: (-?\d+) dBm", text)
+    if m:
+        out["rssi_dbm"] = int(m.group(1))
+    m = re.search(r"tx bitrate: ([\d.]+) MBit/s(.*)$", text, re.M)
+    if m:
+        out["tx_rate_mbps"] = float(m.group(1))
+        flags = m.group(2)
+        out["phy_mode"] = ("11be" if "EHT-MCS" in flags else "11ax" if "HE-MCS" in flags else
+                           "11ac" if "VHT-MCS" in flags else "11n" if "MCS" in flags else None)
+        w = re.search(r"(\d+)MHz", flags)
+        out["channel_width"] = f"{w.group(1)}MHz" if w else "20MHz"
+    return out
+
+
+def parse_iw_scan(text):
+    # Output of `iw dev <if> scan [dump]`, one "BSS <mac>(on <if>)" block per network
+    table = {}
+    for block in re.split(r"^BSS ", text, flags=re.M)[1:]:
+        m = re.match(r"([0-9a-f:]{17})", block)
+        if not m:
+            continue
+        freq = re.search(r"^\s*freq: ([\d.]+)", block, re.M)
+        channel, band = freq_to_channel(int(float(freq.group(1))) if freq else None)
+        signal = re.search(r"^\s*signal: (-?[\d.]+) dBm", block, re.M)
+        ssid = re.search(r"^\s*SSID: (.*)$", block, re.M)
+
+        width = "20MHz"
+        if re.search(r"secondary channel offset: (above|below)", block):
+            width = "40MHz"
+        vht = re.search(r"\* channel width: (\d) \(([\d+ ]+) MHz\)", block)
+        if vht and vht.group(1) != "0":
+            width = vht.group(2).replace(" ", "").split("+")[0] + "MHz"
+
+        if "RSN:" in block:
+            auth = re.search(r"RSN:.*?Authentication suites: ([^\n]*)", block, re.S)
+            suites = auth.group(1) if auth else ""
+            security = ("WPA3-SAE" if "SAE" in suites and "PSK" not in suites else
+                        "WPA3-Mix" if "SAE" in suites else
+                        "WPA2-EAP" if "802.1X" in suites else "WPA2-PSK")
+        elif "WPA:" in block:
+            security = "WPA-PSK"
+        elif re.search(r"capability:.*Privacy", block):
+            security = "WEP"
+        else:
+            security = "Open"
+
+        table[m.group(1)] = {
+            "ssid": ssid.group(1) if ssid else None,
+            "rssi_dbm": int(float(signal.group(1))) if signal else None,
+            "channel": channel,
+            "channel_band": band,
+            "channel_width": width,
+            "security": security,
+        }
+    return table
+
+
+def parse_iw_reg(text):
+    m = re.search(r"country (\w\w):", text)
+    return m.group(1) if m and m.group(1) != "00" else None
+
+
+class LinuxBackend(RadioBackend):
+    """nl80211 devices: wireless-extension ioctls and /proc/net/wireless per sample, `iw` only now and then."""
+    name = "linux"
+
+    def __init__(self, interface=None, station_interval_s=5.0):
+        super().__init__()
+        self.interface = interface or self._default_interface()
+        if not self.interface:
+            raise RadioError("no wireless interface found in /proc/net/wireless")
+        self.station_interval_s = station_interval_s
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.ifname = self.interface.encode()[:15]
+        self.station = {}
+        self.station_at = 0.0
+        self.station_bssid = None
+        self.auth_mode = None
+        self.auth_bssid = None
+        self.nic_mac = self._read(f"/sys/class/net/{self.interface}/address").strip() or None
+        self.country_code = parse_iw_reg(self._iw("reg", "get"))
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return f.read()
+        except OSError:
+            return ""
+
+    def _default_interface(self):
+        for line in self._read("/proc/net/wireless").splitlines()[2:]:
+            return line.split(":")[0].strip()
+        return None
+
+    def _iw(self, *args):
+        self.cost.spawns += 1
+        try:
+            return run_subprocess(["iw"] + list(args), capture_output=True, text=True, timeout=2).stdout
+        except (OSError, subprocess.SubprocessError):
+            return ""
+
+    def _ioctl(self, request, payload):
+        return fcntl.ioctl(self.sock.fileno(), request, struct.pack("16s16s", self.ifname, payload))
+
+    def bssid(self):
+        try:
+            res = self._ioctl(SIOCGIWAP, b"")
+        except OSError:
+            return None
+        mac = res[18:24]
+        return None if mac in (b"\x00" * 6, b"\xff" * 6, b"\x44" * 6) else ":".join(f"{b:02x}" for b in mac)
+
+    def essid(self):
+        buf = array("b", b"\x00" * 33)
+        addr, _ = buf.buffer_info()
+        try:
+            fcntl.ioctl(self.sock.fileno(), SIOCGIWESSID, struct.pack("16sPHH", self.ifname, addr, 33, 0))
+        except OSError:
+            return None
+        return buf.tobytes().rstrip(b"\x00").decode(errors="replace") or None
+
+    def freq_mhz(self):
+        try:
+            res = self._ioctl(SIOCGIWFREQ, b"")
+        except OSError:
+            return None
+        m, e = struct.unpack("ih", res[16:22])
+        if e == 0 and m < 1000:
+            return None  # Driver reported a channel number, not a frequency
+        return int(m * 10 ** e / 1e6)
+
+    def _sample_fast(self):
+        level, _noise = parse_proc_wireless(self._read("/proc/net/wireless"), self.interface)
+        return self.bssid(), level
+
+    def _scan(self):
+        # A triggered scan needs CAP_NET_ADMIN, otherwise fall back to the kernel's cached results
+        text = self._iw("dev", self.interface, "scan") or self._iw("dev", self.interface, "scan", "dump")
+        return parse_iw_scan(text)
+
+    def _security(self, bssid):
+        # nl80211 station info has no security, the associated BSS's RSN IE in the kernel's scan cache does
+        # (`scan dump` needs no privileges, and the BSS we're on is always in it)
+        if not bssid:
+            return None
+        return parse_iw_scan(self._iw("dev", self.interface, "scan", "dump")).get(bssid, {}).get("security")
+
+    def _sample(self):
+        bssid = self.bssid()
+        level, noise = parse_proc_wireless(self._read("/proc/net/wireless"), self.interface)
+        # Station info (tx rate, PHY, width) needs iw: refresh on a roam or every station_interval_s
+        now = time.monotonic()
+        if bssid != self.station_bssid or now - self.station_at >= self.station_interval_s:
+            self.station = parse_iw_link(self._iw("dev", self.interface, "link"))
+            self.station_at, self.station_bssid = now, bssid
+            # Security only changes with the BSS, looked up again until the cache has it
+            if bssid != self.auth_bssid or self.auth_mode is None:
+                self.auth_mode, self.auth_bssid = self._security(bssid), bssid
+        freq = self.freq_mhz() or self.station.get("freq")
+        channel, band = freq_to_channel(freq)
+        phy = self.station.get("phy_mode") or ({"2.4GHz": "11g", "5GHz": "11a"}.get(band) if bssid else None)
+        return {
+            "ssid": self.essid() or self.station.get("ssid"),
+            "bssid": bssid or self.station.get("bssid"),
+            "channel": channel,
+            "rssi_dbm": level if level is not None else self.station.get("rssi_dbm"),
+            "noise_dbm": noise,
+            "tx_rate_mbps": self.station.get("tx_rate_mbps"),
+            "phy_mode": phy,
+            "auth_mode": self.auth_mode if bssid else None,
+            "nic_mac": self.nic_mac,
+            "country_code": self.country_code,
+            "channel_band": band,
+            "channel_width": self.station.get("channel_width", "Unknown"),
+        }
+
+
+# --- Tests / replay ---
+class SyntheticBackend(RadioBackend):
+    """Deterministic fake radio: RSSI random walk across a few APs, roaming when the signal drops."""
+    name = "synthetic"
+
+    def __init__(self, seed=1, ssid="survey-lab", bssids=None, roam_below_dbm=-75, clock=time.monotonic):
+        super().__init__()
+        self.rng = random.Random(seed)
+        self.ssid = ssid
+        self.bssids = bssids or ["02:00:00:00:00:%02x" % i for i in range(1, 5)]
+        self.roam_below_dbm = roam_below_dbm
+        self.clock = clock
+        self.ap = 0
+        self.rssi = -50.0
+        self.last_t = None
+
+    def _step(self):
+        # Advance the walk by elapsed time, so the result doesn't depend on the sample rate
+        now = self.clock()
+        dt = 0.0 if self.last_t is None else now - self.last_t
+        self.last_t = now
+        steps = max(1, int(dt * 10))
+        for _ in range(steps):
+            self.rssi += self.rng.gauss(-0.05, 0.6)
+            self.rssi = max(-90.0, min(-30.0, self.rssi))
+        if self.rssi < self.roam_below_dbm:
+            self.ap = (self.ap + 1) % len(self.bssids)
+            self.rssi = self.rng.uniform(-55, -45)
+
+    def _sample_fast(self):
+        self._step()
+        return self.bssids[self.ap], int(self.rssi)
+
+    def _sample(self):
+        bssid, rssi = self._sample_fast()
+        channel = [36, 52, 100, 149][self.ap % 4]
+        return {
+            "ssid": self.ssid, "bssid": bssid, "channel": channel,
+            "rssi_dbm": rssi, "noise_dbm": -92 + self.rng.randint(-2, 2),
+            "tx_rate_mbps": max(6, int((rssi + 95) * 20)), "phy_mode": "11ax", "auth_mode": "WPA3-SAE",
+            "nic_mac": "02:00:00:00:ff:01", "country_code": "SE",
+            "channel_band": "5GHz", "channel_width": "80MHz",
+        }
+
+    def _scan(self):
+        # Our own APs plus some neighbors that drift in and out of range
+        table = {}
+        for i, bssid in enumerate(self.bssids):
+            rssi = int(self.rssi) if i == self.ap else self.rng.randint(-88, -60)
+            table[bssid] = {"ssid": self.ssid, "rssi_dbm": rssi, "channel": [36, 52, 100, 149][i % 4],
+                            "channel_band": "5GHz", "channel_width": "80MHz", "security": "WPA3-SAE"}
+        for i in range(12):
+            if self.rng.random() < 0.8:
+                table["02:00:00:00:01:%02x" % i] = {
+                    "ssid": f"neighbor-{i // 3}", "rssi_dbm": -70 - (i * 2) + self.rng.randint(-3, 3),
+                    "channel": [1, 6, 11, 44][i % 4], "channel_band": "2.4GHz" if i % 4 < 3 else "5GHz",
+                    "channel_width": "20MHz", "security": "WPA2-PSK"}
+        return table
+
+
+BACKENDS = {"corewlan": CoreWLANBackend, "linux": LinuxBackend, "synthetic": SyntheticBackend}
+
+
+def open_backend(name="auto", interface=None):
+    if name == "auto":
+        name = "corewlan" if sys.platform == "darwin" else "linux"
+    if name == "linux":
+        return LinuxBackend(interface)
+    if name in BACKENDS:
+        return BACKENDS[name]()
+    raise RadioError(f"unknown radio backend '{name}' (choose from auto, {', '.join(BACKENDS)})")
+
+
+if __name__ == "__main__":
+    # Quick look at a backend and what it costs: python3 radio.py [backend] [samples]
+    backend = open_backend(sys.argv[1] if len(sys.argv) > 1 else "auto", os.environ.get("WIFI_INTERFACE"))
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    for _ in range(n):
+        backend.sample_fast()
+    print(backend.sample())
+    print(backend.cost.summary())
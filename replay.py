@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# Replay and simulation for wifi-survey.py --replay / --simulate.
+#
+# Recorded (or synth_survey.py generated) records are split back into the sources that measured
+# them (wifi, net, icmp_lan, iperf_rx...) and replayed at the time each source was measured (record
+# epoch minus its age_<source>_ms). The radio, ping and app probe samples go through the survey's own
+# tasks, with ReplayRadio / ReplayPinger / ReplayAppEngine standing in for the real ones. From there the
+# normal path builds, logs, exports and shows the records, on a virtual clock the replay moves forward.
+# No radio, ping, iperf or subprocess is touched, so it runs the same on any machine.
+import time
+
+from radio import RadioBackend
+from icmp_engine import PingResult
+from app_probes import AppResult
+from survey_schema import ICMP_SUFFIX_TYPES, APP_SUFFIX_TYPES, NEIGHBOR_SUMMARY_FIELDS
+from survey_log import segment_paths, iter_segment
+from synth_survey import generate_records
+
+WIFI_FIELDS = ["ssid", "bssid", "channel", "rssi_dbm", "noise_dbm", "tx_rate_mbps", "phy_mode", "auth_mode",
+               "nic_mac", "country_code", "channel_band", "channel_width"]
+FIXED_SOURCES = {
+    **{f: "wifi" for f in WIFI_FIELDS},
+    **{f: "scan" for f in NEIGHBOR_SUMMARY_FIELDS},
+    "nic_ip": "net", "nic_gw_ip": "net", "nic_dns": "net", "nic_reip_ms": "reip",
+    "location": "location", "x": "location", "y": "location",
+    "iperf_rx_mbps": "iperf_rx", "iperf_rx_min_mbps": "iperf_rx", "iperf_error": "iperf_rx",
+    "iperf_jitter_ms": "iperf_rx", "iperf_lost_pct": "iperf_rx",
+    "iperf_tx_mbps": "iperf_tx", "iperf_tx_min_mbps": "iperf_tx",
+}
+# Computed when the record is built, never fed back
+DERIVED = {"epoch", "timestamp", "bss_transition", "snr", "stale", "under_load"}
+# Checked against the recorded value by --check
+CHECKED = ("bss_transition", "snr")
+
+
+class ReplayClock:
+    """Virtual time with the time module's interface, moved forward by the replay. Millisecond resolution,
+    like the recorded epochs, so ages come out exactly as recorded."""
+
+    def __init__(self, epoch=0.0):
+        self.epoch_ms = round(epoch * 1000)
+
+    def set(self, epoch):
+        # Never backwards, a record out of order is replayed at the current time. Returns monotonic_ns().
+        self.epoch_ms = max(self.epoch_ms, round(epoch * 1000))
+        return self.epoch_ms * 1_000_000
+
+    def time(self):
+        return self.epoch_ms / 1000
+
+    def monotonic(self):
+        return self.epoch_ms / 1000
+
+    def monotonic_ns(self):
+        return self.epoch_ms * 1_000_000
+
+
+# --- Stand-ins ---
+# The survey's sources, answering with the recorded values of the record being replayed
+class ReplayRadio(RadioBackend):
+    name = "replay"
+
+    def __init__(self):
+        super().__init__()
+        self.current = {f: None for f in WIFI_FIELDS}
+
+    def feed(self, record):
+        self.current = {f: record.get(f) for f in WIFI_FIELDS}
+
+    def _sample(self):
+        return dict(self.current)
+
+
+class RecordedPing(PingResult):
+    __slots__ = ("recorded",)
+
+    def __init__(self, prefix, record, count):
+        lost = record.get(f"icmp_{prefix}_lost")
+        received = round(count * (100 - lost) / 100) if lost is not None else 0
+        avg = record.get(f"icmp_{prefix}_ms")
+        super().__init__(prefix, sent=count, rtts=[avg] * received if avg is not None else [])
+        self.recorded = {"avg": avg, "lost": lost, **{k: record.get(f"icmp_{prefix}_{k}_ms")
+                                                      for k in ("min", "p95", "max", "jitter")}}
+
+    def stats(self):
+        return self.recorded
+
+
+class ReplayPinger:
+    """IcmpEngine interface, targets are the recorded prefixes (lan, wan, extra targets)."""
+
+    def __init__(self):
+        self.record = {}
+
+    def feed(self, record):
+        self.record = record
+
+    async def probe_many(self, targets, count):
+        return {prefix: RecordedPing(prefix, self.record, count) for prefix in targets}
+
+    def close(self):
+        pass
+
+
+class ReplayAppEngine:
+    """AppProbeEngine interface, probes are the recorded app_<name> columns."""
+
+    def __init__(self):
+        self.record = {}
+
+    def feed(self, record):
+        self.record = record
+
+    async def probe_many(self, probes, hosts=None):
+        results = {}
+        for name, probe in probes.items():
+            r = results[name] = AppResult(name, probe.kind)
+            for attr in ("ms", "connect_ms", "total_ms", "status", "rcode", "error"):
+                setattr(r, attr, self.record.get(f"app_{name}_{attr}"))
+        return results
+
+    def close(self):
+        pass
+
+
+def _strip_suffix(field, suffixes):
+    for suffix in sorted(suffixes, key=len, reverse=True):
+        if field.endswith("_" + suffix):
+            return field[:-len(suffix) - 1]
+    return None
+
+
+def field_source(field):
+    # Which store source a logged column came from, None for computed columns
+    if field in DERIVED or field.startswith("age_"):
+        return None
+    if field in FIXED_SOURCES:
+        return FIXED_SOURCES[field]
+    if field.startswith("icmp_"):
+        return "loaded" if "_loaded_" in field else _strip_suffix(field, ICMP_SUFFIX_TYPES) or "replay"
+    if field.startswith("app_"):
+        return _strip_suffix(field, APP_SUFFIX_TYPES) or "replay"
+    return "replay"  # Unknown columns still make it into the store (and the record, if the schema has them)
+
+
+def source_map(columns):
+    # {source: [fields]} for a record layout
+    sources = {}
+    for field in columns:
+        src = field_source(field)
+        if src:
+            sources.setdefault(src, []).append(field)
+    return sources
+
+
+def view_targets(columns):
+    # Extra ping targets and app probes of a recorded layout, for the live view
+    pings = [c[5:-6] for c in columns if c.startswith("icmp_") and c.endswith("_count")]
+    apps = {}
+    for c in columns:
+        if c.startswith("app_") and c.endswith("_error"):
+            name = c[4:-6]
+            apps[name] = "http" if f"app_{name}_status" in columns else "dns" if f"app_{name}_rcode" in columns else "tcp"
+    return [p for p in pings if p not in ("lan", "wan")], apps
+
+
+def measured_at(record, sources):
+    # {source: (measured epoch ms, values)}, the epoch for sources without an age column (location, unknown
+    # columns). Sources that have an age column but no age yet (never measured) are left out.
+    epoch_ms = round(record["epoch"] * 1000)
+    measured = {}
+    for src, fields in sources.items():
+        age_ms = record.get(f"age_{src}_ms")
+        if age_ms is None and f"age_{src}_ms" in record:
+            continue
+        measured[src] = (epoch_ms - int(age_ms or 0), {f: record.get(f) for f in fields})
+    return measured
+
+
+def iter_recorded(path):
+    # Records of a survey directory or .jsonl (JSONL or binary segments), event lines skipped
+    for seg in segment_paths(path):
+        for record in iter_segment(seg):
+            if "event" not in record and record.get("epoch") is not None:
+                yield record
+
+
+def iter_scenario(records, seed=1, interval_s=2.0):
+    # A synthetic walk (synth_survey.py): locations, roams, dropouts, ping loss and iperf tests.
+    # Same seed, same records, starting at the same fixed epoch.
+    return generate_records(records, seed, interval_s=interval_s)
+
+
+class Pacer:
+    """How long to wait before a record so virtual time runs speed times faster than real time, speed 0 never waits."""
+
+    def __init__(self, speed):
+        self.speed = speed
+        self.first_epoch = None
+        self.t0 = None
+
+    def delay_s(self, epoch):
+        if not self.speed:
+            return 0.0
+        if self.first_epoch is None:
+            self.first_epoch, self.t0 = epoch, time.monotonic()
+        return (epoch - self.first_epoch) / self.speed - (time.monotonic() - self.t0)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# High-rate roam capture: samples BSSID/RSSI at 20-50 Hz into a fixed-size ring buffer and
+# writes one event per roam to a separate stream, timed with monotonic nanoseconds.
+#
+# Each event carries the pre-roam RSSI trend, the disassociation gap and, once they arrive,
+# the time to the first successful ping and the time until the IP was confirmed.
+import json
+import time
+import threading
+from array import array
+
+TREND_WINDOW_S = 3.0
+FOLLOWUP_TIMEOUT_S = 10.0  # Give up waiting for ping/IP after this long
+NO_RSSI = -32768  # Stored for a sample without RSSI, 0 would read as a very strong signal
+
+
+class RingBuffer:
+    # Preallocated columns, no per-sample allocation besides the bssid reference
+    def __init__(self, size):
+        self.size = size
+        self.t_ns = array("q", [0] * size)
+        self.rssi = array("h", [0] * size)
+        self.bssid = [None] * size
+        self.count = 0
+
+    def append(self, t_ns, bssid, rssi):
+        i = self.count % self.size
+        self.t_ns[i] = t_ns
+        self.rssi[i] = rssi if rssi is not None else NO_RSSI
+        self.bssid[i] = bssid
+        self.count += 1
+
+    def since(self, t_ns):
+        # Samples newer than t_ns, oldest first, rssi None where it was missing
+        out = []
+        for k in range(max(0, self.count - self.size), self.count):
+            i = k % self.size
+            if self.t_ns[i] >= t_ns:
+                rssi = self.rssi[i]
+                out.append((self.t_ns[i], self.bssid[i], rssi if rssi != NO_RSSI else None))
+        return out
+
+
+def rssi_trend(samples):
+    # Least squares slope in dB/s over (t_ns, rssi) pairs, samples without RSSI left out
+    samples = [(t, r) for t, r in samples if r is not None]
+    if len(samples) < 2:
+        return None
+    ts = [(t - samples[0][0]) / 1e9 for t, _ in samples]
+    ys = [r for _, r in samples]
+    mt, my = sum(ts) / len(ts), sum(ys) / len(ys)
+    den = sum((t - mt) ** 2 for t in ts)
+    return round(sum((t - mt) * (y - my) for t, y in zip(ts, ys)) / den, 2) if den else None
+
+
+class RoamCapture:
+    def __init__(self, sample_fn, out_path, hz=25, buffer_s=10, on_roam=None, context_fn=None):
+        self.sample_fn = sample_fn      # () -> (bssid, rssi), must be cheap
+        self.out_path = out_path
+        self.period_ns = int(1e9 / hz)
+        self.buffer = RingBuffer(int(hz * buffer_s))
+        self.on_roam = on_roam          # (monotonic_ns) called from the capture thread
+        self.context_fn = context_fn    # () -> dict merged into each event (e.g. location)
+        self.lock = threading.Lock()
+        self.pending = []               # Events waiting for their first ping / IP
+        self.last_bssid = None
+        self.last_seen_ns = None        # Last sample still associated to last_bssid
+        self.events = 0
+        self.sample_errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._out = None
+
+    def start(self):
+        self._out = open(self.out_path, "a")
+        self._thread = threading.Thread(target=self._run, name="roam-capture", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+        with self.lock:
+            for event in self.pending:
+                self._write(event)
+            self.pending = []
+        if self._out:
+            self._out.close()
+
+    # --- Hooks from the rest of the survey (any thread) ---
+    def note_ping(self, t_ns):
+        with self.lock:
+            for event in self.pending:
+                if event["first_ping_ms"] is None and t_ns >= event["_roam_ns"]:
+                    event["first_ping_ms"] = round((t_ns - event["_roam_ns"]) / 1e6, 1)
+            self._flush_done(t_ns)
+
+    def note_ip(self, t_ns):
+        with self.lock:
+            for event in self.pending:
+                if event["ip_ms"] is None and t_ns >= event["_roam_ns"]:
+                    event["ip_ms"] = round((t_ns - event["_roam_ns"]) / 1e6, 1)
+            self._flush_done(t_ns)
+
+    # --- Capture thread ---
+    def _run(self):
+        next_ns = time.monotonic_ns()
+        while not self._stop.is_set():
+            now = time.monotonic_ns()
+            try:
+                bssid, rssi = self.sample_fn()
+            except Exception:
+                self.sample_errors += 1
+                bssid, rssi = None, None
+            self.buffer.append(now, bssid, rssi)
+            self._track(now, bssid, rssi)
+
+            # Fixed-rate deadlines, skip ahead rather than burst after a stall
+            next_ns += self.period_ns
+            if next_ns < now:
+                next_ns = now + self.period_ns
+            self._stop.wait((next_ns - time.monotonic_ns()) / 1e9)
+
+    def _track(self, now, bssid, rssi):
+        if bssid and self.last_bssid and bssid != self.last_bssid:
+            self._roamed(now, bssid, rssi)
+        if bssid:
+            self.last_bssid = bssid
+            self.last_seen_ns = now
+        with self.lock:
+            self._flush_done(now)
+
+    def _roamed(self, now, bssid, rssi):
+        pre = [(t, r) for t, b, r in self.buffer.since(now - int(TREND_WINDOW_S * 1e9))
+               if b == self.last_bssid and r is not None]
+        event = {
+            "epoch": round(time.time(), 3),
+            "mono_ns": now,
+            "from_bssid": self.last_bssid,
+            "to_bssid": bssid,
+            "pre_rssi_last": pre[-1][1] if pre else None,
+            "pre_rssi_min": min(r for _, r in pre) if pre else None,
+            "pre_rssi_trend_db_s": rssi_trend(pre),
+            "post_rssi": rssi,
+            # Last sample on the old BSS to first sample on the new one, covers any disassociated samples
+            "gap_ms": round((now - self.last_seen_ns) / 1e6, 1) if self.last_seen_ns else None,
+            "first_ping_ms": None,
+            "ip_ms": None,
+            "_roam_ns": now,
+        }
+        if self.context_fn:
+            event.update(self.context_fn())
+        with self.lock:
+            self.pending.append(event)
+        self.events += 1
+        if self.on_roam:
+            self.on_roam(now)
+
+    def _flush_done(self, now):
+        # Caller holds self.lock
+        keep = []
+        for event in self.pending:
+            complete = event["first_ping_ms"] is not None and event["ip_ms"] is not None
+            if complete or now - event["_roam_ns"] > FOLLOWUP_TIMEOUT_S * 1e9:
+                self._write(event)
+            else:
+                keep.append(event)
+        self.pending = keep
+
+    def _write(self, event):
+        self._out.write(json.dumps({k: v for k, v in event.items() if not k.startswith("_")}) + "\n")
+        self._out.flush()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# Online rollups for long unattended runs: 1-minute and 1-hour summaries kept next to the raw log.
+#
+#   survey_<START>_running/rollup_1m.jsonl   one row per minute
+#   survey_<START>_running/rollup_1h.jsonl   one row per hour
+#
+# Each row has min/avg/max/p50/p95 of the RF, ping, app probe and iperf values, ping loss totals,
+# roams and the time spent on every BSSID. Both tiers are computed straight from the records as
+# they are logged (exact percentiles, nothing merged from the finer tier), and a row is written
+# when its period is over. Raw segments can then be pruned (raw_retention_h) and the rollups stay.
+#
+# Probe values repeat in every record until the next run, only new samples (the source's age
+# dropped) are counted. Pings that overlapped a throughput test ("under_load") are left out.
+import os
+import re
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import collections
+from datetime import datetime
+
+from icmp_engine import percentile
+from survey_log import segment_paths, iter_segment, fsync_dir
+
+TIERS = {"1m": 60, "1h": 3600}
+ROLLUP_FMT = "rollup_{}.jsonl"
+RF_METRICS = ["rssi_dbm", "snr", "tx_rate_mbps"]
+_STOP = object()
+
+
+def rollup_path(survey_dir, tier):
+    return os.path.join(survey_dir, ROLLUP_FMT.format(tier))
+
+
+def metric_sources(columns):
+    # Rolled up column -> source whose age tells a new sample from a repeated one (None: every record counts)
+    sources = {m: None for m in RF_METRICS}
+    for prefix in ping_prefixes(columns):
+        sources[f"icmp_{prefix}_ms"] = f"icmp_{prefix}"
+        if f"icmp_{prefix}_loaded_ms" in columns:
+            sources[f"icmp_{prefix}_loaded_ms"] = "loaded"
+    for name in app_names(columns):
+        sources[f"app_{name}_ms"] = f"app_{name}"
+    sources.update({"iperf_rx_mbps": "iperf_rx", "iperf_tx_mbps": "iperf_tx"})
+    return sources
+
+
+def ping_prefixes(columns):
+    return [c[5:-6] for c in columns if c.startswith("icmp_") and c.endswith("_count")]
+
+
+def app_names(columns):
+    return [c[4:-6] for c in columns if c.startswith("app_") and c.endswith("_error")]
+
+
+# --- Aggregation ---
+class Bucket:
+    """One period of one tier, the values kept until the period is over."""
+
+    def __init__(self, start, period_s):
+        self.start = start
+        self.period_s = period_s
+        self.samples = 0
+        self.roams = 0
+        self.values = collections.defaultdict(list)  # column -> new samples
+        self.pings = collections.defaultdict(lambda: [0, 0.0])  # prefix -> [sent, lost]
+        self.app_runs = collections.Counter()
+        self.app_failed = collections.Counter()
+        self.dwell = collections.Counter()  # bssid -> seconds
+        self.last = {}
+
+    def add(self, record, fresh, dwell):
+        self.samples += 1
+        self.roams += record.get("bss_transition") or 0
+        for col, value in fresh.items():
+            self.values[col].append(value)
+        for bssid, seconds in dwell:
+            self.dwell[bssid] += seconds
+        for key in ("location", "ssid", "bssid", "channel"):
+            if record.get(key) is not None:
+                self.last[key] = record[key]
+
+    def row(self, sources, prefixes, apps):
+        start = datetime.fromtimestamp(self.start)
+        row = {"period_start": self.start, "period_s": self.period_s,
+               "timestamp": start.strftime('%Y-%m-%d %H:%M:%S'), "samples": self.samples,
+               "location": self.last.get("location"), "ssid": self.last.get("ssid"), "channel": self.last.get("channel"),
+               "roams": self.roams, "bssid_count": len(self.dwell),
+               "bssid_top": self.dwell.most_common(1)[0][0] if self.dwell else self.last.get("bssid"),
+               "bssid_dwell": json.dumps({b: round(s, 1) for b, s in self.dwell.most_common()}) if self.dwell else None}
+        for col in sources:
+            vals = sorted(self.values.get(col, ()))
+            row.update({f"{col}_min": vals[0] if vals else None,
+                        f"{col}_avg": round(sum(vals) / len(vals), 2) if vals else None,
+                        f"{col}_max": vals[-1] if vals else None,
+                        f"{col}_p50": round(percentile(vals, 50), 2) if vals else None,
+                        f"{col}_p95": round(percentile(vals, 95), 2) if vals else None})
+        for prefix in prefixes:
+            sent, lost = self.pings.get(prefix, (0, 0.0))
+            row.update({f"icmp_{prefix}_sent": sent, f"icmp_{prefix}_lost_pkts": round(lost),
+                        f"icmp_{prefix}_loss_pct": round(100 * lost / sent, 2) if sent else None})
+        for name in apps:
+            row.update({f"app_{name}_runs": self.app_runs[name], f"app_{name}_failed": self.app_failed[name]})
+        row["iperf_tests"] = len(self.values.get("iperf_rx_mbps", ())) + len(self.values.get("iperf_tx_mbps", ()))
+        return row
+
+
+class Rollups:
+    """Incremental 1 m / 1 h rollups of a record stream. add() returns the rows of periods that just ended."""
+
+    def __init__(self, columns, tiers=TIERS, max_gap_s=10.0):
+        self.sources = metric_sources(columns)
+        self.prefixes = ping_prefixes(columns)
+        self.apps = app_names(columns)
+        self.tiers = dict(tiers)
+        self.max_gap_s = max_gap_s  # A longer gap between records (sleep, pause) is no dwell time
+        self.buckets = {}  # tier -> open Bucket
+        self.prev_ages = {}
+        self.prev = None  # (epoch, bssid) of the previous record
+
+    def _is_new(self, src, record):
+        # Age dropped since the previous record: a new sample. Sources without an age (old logs) always are.
+        age = record.get(f"age_{src}_ms")
+        if age is None:
+            return True
+        prev = self.prev_ages.get(src)
+        self.prev_ages[src] = age
+        return prev is None or age < prev
+
+    def _fresh(self, record):
+        # New samples in this record: column -> value, plus the probe sources that ran
+        tags = set((record.get("under_load") or "").split(","))
+        new = {src: self._is_new(src, record) for src in set(self.sources.values()) if src is not None}
+        fresh, runs = {}, set()
+        for col, src in self.sources.items():
+            value = record.get(col)
+            if col == "snr":
+                # Logged as 0 when the noise floor is missing
+                value = value if record.get("noise_dbm") is not None else None
+            if src is not None:
+                if not new[src] or src in tags:
+                    continue
+                if value is None and record.get(f"age_{src}_ms") is None:
+                    continue  # Not measured yet
+                runs.add(src)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                fresh[col] = value
+        return fresh, runs
+
+    def add(self, record):
+        epoch = record.get("epoch")
+        if epoch is None or "event" in record:
+            return []
+        fresh, runs = self._fresh(record)
+        dwell = []
+        if self.prev and self.prev[1] and 0 < epoch - self.prev[0] <= self.max_gap_s:
+            dwell.append((self.prev[1], epoch - self.prev[0]))
+        self.prev = (epoch, record.get("bssid"))
+
+        rows = []
+        for tier, period_s in self.tiers.items():
+            start = int(epoch // period_s * period_s)
+            bucket = self.buckets.get(tier)
+            if bucket is not None and bucket.start != start:
+                rows.append((tier, bucket.row(self.sources, self.prefixes, self.apps)))
+                bucket = None
+            if bucket is None:
+                bucket = self.buckets[tier] = Bucket(start, period_s)
+            bucket.add(record, fresh, dwell)
+            for prefix in self.prefixes:
+                if f"icmp_{prefix}" in runs and record.get(f"icmp_{prefix}_count"):
+                    sent = record[f"icmp_{prefix}_count"]
+                    bucket.pings[prefix][0] += sent
+                    bucket.pings[prefix][1] += sent * (record.get(f"icmp_{prefix}_lost") or 0) / 100
+            for name in self.apps:
+                if f"app_{name}" in runs:
+                    bucket.app_runs[name] += 1
+                    bucket.app_failed[name] += record.get(f"app_{name}_error") is not None
+        return rows
+
+    def flush(self):
+        # Rows of the periods still open, at the end of the survey
+        rows = [(tier, b.row(self.sources, self.prefixes, self.apps)) for tier, b in self.buckets.items()]
+        self.buckets.clear()
+        return rows
+
+
+# --- Writer ---
+class RollupWriter:
+    """Computes and appends the rollups on a background thread, like the log writer and the exporter."""
+
+    def __init__(self, survey_dir, columns, tiers=TIERS, max_gap_s=10.0, fsync=True):
+        self.dir = survey_dir
+        self.rollups = Rollups(columns, tiers, max_gap_s)
+        self.fsync = fsync
+        self.queue = queue.Queue()
+        self.rows = collections.Counter()  # tier -> rows written
+        self.error = None
+        self._files = {}
+        self._thread = threading.Thread(target=self._run, name="rollups", daemon=True)
+
+    def start(self):
+        # Created right away, so crash recovery knows this survey had rollups even before the first row
+        for tier in self.rollups.tiers:
+            self._files[tier] = open(rollup_path(self.dir, tier), "a")
+        self._thread.start()
+        return self
+
+    def add(self, record):
+        self.queue.put(record)
+
+    def _write(self, rows):
+        for tier, row in rows:
+            f = self._files[tier]
+            f.write(json.dumps(row) + "\n")
+            f.flush()
+            self.rows[tier] += 1
+
+    def _run(self):
+        try:
+            while True:
+                item = self.queue.get()
+                if item is _STOP:
+                    break
+                self._write(self.rollups.add(item))
+            self._write(self.rollups.flush())
+            for f in self._files.values():
+                if self.fsync:
+                    os.fsync(f.fileno())
+                f.close()
+            fsync_dir(self.dir)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+    def close(self, timeout_s=10.0):
+        # Before the survey directory is renamed, the partial last periods are written too
+        self.queue.put(_STOP)
+        self._thread.join(timeout_s)
+
+
+# --- Rebuilding ---
+def last_period(path):
+    # period_start of the last complete row of a rollup file, None if there is none
+    try:
+        with open(path, "rb") as f:
+            f.seek(max(0, os.path.getsize(path) - 65536))
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    for line in reversed(lines):
+        try:
+            return json.loads(line)["period_start"]
+        except (ValueError, KeyError):
+            continue
+    return None
+
+
+def rebuild(survey_dir, columns=None, tiers=TIERS, max_gap_s=10.0):
+    # Add the rows a crash lost (or all rows, for surveys logged without rollups) from the raw records
+    # still there. Returns {tier: rows added}.
+    resume = {}
+    for tier, period_s in tiers.items():
+        path = rollup_path(survey_dir, tier)
+        if os.path.exists(path):
+            # Cut a torn last line, then continue after the last complete period
+            with open(path, "rb+") as f:
+                data = f.read()
+                f.truncate(data.rfind(b"\n") + 1)
+        last = last_period(path)
+        resume[tier] = last + period_s if last is not None else None
+    records = (r for seg in segment_paths(survey_dir) for r in iter_segment(seg) if "event" not in r)
+    first = next(records, None)
+    if first is None:
+        return {tier: 0 for tier in tiers}
+    cols = list(columns or first)
+    rollups = Rollups(cols, tiers, max_gap_s)
+    added = collections.Counter()
+    files = {}
+    try:
+        def write(rows):
+            for tier, row in rows:
+                if resume[tier] is not None and row["period_start"] < resume[tier]:
+                    continue  # Already rolled up
+                if tier not in files:
+                    files[tier] = open(rollup_path(survey_dir, tier), "a")
+                files[tier].write(json.dumps(row) + "\n")
+                added[tier] += 1
+        write(rollups.add(first))
+        for record in records:
+            write(rollups.add(record))
+        write(rollups.flush())
+    finally:
+        for f in files.values():
+            f.close()
+    return {tier: added[tier] for tier in tiers}
+
+
+def iter_rollup(survey_dir, tier, start_epoch=None, end_epoch=None):
+    # Rollup rows with start_epoch <= period_start < end_epoch
+    try:
+        f = open(rollup_path(survey_dir, tier))
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if start_epoch is not None and row["period_start"] < start_epoch:
+                continue
+            if end_epoch is not None and row["period_start"] >= end_epoch:
+                break
+            yield row
+
+
+def parse_time(text):
+    # Epoch seconds, "2026-10-18 14:00" or "-6h" (relative to now)
+    m = re.match(r"^-(\d+(?:\.\d+)?)([smhd])$", text)
+    if m:
+        return time.time() - float(m.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[m.group(2)]
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+if __name__ == "__main__":
+    # python3 rollup.py cat <survey> [--tier 1h] [--from -6h] [--to ...]   |   rollup.py build <survey>
+    if len(sys.argv) >= 2 and sys.argv[1] == "build":
+        parser = argparse.ArgumentParser(prog="rollup.py build",
+                                         description="Compute missing rollups of a survey from its raw records.")
+        parser.add_argument("surveys", nargs="+")
+        args = parser.parse_args(sys.argv[2:])
+        for survey in args.surveys:
+            if not os.path.isdir(survey):
+                sys.exit(f"{survey}: rollups live in survey directories, not in single .jsonl logs")
+            added = rebuild(survey)
+            print(f"{survey}: " + ", ".join(f"{n} {tier} rows added" for tier, n in added.items()))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Print the rollups of a survey as JSON lines.")
+    parser.add_argument("command", choices=["cat"])
+    parser.add_argument("survey")
+    parser.add_argument("--tier", choices=list(TIERS), default="1m")
+    parser.add_argument("--from", dest="start", type=parse_time, help="epoch, ISO time or e.g. -6h")
+    parser.add_argument("--to", dest="end", type=parse_time)
+    args = parser.parse_args()
+    for row in iter_rollup(args.survey, args.tier, args.start, args.end):
+        sys.stdout.write(json.dumps(row) + "\n")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# Per-metric sample store: every value carries its source, sequence number and measurement time.
+#
+# Writers build a new field->Sample mapping and swap the reference (copy-on-write), so the
+# logger and live view read a consistent snapshot without ever taking the writer lock.
+import time
+import threading
+
+
+class Sample:
+    __slots__ = ("value", "seq", "measured_ns", "source")
+
+    def __init__(self, value, seq, measured_ns, source):
+        self.value = value
+        self.seq = seq
+        self.measured_ns = measured_ns
+        self.source = source
+
+
+class Snapshot:
+    __slots__ = ("samples", "taken_ns")
+
+    def __init__(self, samples, taken_ns):
+        self.samples = samples
+        self.taken_ns = taken_ns
+
+    def values(self):
+        return {k: s.value for k, s in self.samples.items()}
+
+    def get(self, field, default=None):
+        s = self.samples.get(field)
+        return s.value if s is not None else default
+
+    def source_ages_ms(self, now_ns=None):
+        # Age of the freshest sample per source, e.g. {"wifi": 312, "icmp_lan": 1200}
+        now_ns = now_ns or self.taken_ns
+        newest = {}
+        for s in self.samples.values():
+            if s.measured_ns > newest.get(s.source, -1):
+                newest[s.source] = s.measured_ns
+        return {src: int((now_ns - ns) / 1e6) for src, ns in newest.items()}
+
+    def stale_sources(self, max_age_s, now_ns=None):
+        # max_age_s maps a source or source prefix ("icmp" covers "icmp_lan") to seconds
+        stale = []
+        for src, age_ms in self.source_ages_ms(now_ns).items():
+            limit = max_age_s.get(src, max_age_s.get(src.split("_")[0]))
+            if limit is not None and age_ms > limit * 1000:
+                stale.append(src)
+        return sorted(stale)
+
+
+class SampleStore:
+    def __init__(self, clock_ns=time.monotonic_ns, lock_observer=None):
+        self.clock_ns = clock_ns
+        self.lock_observer = lock_observer  # (source, wait_ns, hold_ns) after each update
+        self._samples = {}
+        self._write_lock = threading.Lock()  # Serializes writers only, readers never take it
+
+    def update(self, source, values, measured_ns=None):
+        measured_ns = measured_ns or self.clock_ns()
+        t0 = time.perf_counter_ns()
+        with self._write_lock:
+            t1 = time.perf_counter_ns()
+            samples = dict(self._samples)
+            for field, value in values.items():
+                prev = samples.get(field)
+                samples[field] = Sample(value, prev.seq + 1 if prev else 1, measured_ns, source)
+            self._samples = samples  # Atomic reference swap
+        if self.lock_observer:
+            self.lock_observer(source, t1 - t0, time.perf_counter_ns() - t1)
+
+    def snapshot(self):
+        return Snapshot(self._samples, self.clock_ns())
+
+    def get(self, field, default=None):
+        s = self._samples.get(field)
+        return s.value if s is not None else default
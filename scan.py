@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# Background neighbor (BSS) scans: every visible AP with RSSI, channel, width and security.
+#
+# Scans take seconds of radio time, so they run off the event loop on their own schedule,
+# back off while a throughput test is running, and results are cached with a TTL (a single
+# scan often misses a few APs). The log stores each table as a delta against the previous one.
+import sys
+import csv
+import json
+import time
+import asyncio
+
+NEIGHBOR_FIELDS = ["ssid", "rssi_dbm", "channel", "channel_band", "channel_width", "security"]
+KEYFRAME_EVERY = 20  # Full table every N scans, so a truncated log can still be decoded
+
+
+# --- Cache ---
+class NeighborCache:
+    def __init__(self, ttl_s=180, clock_ns=time.monotonic_ns):
+        self.ttl_ns = int(ttl_s * 1e9)
+        self.clock_ns = clock_ns
+        self.entries = {}  # bssid -> (entry, last_seen_ns)
+
+    def merge(self, results, now_ns=None):
+        now_ns = now_ns or self.clock_ns()
+        for bssid, entry in results.items():
+            self.entries[bssid] = (entry, now_ns)
+        self.expire(now_ns)
+
+    def expire(self, now_ns=None):
+        now_ns = now_ns or self.clock_ns()
+        self.entries = {b: e for b, e in self.entries.items() if now_ns - e[1] <= self.ttl_ns}
+
+    def table(self):
+        return {bssid: entry for bssid, (entry, _seen) in self.entries.items()}
+
+    def summary(self):
+        table = self.table()
+        rssi = [e["rssi_dbm"] for e in table.values() if e.get("rssi_dbm") is not None]
+        return {"neighbor_count": len(table),
+                "neighbor_ssids": len({e.get("ssid") for e in table.values()}),
+                "neighbor_best_rssi_dbm": max(rssi) if rssi else None}
+
+
+# --- Delta encoding ---
+def diff_tables(prev, curr):
+    # Only what changed: new BSSs in full, changed fields of known ones, and the ones that went away
+    add, chg = {}, {}
+    for bssid, entry in curr.items():
+        old = prev.get(bssid)
+        if old is None:
+            add[bssid] = entry
+        else:
+            fields = {k: v for k, v in entry.items() if old.get(k) != v}
+            if fields:
+                chg[bssid] = fields
+    gone = sorted(b for b in prev if b not in curr)
+    return {"add": add, "chg": chg, "del": gone}
+
+
+def apply_diff(table, delta):
+    table = dict(table)
+    for bssid in delta.get("del", []):
+        table.pop(bssid, None)
+    for bssid, fields in delta.get("chg", {}).items():
+        table[bssid] = {**table.get(bssid, {}), **fields}
+    table.update(delta.get("add", {}))
+    return table
+
+
+class NeighborLog:
+    def __init__(self, path, keyframe_every=KEYFRAME_EVERY, csv_path=None):
+        self.path = path
+        self.keyframe_every = keyframe_every
+        self.prev = {}
+        self.seq = 0
+        self.bytes = 0
+        self.full_bytes = 0  # What the same tables would have cost without delta encoding
+        self._out = open(path, "a")
+        self._csv = CsvExport(csv_path) if csv_path else None
+
+    def write(self, table, context=None):
+        key = self.seq % self.keyframe_every == 0
+        delta = diff_tables({} if key else self.prev, table)
+        meta = {"epoch": round(time.time(), 3), "seq": self.seq, **(context or {})}
+        line = json.dumps({**meta, "key": int(key), **delta}) + "\n"
+        self._out.write(line)
+        self._out.flush()
+        self.bytes += len(line)
+        self.full_bytes += len(json.dumps(table)) + 1
+        if self._csv:
+            self._csv.write(meta, table)
+        self.prev = table
+        self.seq += 1
+
+    def close(self):
+        self._out.close()
+        if self._csv:
+            self._csv.close()
+
+
+def iter_tables(path):
+    # Rebuild the full neighbor table after every scan, yields (line without the delta, table)
+    table = {}
+    with open(path) as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Torn last line
+            table = apply_diff({} if rec.get("key") else table, rec)
+            yield {k: v for k, v in rec.items() if k not in ("add", "chg", "del")}, table
+
+
+# --- Scheduler ---
+class NeighborScanner:
+    def __init__(self, scan_fn, cache, log=None, interval_s=60, busy_fn=None, backoff_max_s=300,
+                 context_fn=None, on_scan=None, clock_ns=time.monotonic_ns):
+        self.scan_fn = scan_fn          # Blocking, returns {bssid: entry}, run in a worker thread
+        self.cache = cache
+        self.log = log
+        self.interval_ns = int(interval_s * 1e9)
+        self.busy_fn = busy_fn          # () -> True while scanning would disturb a measurement
+        self.backoff_max_ns = int(backoff_max_s * 1e9)
+        self.context_fn = context_fn    # () -> dict stored with each scan (e.g. location)
+        self.on_scan = on_scan          # (summary) after each scan
+        self.clock_ns = clock_ns
+        self.next_ns = 0
+        self.backoff_ns = int(1e9)
+        self.running = None
+        self.scans = 0
+        self.deferred = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_duration_ms = None
+
+    async def tick(self):
+        # Cheap, call it often (every second): starts a scan in the background when one is due
+        now = self.clock_ns()
+        if (self.running and not self.running.done()) or now < self.next_ns:
+            return
+        if self.busy_fn and self.busy_fn():
+            # Exponential back-off while busy, so we don't scan the moment a test ends and another begins
+            self.deferred += 1
+            self.next_ns = now + self.backoff_ns
+            self.backoff_ns = min(self.backoff_ns * 2, self.backoff_max_ns)
+            return
+        self.backoff_ns = int(1e9)
+        self.running = asyncio.get_running_loop().create_task(self._scan())
+
+    async def _scan(self):
+        began = self.clock_ns()
+        try:
+            results = await asyncio.to_thread(self.scan_fn)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            results = None
+        finished = self.clock_ns()
+        self.next_ns = finished + self.interval_ns
+        self.last_duration_ms = round((finished - began) / 1e6)
+        if results is None:
+            return
+        self.scans += 1
+        self.cache.merge(results, finished)
+        table = self.cache.table()
+        if self.log:
+            context = {"scan_ms": self.last_duration_ms, **(self.context_fn() if self.context_fn else {})}
+            self.log.write(table, context)
+        if self.on_scan:
+            self.on_scan(self.cache.summary())
+
+    def cancel(self):
+        if self.running and not self.running.done():
+            self.running.cancel()
+
+    def stats(self):
+        out = {"scans": self.scans, "deferred": self.deferred, "errors": self.errors,
+               "last_duration_ms": self.last_duration_ms, "last_error": self.last_error}
+        if self.log and self.log.full_bytes:
+            out["log_ratio"] = round(self.log.bytes / self.log.full_bytes, 3)
+        return out
+
+
+# --- Export ---
+class CsvExport:
+    # One row per visible BSS per scan
+    def __init__(self, csv_path):
+        self.f = open(csv_path, "w", newline="", encoding="utf-8-sig")
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(["epoch", "seq", "location", "bssid"] + NEIGHBOR_FIELDS)
+        self.rows = 0
+
+    def write(self, meta, table):
+        for bssid in sorted(table):
+            entry = table[bssid]
+            self.writer.writerow([meta.get("epoch"), meta.get("seq"), meta.get("location"), bssid] +
+                                 [entry.get(k) for k in NEIGHBOR_FIELDS])
+        self.rows += len(table)
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def export_csv(log_path, csv_path):
+    out = CsvExport(csv_path)
+    for meta, table in iter_tables(log_path):
+        out.write(meta, table)
+    out.close()
+    return out.rows
+
+
+if __name__ == "__main__":
+    # python3 scan.py parse <iw scan output>   |   python3 scan.py export <neighbors.jsonl> [out.csv]
+    if len(sys.argv) < 3 or sys.argv[1] not in ("parse", "export"):
+        sys.exit("usage: scan.py parse <iw-scan.txt> | scan.py export <neighbors.jsonl> [out.csv]")
+    if sys.argv[1] == "parse":
+        from radio import parse_iw_scan
+        with open(sys.argv[2]) as f:
+            for bssid, entry in sorted(parse_iw_scan(f.read()).items(), key=lambda kv: -(kv[1]["rssi_dbm"] or -999)):
+                print(bssid, " ".join(f"{k}={entry[k]}" for k in NEIGHBOR_FIELDS))
+    else:
+        out = sys.argv[3] if len(sys.argv) > 3 else sys.argv[2].rsplit(".", 1)[0] + ".csv"
+        print(f"-> Saved {out} ({export_csv(sys.argv[2], out)} rows)")
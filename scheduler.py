@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# Single asyncio scheduler driving all periodic survey tasks from monotonic deadlines.
+#
+# Tick n of a task is due at start + n * interval, so a slow tick never pushes the
+# following ones back (no drift). Ticks that are missed entirely are skipped, not queued.
+# Adaptive tasks (interval_fn) instead run one current interval after their last deadline,
+# and can be woken early.
+import time
+import asyncio
+
+from icmp_engine import percentile
+
+JITTER_WINDOW = 1024  # lateness samples kept per task for the stats
+
+
+class TaskStats:
+    __slots__ = ("runs", "errors", "timeouts", "skipped", "last_error", "lateness_ms", "duration_ms", "max_lateness_ms")
+
+    def __init__(self):
+        self.runs = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.last_error = None
+        self.lateness_ms = []
+        self.duration_ms = []
+        self.max_lateness_ms = 0.0
+
+    def add(self, lateness_ms, duration_ms):
+        self.runs += 1
+        self.max_lateness_ms = max(self.max_lateness_ms, lateness_ms)
+        for buf, val in ((self.lateness_ms, lateness_ms), (self.duration_ms, duration_ms)):
+            buf.append(val)
+            if len(buf) > JITTER_WINDOW:
+                del buf[0]
+
+    def summary(self):
+        late = sorted(self.lateness_ms)
+        dur = sorted(self.duration_ms)
+        return {
+            "runs": self.runs, "errors": self.errors, "timeouts": self.timeouts, "skipped": self.skipped,
+            "lateness_avg_ms": round(sum(late) / len(late), 3) if late else None,
+            "lateness_p95_ms": round(percentile(late, 95), 3) if late else None,
+            "lateness_max_ms": round(self.max_lateness_ms, 3),
+            "duration_p95_ms": round(percentile(dur, 95), 3) if dur else None,
+            "last_error": self.last_error,
+        }
+
+
+class ScheduledTask:
+    def __init__(self, name, interval_s, fn, timeout_s=None, offset_s=0.0, interval_fn=None):
+        self.name = name
+        self.interval_ns = int(interval_s * 1e9)
+        self.fn = fn
+        self.timeout_s = timeout_s
+        self.offset_ns = int(offset_s * 1e9)
+        self.interval_fn = interval_fn  # () -> current interval in seconds
+        self.wake = asyncio.Event() if interval_fn else None
+        self.stats = TaskStats()
+        self.task = None
+
+
+class Scheduler:
+    def __init__(self, clock_ns=time.monotonic_ns, observer=None):
+        self.clock_ns = clock_ns
+        self.observer = observer  # (name, lateness_ms, duration_ms, outcome) after every run
+        self.tasks = {}
+        self.start_ns = None
+
+    def every(self, name, interval_s, fn, timeout_s=None, offset_s=0.0, interval_fn=None):
+        # fn is an async callable taking no arguments, timeout_s defaults to the interval
+        self.tasks[name] = ScheduledTask(name, interval_s, fn, timeout_s or interval_s, offset_s, interval_fn)
+        return self.tasks[name]
+
+    def wake(self, name):
+        # Run an adaptive task now instead of at its deadline (event loop thread only)
+        t = self.tasks.get(name)
+        if t and t.wake:
+            t.wake.set()
+
+    async def _sleep_until(self, deadline_ns, wake=None):
+        # True if woken before the deadline
+        delay = (deadline_ns - self.clock_ns()) / 1e9
+        if delay <= 0:
+            return False
+        if wake is None:
+            await asyncio.sleep(delay)
+            return False
+        try:
+            await asyncio.wait_for(wake.wait(), delay)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            wake.clear()
+
+    async def _run_task(self, t):
+        n = 0
+        deadline = self.start_ns + t.offset_ns
+        while True:
+            if await self._sleep_until(deadline, t.wake):
+                deadline = self.clock_ns()
+            began = self.clock_ns()
+            outcome = "ok"
+            try:
+                await asyncio.wait_for(t.fn(), timeout=t.timeout_s)
+            except asyncio.TimeoutError:
+                t.stats.timeouts += 1
+                outcome = "timeout"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                t.stats.errors += 1
+                t.stats.last_error = f"{type(e).__name__}: {e}"
+                outcome = type(e).__name__
+            finished = self.clock_ns()
+            t.stats.add((began - deadline) / 1e6, (finished - began) / 1e6)
+            if self.observer:
+                self.observer(t.name, (began - deadline) / 1e6, (finished - began) / 1e6, outcome)
+
+            if t.interval_fn:
+                # No grid: one interval (as it is now) after this deadline, right away if that's passed
+                deadline = max(deadline + int(t.interval_fn() * 1e9), finished)
+                continue
+
+            # Next deadline on the original grid, skipping any we already overran (finishing on one is in time)
+            n += 1
+            behind = (finished - (self.start_ns + t.offset_ns + n * t.interval_ns) - 1) // t.interval_ns
+            if behind >= 0:
+                t.stats.skipped += behind + 1
+                n += behind + 1
+            deadline = self.start_ns + t.offset_ns + n * t.interval_ns
+
+    async def run(self):
+        self.start_ns = self.clock_ns()
+        for t in self.tasks.values():
+            t.task = asyncio.create_task(self._run_task(t), name=t.name)
+        try:
+            await asyncio.gather(*(t.task for t in self.tasks.values()))
+        finally:
+            self.cancel()
+
+    def cancel(self):
+        for t in self.tasks.values():
+            if t.task and not t.task.done():
+                t.task.cancel()
+
+    def stats(self):
+        return {name: t.stats.summary() for name, t in self.tasks.items()}
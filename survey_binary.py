@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# Binary survey log segments: a schema header, then frames.
+#
+#   header   MAGIC, u32 length, JSON {"version", "columns": [[name, type], ...]}
+#   frame    1 byte kind, u32 payload length, payload
+#     S      new dictionary string: u32 id + UTF-8 (ids start at 1, 0 is null)
+#     R      record: fixed-width struct of every column + the inline strings (u8 length each, 255 = null)
+#     E      event line ("event" key, e.g. metrics), JSON
+#     X      footer, JSON {"records", "strings", "index": [[epoch, offset], ...]}
+#   trailer  u64 offset of the X frame + TRAILER_MAGIC, only on a cleanly closed segment
+#
+# Numbers are struct-packed (int32, float64) with a null sentinel, repeating strings (SSID, BSSID,
+# location...) are stored once and referenced by id. Every INDEX_EVERY records the epoch and offset
+# go into a sparse index, so a reader can mmap the file and jump to a time range.
+import os
+import sys
+import json
+import mmap
+import bisect
+import struct
+
+from survey_schema import field_type
+
+MAGIC = b"SRVYBIN1"
+TRAILER_MAGIC = b"SRVX"
+VERSION = 1
+EXT = ".srec"
+INDEX_EVERY = 256
+INLINE_STRINGS = {"timestamp"}  # Different in every record, a dictionary would only grow
+
+INT_NULL = -2 ** 31
+FLOAT_NULL = float("nan")
+STR_NULL = 0
+INLINE_NULL = 255
+TYPE_CODES = {"int": "i", "float": "d", "str": "I"}
+
+_U32 = struct.Struct("<I")
+_FRAME = struct.Struct("<cI")
+_TRAILER = struct.Struct("<Q4s")
+
+
+def is_binary(path):
+    return path.endswith(EXT)
+
+
+def column_kinds(columns):
+    # (name, kind) where kind is int, float, str (dictionary) or inline
+    return [(c, "inline" if c in INLINE_STRINGS else field_type(c)) for c in columns]
+
+
+def row_struct(kinds):
+    return struct.Struct("<" + "".join(TYPE_CODES[k] for _, k in kinds if k != "inline"))
+
+
+# --- Writing ---
+class Encoder:
+    """Turns record dicts into frames for one segment. Dictionary and index restart with every segment."""
+
+    def __init__(self, columns):
+        self.kinds = column_kinds(columns)
+        self.fixed = [(c, k) for c, k in self.kinds if k != "inline"]
+        self.inline = [c for c, k in self.kinds if k == "inline"]
+        self.row = row_struct(self.kinds)
+        self.strings = {}
+        self.records = 0
+        self.index = []
+        schema = json.dumps({"version": VERSION, "columns": [[c, k] for c, k in self.kinds]}).encode()
+        self._header = MAGIC + _U32.pack(len(schema)) + schema
+        self.offset = len(self._header)
+
+    def header(self):
+        return self._header
+
+    def _string_id(self, value, out):
+        sid = self.strings.get(value)
+        if sid is None:
+            sid = self.strings[value] = len(self.strings) + 1
+            payload = _U32.pack(sid) + value.encode()
+            out.append(_FRAME.pack(b"S", len(payload)) + payload)
+        return sid
+
+    def _pack(self, record, out):
+        values = []
+        for col, kind in self.fixed:
+            v = record.get(col)
+            if kind == "float":
+                values.append(FLOAT_NULL if v is None or isinstance(v, str) else float(v))
+            elif kind == "int":
+                try:
+                    v = int(v)
+                except (TypeError, ValueError):
+                    v = INT_NULL
+                values.append(v if INT_NULL < v < 2 ** 31 else INT_NULL)
+            else:
+                values.append(STR_NULL if v is None or v == "" else self._string_id(str(v), out))
+        data = self.row.pack(*values)
+        for col in self.inline:
+            v = record.get(col)
+            raw = b"" if v is None else str(v).encode()[:INLINE_NULL - 1]
+            data += bytes([INLINE_NULL]) if v is None else bytes([len(raw)]) + raw
+        return data
+
+    def encode(self, records):
+        out = []
+        for record in records:
+            if "event" in record:
+                payload = json.dumps(record).encode()
+                out.append(_FRAME.pack(b"E", len(payload)) + payload)
+                self.offset += len(out[-1])
+                continue
+            strings = []
+            payload = self._pack(record, strings)  # New strings go before the record that uses them
+            for frame in strings:
+                out.append(frame)
+                self.offset += len(frame)
+            if self.records % INDEX_EVERY == 0 and record.get("epoch") is not None:
+                self.index.append([record["epoch"], self.offset])
+            self.records += 1
+            out.append(_FRAME.pack(b"R", len(payload)) + payload)
+            self.offset += len(out[-1])
+        return b"".join(out)
+
+    def footer(self):
+        payload = json.dumps({"records": self.records, "strings": list(self.strings), "index": self.index}).encode()
+        return _FRAME.pack(b"X", len(payload)) + payload + _TRAILER.pack(self.offset, TRAILER_MAGIC)
+
+
+# --- Reading ---
+class BinaryReader:
+    """mmap reader for one segment. Opens closed segments from the footer, scans crashed or growing ones."""
+
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "rb")
+        size = os.fstat(self._f.fileno()).st_size
+        self.mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        if self.mm[:len(MAGIC)] != MAGIC or size < len(MAGIC) + 4:
+            self.close()
+            raise ValueError(f"{path}: not a binary survey log")
+        (n,) = _U32.unpack_from(self.mm, len(MAGIC))
+        schema = json.loads(self.mm[len(MAGIC) + 4:len(MAGIC) + 4 + n])
+        self.start = len(MAGIC) + 4 + n
+        self.kinds = [tuple(c) for c in schema["columns"]]
+        self.columns = [c for c, _ in self.kinds]
+        self.row = row_struct(self.kinds)
+        fixed = [k for _, k in self.kinds if k != "inline"]
+        self._floats = [i for i, k in enumerate(fixed) if k == "float"]
+        self._ints = [i for i, k in enumerate(fixed) if k == "int"]
+        self._strs = [i for i, k in enumerate(fixed) if k == "str"]
+        self._inline = [i for i, (_, k) in enumerate(self.kinds) if k == "inline"]  # Ascending, inserted in order
+        self.strings = [None]  # Id 0 is null
+        self.index = []
+        self.records = 0
+        self.complete = self._read_footer(size)
+        if not self.complete:
+            self._scan()
+
+    def _read_footer(self, size):
+        if size < self.start + _TRAILER.size:
+            return False
+        offset, magic = _TRAILER.unpack_from(self.mm, size - _TRAILER.size)
+        if magic != TRAILER_MAGIC or not self.start <= offset < size - _TRAILER.size:
+            return False
+        kind, n = _FRAME.unpack_from(self.mm, offset)
+        try:
+            footer = json.loads(self.mm[offset + _FRAME.size:offset + _FRAME.size + n])
+        except ValueError:
+            return False
+        self.end = offset
+        self.index = footer["index"]
+        self.records = footer["records"]
+        self.strings += footer["strings"]
+        return True
+
+    def _frames(self, offset, end=None):
+        # (kind, payload offset, payload length) of every complete frame from offset
+        end = len(self.mm) if end is None else end
+        mm = self.mm
+        while offset + _FRAME.size <= end:
+            kind, n = _FRAME.unpack_from(mm, offset)
+            pos = offset + _FRAME.size
+            if kind == b"X" or pos + n > end:
+                break
+            yield kind, pos, n
+            offset = pos + n
+
+    def _scan(self):
+        # No footer (crashed or still being written): walk the frame headers, the last partial frame ends it
+        self.end = self.start
+        for kind, pos, n in self._frames(self.start):
+            if kind == b"S":
+                self.strings.append(bytes(self.mm[pos + 4:pos + n]).decode())
+            elif kind == b"R":
+                if self.records % INDEX_EVERY == 0:
+                    epoch = self._decode(pos, n).get("epoch")
+                    if epoch is not None:
+                        self.index.append([epoch, pos - _FRAME.size])
+                self.records += 1
+            self.end = pos + n
+
+    def _decode(self, pos, n):
+        # Fixed part in one unpack, then nulls fixed up per type, column by column would be ~2x slower
+        values = list(self.row.unpack_from(self.mm, pos))
+        for i in self._floats:
+            if values[i] != values[i]:
+                values[i] = None
+        for i in self._ints:
+            if values[i] == INT_NULL:
+                values[i] = None
+        strings = self.strings
+        for i in self._strs:
+            values[i] = strings[values[i]]
+        inline = pos + self.row.size
+        for i in self._inline:
+            size = self.mm[inline]
+            if size == INLINE_NULL:
+                values.insert(i, None)
+                inline += 1
+            else:
+                values.insert(i, bytes(self.mm[inline + 1:inline + 1 + size]).decode(errors="replace"))
+                inline += 1 + size
+        return dict(zip(self.columns, values))
+
+    def seek(self, epoch):
+        # Offset of the indexed record at or before epoch, reading from there finds the first one >= epoch
+        i = bisect.bisect_right([e for e, _ in self.index], epoch) - 1
+        return self.index[i][1] if i >= 0 else self.start
+
+    def iter_records(self, offset=None, events=True):
+        # Records (and event lines) in file order from a frame offset, the default is the start
+        for kind, pos, n in self._frames(offset or self.start, self.end):
+            if kind == b"R":
+                yield self._decode(pos, n)
+            elif kind == b"E" and events:
+                yield json.loads(self.mm[pos:pos + n])
+
+    def time_range(self, start_epoch=None, end_epoch=None):
+        # Records with start_epoch <= epoch < end_epoch, only the frames in that range are decoded
+        offset = self.seek(start_epoch) if start_epoch is not None else self.start
+        for record in self.iter_records(offset, events=False):
+            epoch = record.get("epoch")
+            if start_epoch is not None and (epoch is None or epoch < start_epoch):
+                continue
+            if end_epoch is not None and epoch is not None and epoch >= end_epoch:
+                break
+            yield record
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_records(path, offset=None):
+    # All records and events of a segment, plus the offset after the last complete frame
+    with BinaryReader(path) as reader:
+        return list(reader.iter_records(offset)), reader.end
+
+
+def repair(path):
+    # Cut a crashed segment after its last complete frame. Returns (records, last epoch, bytes dropped).
+    try:
+        reader = BinaryReader(path)
+    except ValueError:
+        # Died before the header made it to disk
+        size = os.path.getsize(path)
+        with open(path, "wb"):
+            pass
+        return 0, None, size
+    with reader:
+        size = len(reader.mm)
+        if reader.complete:
+            end = size
+        else:
+            end = reader.end
+        last_epoch = None
+        if reader.index:
+            for record in reader.iter_records(reader.index[-1][1], events=False):
+                last_epoch = record.get("epoch") or last_epoch
+        records = reader.records
+    if end < size:
+        with open(path, "rb+") as f:
+            f.truncate(end)
+    return records, last_epoch, size - end
+
+
+if __name__ == "__main__":
+    # python3 survey_binary.py <segment.srec> [start_epoch end_epoch]   ->   JSON lines
+    if len(sys.argv) not in (2, 4):
+        sys.exit("usage: survey_binary.py <segment.srec> [start_epoch end_epoch]")
+    with BinaryReader(sys.argv[1]) as r:
+        rows = r.time_range(float(sys.argv[2]), float(sys.argv[3])) if len(sys.argv) == 4 else r.iter_records()
+        for record in rows:
+            sys.stdout.write(json.dumps(record) + "\n")
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# Crash-safe survey log: a directory of size/time-bounded JSONL segments plus a small manifest.
+#
+#   surveys/survey_<START>_running/      while the survey runs
+#       manifest.json
+#       seg_00000.jsonl, seg_00001.jsonl ...     (seg_00000.srec ... with log_format "binary")
+#   surveys/survey_<START>-<END>/        once finished (or recovered after a crash)
+#
+# Records are serialized and written on a background thread that group-commits whatever is
+# queued, with a configurable fsync policy. Readers treat a survey directory like one big .jsonl.
+import os
+import sys
+import glob
+import json
+import time
+import queue
+import socket
+import threading
+
+import survey_binary
+
+MANIFEST = "manifest.json"
+SEGMENT_FMT = "seg_{:05d}"
+SEGMENT_EXT = {"jsonl": ".jsonl", "binary": survey_binary.EXT}
+FSYNC_POLICIES = ("always", "interval", "never")
+_STOP = object()
+
+
+# --- Reading ---
+def segment_paths(path):
+    # A survey log is either a single .jsonl file or a segment directory
+    if os.path.isdir(path):
+        return sorted(p for ext in SEGMENT_EXT.values() for p in glob.glob(os.path.join(path, "seg_*" + ext)))
+    return [path]
+
+
+def iter_segment(path):
+    # Every record and event line of one segment as dicts, a torn last line is skipped
+    if survey_binary.is_binary(path):
+        with survey_binary.BinaryReader(path) as reader:
+            yield from reader.iter_records()
+        return
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def log_mtime(path):
+    return max((os.path.getmtime(p) for p in segment_paths(path)), default=os.path.getmtime(path))
+
+
+def find_logs(log_dir, running=False):
+    # Finished surveys in log_dir, single files and segment directories alike. A .jsonl next to
+    # the segment directory of the same name is its convert_logs.py --jsonl export, not another survey.
+    dirs = [p for p in glob.glob(os.path.join(log_dir, "survey_*")) if os.path.isdir(p)]
+    logs = [p for p in glob.glob(os.path.join(log_dir, "survey_*.jsonl")) if not os.path.isdir(p[:-len(".jsonl")])] + dirs
+    return sorted(p for p in logs if ("_running" in os.path.basename(p)) == running)
+
+
+def read_manifest(log_dir):
+    try:
+        with open(os.path.join(log_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(log_dir, manifest):
+    # Write to a temp file and rename, a crash leaves the old or the new manifest, never half of one
+    path = os.path.join(log_dir, MANIFEST)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_dir(log_dir)
+
+
+def fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# --- Writer ---
+class SegmentedLog:
+    def __init__(self, log_dir, start_epoch, segment_bytes=64 << 20, segment_s=3600, fsync="interval",
+                 fsync_interval_s=5.0, commit_interval_s=1.0, on_commit=None, fmt="jsonl", columns=None, retention_s=0,
+                 clock=time.monotonic):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync policy must be one of {', '.join(FSYNC_POLICIES)}")
+        if fmt not in SEGMENT_EXT:
+            raise ValueError(f"log format must be one of {', '.join(SEGMENT_EXT)}")
+        if fmt == "binary" and not columns:
+            raise ValueError("the binary log format needs the record columns")
+        self.dir = log_dir
+        self.fmt = fmt
+        self.columns = columns
+        self.segment_bytes = segment_bytes
+        self.segment_s = segment_s
+        self.fsync = fsync
+        self.fsync_interval_s = fsync_interval_s
+        self.commit_interval_s = commit_interval_s
+        self.on_commit = on_commit  # (records, seconds) after each group commit
+        self.retention_s = retention_s  # Closed segments older than this are deleted, 0 keeps everything
+        self.clock = clock  # Segment age for segment_s, a replay passes its virtual clock
+        self.pruned = 0
+        self.pruned_bytes = 0
+        self.manifest = {"version": 1, "start_epoch": start_epoch, "pid": os.getpid(), "host": socket.gethostname(),
+                         "format": fmt, "segments": [], "finished": False}
+        self.queue = queue.Queue()
+        self.records = 0
+        self.commits = 0
+        self.error = None
+        self._seg = None
+        self._seg_info = None
+        self._encoder = None
+        self._seg_opened = None
+        self._last_fsync = 0.0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+
+    def start(self):
+        os.makedirs(self.dir, exist_ok=True)
+        self._open_segment()
+        self._thread.start()
+        return self
+
+    def write(self, record):
+        # Any thread, never blocks on disk. Stamped now, so segment_s splits by when records were taken.
+        self.queue.put((self.clock(), record))
+
+    def close(self, timeout_s=10.0):
+        self.queue.put(_STOP)
+        self._thread.join(timeout_s)
+
+    def finalize(self, final_dir, end_epoch):
+        # After close(): record the end and give the directory its final name
+        self.manifest.update({"finished": True, "end_epoch": end_epoch})
+        write_manifest(self.dir, self.manifest)
+        os.rename(self.dir, final_dir)
+        fsync_dir(os.path.dirname(os.path.abspath(final_dir)))
+        self.dir = final_dir
+        return final_dir
+
+    # --- Writer thread ---
+    def _open_segment(self):
+        name = SEGMENT_FMT.format(len(self.manifest["segments"])) + SEGMENT_EXT[self.fmt]
+        self._seg = open(os.path.join(self.dir, name), "ab")
+        if self.fmt == "binary":
+            # Dictionary and time index are per segment, so every segment reads on its own
+            self._encoder = survey_binary.Encoder(self.columns)
+            self._seg.write(self._encoder.header())
+        self._seg_info = {"name": name, "records": 0, "bytes": 0, "first_epoch": None, "last_epoch": None}
+        self.manifest["segments"].append(self._seg_info)
+        self._seg_opened = None  # Write time of its first record
+        write_manifest(self.dir, self.manifest)
+
+    def _close_segment(self):
+        if self._seg is None:
+            return
+        if self._encoder:
+            self._seg.write(self._encoder.footer())
+        self._seg.flush()
+        if self.fsync != "never":
+            os.fsync(self._seg.fileno())
+        self._seg.close()
+        self._seg = None
+        if self.retention_s:
+            self._prune(self._seg_info["last_epoch"])
+        write_manifest(self.dir, self.manifest)
+
+    def _prune(self, newest_epoch):
+        # Whole closed segments only, whatever they hold must already be rolled up (see rollup.py)
+        if newest_epoch is None:
+            return
+        for info in self.manifest["segments"]:
+            if info is self._seg_info or info.get("pruned") or info["last_epoch"] is None:
+                continue
+            if info["last_epoch"] < newest_epoch - self.retention_s:
+                try:
+                    os.remove(os.path.join(self.dir, info["name"]))
+                except FileNotFoundError:
+                    pass
+                info["pruned"] = True
+                self.pruned += 1
+                self.pruned_bytes += info["bytes"]
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self.queue.get()
+            batch = [] if item is _STOP else [item]
+            stop = item is _STOP
+            # Group commit: collect what arrives within the commit interval, then one write + flush
+            deadline = time.monotonic() + self.commit_interval_s
+            while not stop:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+            if batch:
+                try:
+                    self._commit(batch)
+                except Exception as e:
+                    self.error = f"{type(e).__name__}: {e}"
+        try:
+            self._close_segment()
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+    def _commit(self, batch):
+        # batch is (write time, record). A segment gets no record written segment_s after its first one,
+        # the batch is split there, so a replay at any speed rotates where the survey did.
+        t0 = time.perf_counter()
+        count = len(batch)
+        while batch:
+            if self._seg is None:
+                self._open_segment()  # Opened on first write after a rotation, so no empty last segment
+            if self._seg_opened is None:
+                self._seg_opened = batch[0][0]
+            cut = next((i for i, (t, _) in enumerate(batch)
+                        if t - self._seg_opened >= self.segment_s and (i or self._seg_info["records"])), len(batch))
+            if cut:
+                self._write([record for _, record in batch[:cut]])
+            if cut < len(batch) and self._seg is not None:
+                self._close_segment()
+            batch = batch[cut:]
+        self.commits += 1
+        if self.on_commit:
+            self.on_commit(count, time.perf_counter() - t0)
+
+    def _write(self, batch):
+        if self._encoder:
+            data = self._encoder.encode(batch)
+        else:
+            data = "".join(json.dumps(r) + "\n" for r in batch).encode()
+        self._seg.write(data)
+        self._seg.flush()
+        now = time.monotonic()
+        if self.fsync == "always" or (self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval_s):
+            os.fsync(self._seg.fileno())
+            self._last_fsync = now
+
+        info = self._seg_info
+        epochs = [r["epoch"] for r in batch if "epoch" in r and "event" not in r]
+        if epochs:
+            info["first_epoch"] = info["first_epoch"] or epochs[0]
+            info["last_epoch"] = epochs[-1]
+        info["records"] += len(batch)
+        info["bytes"] += len(data)
+        self.records += len(batch)
+        if info["bytes"] >= self.segment_bytes:
+            self._close_segment()
+
+
+# --- Recovery ---
+def repair_segment(path):
+    # Drop a partial last line (power loss mid-write). Returns (records, last epoch, bytes dropped).
+    if survey_binary.is_binary(path):
+        return survey_binary.repair(path)
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        dropped = len(data) - end
+        if dropped:
+            f.truncate(end)
+    records, last_epoch = 0, None
+    for line in data[:end].splitlines():
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            continue
+        records += 1
+        if "epoch" in rec and "event" not in rec:
+            last_epoch = rec["epoch"]
+    return records, last_epoch, dropped
+
+
+def is_alive(manifest):
+    # The writer of a _running log may still be going (another survey on this machine)
+    if manifest.get("host") != socket.gethostname() or not manifest.get("pid"):
+        return False
+    try:
+        os.kill(manifest["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    try:
+        with open(f"/proc/{manifest['pid']}/stat") as f:
+            if f.read().rsplit(")", 1)[1].split()[0] == "Z":
+                return False  # Killed, not reaped yet
+    except (OSError, IndexError):
+        pass
+    return manifest["pid"] != os.getpid()
+
+
+def recover_orphans(log_dir):
+    # Finalize _running logs left by a crash, SIGKILL or power loss. Returns [(final path, records, dropped bytes)].
+    recovered = []
+    for path in find_logs(log_dir, running=True):
+        base = os.path.basename(path)
+        start = base[len("survey_"):].split("_running")[0]
+        if os.path.isdir(path):
+            manifest = read_manifest(path)
+            if is_alive(manifest):
+                continue
+            segments = segment_paths(path)
+        else:
+            manifest, segments = None, [path]
+
+        records, last_epoch, dropped = 0, None, 0
+        for seg in segments:
+            n, last, d = repair_segment(seg)
+            records += n
+            dropped += d
+            last_epoch = last or last_epoch
+        end = int(last_epoch) if last_epoch else int(os.path.getmtime(path))
+
+        final = os.path.join(log_dir, f"survey_{start}-{end}" + ("" if manifest is not None else ".jsonl"))
+        if manifest is not None:
+            manifest.update({"finished": True, "end_epoch": end, "recovered": True})
+            write_manifest(path, manifest)
+        os.rename(path, final)
+
+        # Live exports of the crashed run are incomplete (no XLSX save, no Parquet footer)
+        for leftover in glob.glob(os.path.join(log_dir, f"survey_{start}_running.*")):
+            os.remove(leftover)
+        recovered.append((final, records, dropped))
+    return recovered
+
+
+if __name__ == "__main__":
+    # python3 survey_log.py recover [log_dir]   |   python3 survey_log.py cat <survey>
+    if len(sys.argv) >= 2 and sys.argv[1] == "recover":
+        for final, records, dropped in recover_orphans(sys.argv[2] if len(sys.argv) > 2 else "surveys"):
+            print(f"Recovered {final} ({records} records" + (f", dropped {dropped} bytes of a partial line)" if dropped else ")"))
+    elif len(sys.argv) == 3 and sys.argv[1] == "cat":
+        for seg in segment_paths(sys.argv[2]):
+            for record in iter_segment(seg):
+                sys.stdout.write(json.dumps(record) + "\n")
+    else:
+        sys.exit("usage: survey_log.py recover [log_dir] | survey_log.py cat <survey dir or .jsonl>")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# Shared record schema for wifi-survey.py and the post-processing tools.
+
+
+def icmp_fields(prefix):
+    # Per-target ping columns, avg/lost kept under their original names
+    return [f"icmp_{prefix}_count", f"icmp_{prefix}_ms", f"icmp_{prefix}_lost",
+            f"icmp_{prefix}_min_ms", f"icmp_{prefix}_p95_ms", f"icmp_{prefix}_max_ms", f"icmp_{prefix}_jitter_ms"]
+
+
+def loaded_fields(prefix):
+    # Ping during throughput tests (load_policy "loaded"), next to the idle icmp_<prefix>_* columns
+    return [f"icmp_{prefix}_loaded_ms", f"icmp_{prefix}_loaded_p95_ms", f"icmp_{prefix}_loaded_lost"]
+
+
+def app_fields(name, kind):
+    # Per-probe columns of an application-layer probe (app_probes.py), _ms is the headline number
+    extra = {"tcp": [], "dns": ["rcode"], "http": ["connect_ms", "total_ms", "status"]}[kind]
+    return [f"app_{name}_ms"] + [f"app_{name}_{s}" for s in extra] + [f"app_{name}_error"]
+
+
+ICMP_SUFFIX_TYPES = {"count": "int", "ms": "float", "lost": "float",
+                     "min_ms": "float", "p95_ms": "float", "max_ms": "float", "jitter_ms": "float"}
+# Rollup rows (rollup.py): <column>_<stat> per rolled up value, plus counts per period
+ROLLUP_SUFFIX_TYPES = {"min": "float", "avg": "float", "max": "float", "p50": "float", "p95": "float",
+                       "sent": "int", "lost_pkts": "int", "loss_pct": "float", "runs": "int", "failed": "int"}
+APP_SUFFIX_TYPES = {"ms": "float", "connect_ms": "float", "total_ms": "float", "status": "int", "rcode": "str", "error": "str"}
+
+# Ordered Field Keys for consistent JSON/CSV look
+# Order: Time, Loc (x/y on the floorplan, if known), NIC, Radio, Signal, Perf
+FIELD_ORDER = [
+    "epoch", "timestamp",
+    "location", "x", "y", "country_code", "ssid", "bssid", "bss_transition",
+    "nic_mac", "nic_ip", "nic_gw_ip", "nic_dns", "nic_reip_ms",
+    "auth_mode", "phy_mode", "channel", "channel_band", "channel_width", "tx_rate_mbps",
+    "rssi_dbm", "noise_dbm", "snr",
+    "iperf_rx_mbps", "iperf_tx_mbps", "iperf_rx_min_mbps", "iperf_tx_min_mbps",
+    "iperf_jitter_ms", "iperf_lost_pct", "iperf_error",
+] + icmp_fields("lan") + icmp_fields("wan") + [
+    # Sample age per source at record time, the sources older than max_sample_age_s,
+    # and the sources whose sample overlapped a throughput test
+    "age_wifi_ms", "age_net_ms", "age_reip_ms", "age_icmp_lan_ms", "age_icmp_wan_ms", "age_iperf_rx_ms", "age_iperf_tx_ms",
+    "stale", "under_load",
+]
+
+# Neighbor scan summary, appended when neighbor_scan is on (full tables go to neighbors_<start>.jsonl)
+NEIGHBOR_SUMMARY_FIELDS = ["neighbor_count", "neighbor_ssids", "neighbor_best_rssi_dbm"]
+
+# Column types used by the exporters ("int", "float" or "str")
+FIELD_TYPES = {
+    "epoch": "float", "timestamp": "str",
+    "location": "str", "x": "float", "y": "float", "country_code": "str", "ssid": "str", "bssid": "str", "bss_transition": "int",
+    "nic_mac": "str", "nic_ip": "str", "nic_gw_ip": "str", "nic_dns": "str", "nic_reip_ms": "int",
+    "auth_mode": "str", "phy_mode": "str", "channel": "int", "channel_band": "str", "channel_width": "str",
+    "tx_rate_mbps": "float",
+    "rssi_dbm": "int", "noise_dbm": "int", "snr": "int",
+    "iperf_rx_mbps": "float", "iperf_tx_mbps": "float", "iperf_rx_min_mbps": "float", "iperf_tx_min_mbps": "float",
+    "iperf_jitter_ms": "float", "iperf_lost_pct": "float", "iperf_error": "str",
+    "neighbor_count": "int", "neighbor_ssids": "int", "neighbor_best_rssi_dbm": "int",
+    "period_start": "float", "period_s": "int", "samples": "int", "roams": "int", "bssid_count": "int",
+    "bssid_top": "str", "bssid_dwell": "str", "iperf_tests": "int",
+}
+
+
+def field_type(name):
+    if name in FIELD_TYPES:
+        return FIELD_TYPES[name]
+    if name.startswith("age_") and name.endswith("_ms"):
+        return "int"
+    for suffix, ftype in ROLLUP_SUFFIX_TYPES.items():
+        if name.endswith("_" + suffix):
+            return ftype
+    if name.startswith("icmp_"):
+        # icmp_<prefix>_<suffix>, prefix may be any configured extra target name
+        for suffix, ftype in ICMP_SUFFIX_TYPES.items():
+            if name.endswith("_" + suffix):
+                return ftype
+    if name.startswith("app_"):
+        for suffix, ftype in APP_SUFFIX_TYPES.items():
+            if name.endswith("_" + suffix):
+                return ftype
+    return "str"
+
+
+def coerce(value, ftype):
+    # Best effort cast, anything unparseable becomes None (empty cell)
+    if value is None or value == "":
+        return None
+    try:
+        if ftype == "int":
+            return int(value)
+        if ftype == "float":
+            return float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if isinstance(value, str) else str(value)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# Synthetic survey logs: a walk through locations with roams, radio dropouts (None gaps) and
+# periodic iperf tests, in the same JSONL format wifi-survey.py writes. For benchmarks and replay.
+import sys
+import json
+import random
+import argparse
+from datetime import datetime
+
+from survey_schema import FIELD_ORDER
+
+LOCATIONS = ["Reception", "Open office", "Meeting room 1", "Meeting room 2", "Kitchen", "Corridor", "Warehouse"]
+LOCATION_XY = {"Reception": (4, 3), "Open office": (18, 10), "Meeting room 1": (30, 4), "Meeting room 2": (30, 16),
+               "Kitchen": (8, 17), "Corridor": (20, 3), "Warehouse": (44, 12)}  # Floorplan meters
+APS = [  # bssid, channel, band, width
+    ("02:00:00:00:00:10", 36, "5GHz", "80MHz"),
+    ("02:00:00:00:00:20", 52, "5GHz", "80MHz"),
+    ("02:00:00:00:00:30", 100, "5GHz", "80MHz"),
+    ("02:00:00:00:00:40", 149, "5GHz", "80MHz"),
+    ("02:00:00:00:00:50", 6, "2.4GHz", "20MHz"),
+]
+
+
+def generate_records(n, seed=1, start_epoch=1767225600.0, interval_s=2.0, location_every=150,
+                     iperf_every=8, dropout_rate=0.003):
+    rng = random.Random(seed)
+    ap = 0
+    rssi = -55.0
+    location = LOCATIONS[0]
+    rx = tx = None
+    iperf_age = None
+    dropout = 0
+    prev_bssid = None
+    for i in range(n):
+        epoch = start_epoch + i * interval_s
+        if i % location_every == 0:
+            location = rng.choice(LOCATIONS)
+
+        # Signal random walk, roam to another AP when it gets weak
+        rssi = max(-92.0, min(-35.0, rssi + rng.gauss(-0.15, 1.5)))
+        if rssi < -74 and rng.random() < 0.5:
+            ap = rng.choice([a for a in range(len(APS)) if a != ap])
+            rssi = rng.uniform(-60, -48)
+        if dropout == 0 and rng.random() < dropout_rate:
+            dropout = rng.randint(2, 10)
+        connected = dropout == 0
+        dropout = max(0, dropout - 1)
+
+        bssid, channel, band, width = APS[ap]
+        noise = -92 + rng.randint(-3, 3)
+        rec = {"epoch": round(epoch, 3),
+               "timestamp": datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+               "location": location, "x": LOCATION_XY[location][0], "y": LOCATION_XY[location][1]}
+        if connected:
+            rec.update({
+                "country_code": "SE", "ssid": "corp", "bssid": bssid,
+                "nic_mac": "02:00:00:00:ff:01", "nic_ip": "10.0.0.23", "nic_gw_ip": "10.0.0.1", "nic_dns": "10.0.0.1",
+                "auth_mode": "WPA2-EAP", "phy_mode": "11ax" if band != "2.4GHz" else "11n", "channel": channel,
+                "channel_band": band, "channel_width": width,
+                "tx_rate_mbps": max(6, int((rssi + 95) * 18)), "rssi_dbm": int(rssi), "noise_dbm": noise,
+                "snr": int(rssi) - noise,
+            })
+        rec["bss_transition"] = int(bool(connected and prev_bssid and bssid != prev_bssid))
+        rec.setdefault("snr", 0)  # Like wifi-survey.py without a signal
+        if connected:
+            prev_bssid = bssid
+
+        # Ping: lost while disconnected, occasional loss when the signal is weak
+        for prefix, base in (("lan", 2.0), ("wan", 12.0)):
+            lost = 100.0 if not connected else (25.0 if rssi < -75 and rng.random() < 0.3 else 0.0)
+            rtts = None if lost == 100.0 else sorted(base + rng.expovariate(1 / (base * 0.4)) for _ in range(4))
+            rec.update({f"icmp_{prefix}_count": 4, f"icmp_{prefix}_lost": lost,
+                        f"icmp_{prefix}_ms": round(sum(rtts) / 4, 2) if rtts else None,
+                        f"icmp_{prefix}_min_ms": round(rtts[0], 2) if rtts else None,
+                        f"icmp_{prefix}_p95_ms": round(rtts[-1], 2) if rtts else None,
+                        f"icmp_{prefix}_max_ms": round(rtts[-1], 2) if rtts else None,
+                        f"icmp_{prefix}_jitter_ms": round(rng.uniform(0.1, 2.0), 2) if rtts else None})
+
+        # iperf: a new test every iperf_every records, the value sticks until the next one
+        if i % iperf_every == 0:
+            iperf_age = 0
+            cap = max(0.0, (rssi + 92) * 25) if connected else None
+            rx = round(cap * rng.uniform(0.6, 0.95), 2) if cap else None
+            tx = round(cap * rng.uniform(0.5, 0.9), 2) if cap else None
+        else:
+            iperf_age += int(interval_s * 1000)
+        rec.update({"iperf_rx_mbps": rx, "iperf_tx_mbps": tx,
+                    "iperf_rx_min_mbps": round(rx * 0.7, 2) if rx else None,
+                    "iperf_tx_min_mbps": round(tx * 0.7, 2) if tx else None,
+                    "iperf_error": None if rx is not None else "ConnectionRefusedError: [Errno 61] Connection refused"})
+
+        wifi_age = rng.randint(50, 1000) if connected else rng.randint(2000, 9000)
+        rec.update({"age_wifi_ms": wifi_age, "age_net_ms": int(i * interval_s * 1000), "age_icmp_lan_ms": rng.randint(0, 1500),
+                    "age_icmp_wan_ms": rng.randint(0, 1500), "age_iperf_rx_ms": iperf_age, "age_iperf_tx_ms": iperf_age,
+                    "stale": None if connected else "wifi"})
+        yield {k: rec.get(k) for k in FIELD_ORDER}
+
+
+def write_log(path, n, seed=1):
+    # Returns bytes written
+    size = 0
+    with open(path, "w") as f:
+        for rec in generate_records(n, seed):
+            line = json.dumps(rec) + "\n"
+            f.write(line)
+            size += len(line)
+    return size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic survey log.")
+    parser.add_argument("records", type=int, help="number of records (e.g. 10000 - 10000000)")
+    parser.add_argument("path", nargs="?", help="output .jsonl (default: stdout)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.path:
+        size = write_log(args.path, args.records, args.seed)
+        print(f"-> Saved {args.path} ({args.records} records, {size / 1e6:.1f} MB)")
+    else:
+        for rec in generate_records(args.records, args.seed):
+            sys.stdout.write(json.dumps(rec) + "\n")
@@ -0,0 +1,5 @@
+# The tools are flat scripts in the repository root, import them from there
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
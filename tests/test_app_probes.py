@@ -0,0 +1,141 @@
+import asyncio
+import socket
+
+import pytest
+
+from app_probes import (AppProbeEngine, build_query, encode_name, parse_probe, parse_probes, parse_response,
+                        probe_fields, serve)
+
+
+def unused_port(kind=socket.SOCK_STREAM):
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def stand_ins(delay_ms=0):
+    # The app_probes.py serve stand-ins on free ports: (http server, dns transport, http port, dns port)
+    http, dns = await serve("127.0.0.1", 0, 0, delay_ms)
+    return http, dns, http.sockets[0].getsockname()[1], dns.get_extra_info("sockname")[1]
+
+
+def test_parse_probe():
+    p = parse_probe("web", "https://intranet/health?full=1")
+    assert (p.kind, p.host, p.port, p.path, p.tls) == ("http", "intranet", 443, "/health?full=1", True)
+    p = parse_probe("dns1", "dns://1.1.1.1/example.com?type=aaaa")
+    assert (p.kind, p.port, p.query, p.qtype) == ("dns", 53, "example.com", 28)
+    assert parse_probe("ssh", "tcp://10.0.0.5:22").port == 22
+    assert sorted(parse_probes({"a": "tcp://h:1", "b": "http://h/"})) == ["a", "b"]
+
+
+@pytest.mark.parametrize("name, url", [
+    ("web-1", "http://host/"),                 # Not a usable column prefix
+    ("ssh", "tcp://10.0.0.5"),                 # No port
+    ("d", "dns://1.1.1.1/"),                   # Nothing to look up
+    ("d", "dns://1.1.1.1/example.com?type=SRV"),
+    ("d", "dns://1.1.1.1/" + "a" * 64 + ".com"),
+    ("x", "ftp://host/"),
+    ("x", "http://host:99999/"),
+])
+def test_parse_probe_rejects(name, url):
+    with pytest.raises(ValueError):
+        parse_probe(name, url)
+
+
+def test_encode_name():
+    assert encode_name("example.com") == b"\x07example\x03com\x00"
+    assert encode_name("example.com.") == b"\x07example\x03com\x00"
+    # Length bytes count the IDNA encoded label, not the characters
+    assert encode_name("bücher.example") == b"\x0dxn--bcher-kva\x07example\x00"
+    with pytest.raises(ValueError):
+        encode_name("a" * 64 + ".com")
+    with pytest.raises(ValueError):
+        encode_name(".".join(["a" * 60] * 5))
+
+
+def test_query_and_response():
+    query = build_query(0xBEEF, "example.com", 28)
+    assert query[:2] == b"\xbe\xef" and query.endswith(b"\x07example\x03com\x00\x00\x1c\x00\x01")
+    assert parse_response(query) is None  # A query, not a response
+    assert parse_response(b"\xbe\xef\x81\x83\x00\x01\x00\x00" + bytes(4)) == (0xBEEF, "NXDOMAIN", 0)
+    assert parse_response(b"\x00") is None
+
+
+def test_probe_fields():
+    assert probe_fields("web", "http", None) == {"app_web_ms": None, "app_web_error": None, "app_web_connect_ms": None,
+                                                 "app_web_total_ms": None, "app_web_status": None}
+    assert set(probe_fields("d", "dns", None)) == {"app_d_ms", "app_d_error", "app_d_rcode"}
+
+
+def test_probes_against_stand_ins():
+    async def run():
+        http, dns, http_port, dns_port = await stand_ins()
+        probes = parse_probes({"tcp": f"tcp://127.0.0.1:{http_port}", "web": f"http://127.0.0.1:{http_port}/",
+                               "dns": f"dns://127.0.0.1:{dns_port}/bücher.example"})
+        engine = AppProbeEngine(timeout_s=2.0)
+        try:
+            first = await engine.probe_many(probes)
+            again = await engine.probe(probes["web"])
+        finally:
+            engine.close()
+            http.close()
+            dns.close()
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert all(r.error is None and r.ms is not None for r in first.values())
+    assert first["dns"].rcode == "NOERROR"
+    assert first["web"].status == 200 and first["web"].connect_ms is not None and first["web"].bytes > 0
+    # The keep-alive connection is reused, so no handshake on the second run
+    assert again.status == 200 and again.connect_ms is None and again.error is None
+    fields = probe_fields("web", "http", again)
+    assert fields["app_web_status"] == 200 and fields["app_web_connect_ms"] is None
+
+
+def test_probe_errors():
+    async def run():
+        http, dns, http_port, dns_port = await stand_ins(delay_ms=500)
+        probes = parse_probes({"closed": f"tcp://127.0.0.1:{unused_port()}",
+                               "slow": f"http://127.0.0.1:{http_port}/",
+                               "slowdns": f"dns://127.0.0.1:{dns_port}/example.com",
+                               "nores": f"dns://127.0.0.1:{unused_port(socket.SOCK_DGRAM)}/example.com"})
+        engine = AppProbeEngine(timeout_s=0.2)
+        try:
+            return await engine.probe_many(probes)
+        finally:
+            engine.close()
+            http.close()
+            dns.close()
+
+    results = asyncio.run(run())
+    assert results["closed"].error.startswith("refused") and results["closed"].ms is None
+    assert results["slow"].error.startswith("timeout") and results["slow"].status is None
+    assert results["slowdns"].error.startswith("timeout")
+    # ICMP port unreachable on the resolver socket fails the query right away
+    assert results["nores"].error.startswith("refused")
+    assert probe_fields("closed", "tcp", results["closed"])["app_closed_error"] == "refused"
+
+
+def test_http_status_and_chunked_body():
+    async def on_http(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b"HTTP/1.1 503 Service Unavailable\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+                     b"5\r\nbusy.\r\n3\r\n..\n\r\n0\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(on_http, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        engine = AppProbeEngine(timeout_s=2.0)
+        try:
+            result = await engine.probe(parse_probe("web", f"http://127.0.0.1:{port}/"))
+            return result, dict(engine.http_conns)
+        finally:
+            engine.close()
+            server.close()
+
+    result, conns = asyncio.run(run())
+    assert result.status == 503 and result.error == "http: 503" and result.total_ms is not None
+    assert result.bytes >= 8
+    assert conns == {}  # Connection: close, not kept for the next run
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import socket
+import time
+
+from collector import (Collector, StreamAgent, decode_batch, encode_batch, merge_agent_logs, parse_address,
+                       read_spool)
+from survey_log import iter_segment, read_manifest, segment_paths
+
+
+def make_records(first, count, epoch0=1_700_000_000.0, step=2.0):
+    return [{"epoch": epoch0 + (first + i) * step, "seq": first + i, "rssi_dbm": -50 - (first + i) % 20}
+            for i in range(count)]
+
+
+def read_records(path):
+    return [r for seg in segment_paths(path) for r in iter_segment(seg) if "event" not in r]
+
+
+def unused_port():
+    # Nothing listens here once the socket is closed, connects are refused
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_for(condition, timeout_s=10.0):
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+async def stream(agent, records):
+    for record in records:
+        agent.write(record)
+    await asyncio.to_thread(agent.close, 20.0)
+
+
+def test_batch_round_trip():
+    records = make_records(40, 25)
+    for compress in (True, False):
+        data, raw = encode_batch(40, records, compress)
+        assert data[:1] == (b"B" if compress else b"b")
+        assert decode_batch(data[:1], data[5:]) == (40, records)
+    assert len(encode_batch(0, records)[0]) < raw
+
+
+def test_parse_address():
+    assert parse_address("10.0.0.5:9400") == ("10.0.0.5", 9400)
+    assert parse_address("collector.local") == ("collector.local", 9300)
+
+
+def test_read_spool_drops_torn_frame(tmp_path):
+    path = str(tmp_path / "spool.bin")
+    frames = [encode_batch(i * 10, make_records(i * 10, 10))[0] for i in range(3)]
+    with open(path, "wb") as f:
+        f.write(b"".join(frames) + frames[0][:20])
+    assert [(first, count) for first, count, _ in read_spool(path)] == [(0, 10), (10, 10), (20, 10)]
+    assert read_spool(str(tmp_path / "missing.bin")) == []
+
+
+def test_ingest_dedup_and_gaps(tmp_path):
+    collector = Collector(str(tmp_path), clock=lambda: 1_700_000_000.0)
+    os.makedirs(collector.dir)
+    st = collector._agent({"agent": "lap1", "session": 1000}, None)
+    collector.ingest(st, 0, make_records(0, 10))
+    collector.ingest(st, 5, make_records(5, 10))    # Resent after a lost ack, half of it already here
+    collector.ingest(st, 0, make_records(0, 10))    # All duplicates
+    collector.ingest(st, 20, make_records(20, 5))   # 15..19 were dropped by a full agent spool
+    assert (st["next"], st["records"], st["duplicates"], st["missing"]) == (25, 20, 15, 5)
+    paths = collector.close()
+    assert [r["seq"] for r in read_records(paths[0])] == list(range(15)) + list(range(20, 25))
+    assert {r["agent"] for r in read_records(paths[0])} == {"lap1"}
+
+    # A collector that starts mid-survey resumes where the agent is, that gap is not missing
+    later = Collector(str(tmp_path), clock=lambda: 1_700_000_100.0)
+    os.makedirs(later.dir)
+    st = later._agent({"agent": "lap1", "session": 1000}, None)
+    later.ingest(st, 300, make_records(300, 10))
+    assert (st["resumed_at"], st["missing"], st["next"]) == (300, 0, 310)
+    later.close()
+
+
+def test_loopback_resume_skips_acknowledged(tmp_path):
+    async def run():
+        collector = Collector(str(tmp_path))
+        server = await collector.serve("127.0.0.1", 0)
+        address = server.sockets[0].getsockname()[:2]
+        first = StreamAgent(address, "lap1", 1000, batch_s=0.05).start()
+        await stream(first, make_records(0, 30))
+        assert first.sent == 30 and first.pending() == 0
+
+        # Same survey again (a restarted agent), the collector only takes what it doesn't have
+        again = StreamAgent(address, "lap1", 1000, batch_s=0.05)
+        for record in make_records(0, 45):
+            again.write(record)
+        again.start()
+        await asyncio.to_thread(again.close, 20.0)
+        st = collector.agents["lap1_1000"]
+        assert (st["next"], st["records"], st["duplicates"], st["connects"]) == (45, 45, 30, 2)
+        server.close()
+        await server.wait_closed()
+        return collector.close()
+
+    paths = asyncio.run(run())
+    assert [r["seq"] for r in read_records(paths[0])] == list(range(45))
+
+
+def test_loopback_spool_backfill(tmp_path):
+    spool = str(tmp_path / "spool.bin")
+
+    async def run():
+        # Collector down: batches pile up in memory, then in the spool
+        agent = StreamAgent(("127.0.0.1", unused_port()), "lap1", 1000, spool_path=spool, batch_s=0.02,
+                            batch_records=5, retry_max_s=0.5).start()
+        for record in make_records(0, 100):
+            agent.write(record)
+        await wait_for(lambda: agent.spool_bytes > 0)
+        assert agent.last_error and not agent.connected
+
+        collector = Collector(str(tmp_path))
+        server = await collector.serve("127.0.0.1", 0)
+        agent.address = server.sockets[0].getsockname()[:2]
+        await stream(agent, make_records(100, 10))
+        st = collector.agents["lap1_1000"]
+        assert (st["next"], st["records"], st["duplicates"], st["missing"]) == (110, 110, 0, 0)
+        assert agent.sent == 110 and agent.dropped == 0 and agent.spool_bytes == 0
+        server.close()
+        await server.wait_closed()
+        return collector.close()
+
+    paths = asyncio.run(run())
+    assert not os.path.exists(spool)
+    assert [r["seq"] for r in read_records(paths[0])] == list(range(110))
+
+
+def test_merge_agent_logs(tmp_path):
+    async def run():
+        collector = Collector(str(tmp_path))
+        server = await collector.serve("127.0.0.1", 0)
+        address = server.sockets[0].getsockname()[:2]
+        # Two laptops walking at the same time, their records interleave by epoch
+        await asyncio.gather(stream(StreamAgent(address, "lap1", 1_700_000_000, batch_s=0.05).start(),
+                                    make_records(0, 20)),
+                             stream(StreamAgent(address, "lap2", 1_700_000_001, batch_s=0.05).start(),
+                                    make_records(0, 20, epoch0=1_700_000_001.0)))
+        server.close()
+        await server.wait_closed()
+        return collector.close()
+
+    final, count = merge_agent_logs(asyncio.run(run()), str(tmp_path))
+    assert count == 40 and os.path.basename(final).startswith("survey_1700000000_merged-")
+    records = read_records(final)
+    assert [r["epoch"] for r in records] == sorted(r["epoch"] for r in records)
+    assert [r["agent"] for r in records[:4]] == ["lap1", "lap2", "lap1", "lap2"]
+    assert read_manifest(final)["agents"] == ["lap1_1700000000", "lap2_1700000001"]
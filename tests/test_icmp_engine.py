@@ -0,0 +1,51 @@
+import asyncio
+import struct
+
+import pytest
+
+from icmp_engine import (IcmpEngine, PingResult, build_echo, checksum, open_icmp_socket, parse_echo_reply,
+                         ping_stats, stats_fields)
+
+
+def test_echo_request_checksum_verifies():
+    packet = build_echo(0x1234, 7)
+    assert packet[0] == 8 and struct.unpack("!HH", packet[4:8]) == (0x1234, 7)
+    assert checksum(packet) == 0  # A correct checksum sums the packet to zero
+
+
+def test_parse_echo_reply_strips_ip_header():
+    reply = struct.pack("!BBHHH", 0, 0, 0, 42, 3) + b"payload"
+    ip_header = bytes([0x45]) + bytes(19)
+    assert parse_echo_reply(reply) == (42, 3)
+    assert parse_echo_reply(ip_header + reply) == (42, 3)
+    assert parse_echo_reply(struct.pack("!BBHHH", 8, 0, 0, 42, 3)) is None  # Our own request, not a reply
+    assert parse_echo_reply(b"\x00\x00") is None
+
+
+def test_ping_stats():
+    stats = ping_stats([10.0, 12.0, 11.0], sent=4)
+    assert stats == {"min": 10.0, "avg": 11.0, "p95": 11.9, "max": 12.0, "jitter": 1.5, "lost": 25.0}
+    assert ping_stats([], 4)["lost"] == 100.0 and ping_stats([], 4)["avg"] is None
+
+
+def test_stats_fields_columns():
+    fields = stats_fields("lan", PingResult("gw", sent=2, rtts=[1.0, 3.0]), 2)
+    assert fields["icmp_lan_ms"] == 2.0 and fields["icmp_lan_lost"] == 0.0 and fields["icmp_lan_count"] == 2
+    assert stats_fields("wan", None, 4)["icmp_wan_lost"] == 100.0
+
+
+def test_probe_loopback():
+    try:
+        open_icmp_socket()[0].close()
+    except OSError:
+        pytest.skip("no ICMP socket here (needs net.ipv4.ping_group_range or root)")
+
+    async def run():
+        engine = IcmpEngine(spacing_s=0.01, timeout_s=1.0)
+        try:
+            return await engine.probe_many({"lo": "127.0.0.1"}, count=3)
+        finally:
+            engine.close()
+
+    result = asyncio.run(run())["lo"]
+    assert result.sent == 3 and len(result.rtts) == 3 and result.error is None
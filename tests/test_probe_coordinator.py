@@ -0,0 +1,82 @@
+import asyncio
+
+from probe_coordinator import AirtimeBudget, ProbeCoordinator
+
+
+class FakeClock:
+    def __init__(self):
+        self.ns = 1_000_000_000
+
+    def __call__(self):
+        return self.ns
+
+    def advance(self, s):
+        self.ns += int(s * 1e9)
+
+
+def make_coordinator(clock, **kwargs):
+    coord = ProbeCoordinator(budget_pct=10, clock_ns=clock, **kwargs)
+    coord.register("icmp", 2)
+    coord.register("app", 5)
+    coord.register("iperf", 60, burst=False, wake_on=("location",), heavy=True)
+    return coord
+
+
+def test_budget_factor():
+    clock = FakeClock()
+    budget = AirtimeBudget(10, window_s=100, clock_ns=clock)
+    budget.charge("iperf", 5)
+    assert budget.factor() == 1.0
+    budget.charge("iperf", 15)
+    assert round(budget.used(), 3) == 0.2 and round(budget.factor(), 3) == 2.0
+    clock.advance(101)  # Out of the window
+    assert budget.used() == 0 and budget.factor() == 1.0
+    assert AirtimeBudget(0, clock_ns=clock).factor() == 1.0
+
+
+def test_long_throughput_test_only_stretches_heavy_probes():
+    clock = FakeClock()
+    coord = make_coordinator(clock)
+
+    async def throughput_test():
+        async with coord.load():
+            clock.advance(60)
+
+    asyncio.run(throughput_test())
+    assert coord.budget.factor() > 1
+    assert coord.interval_s("icmp") == 2 and coord.interval_s("app") == 5
+    assert coord.interval_s("iperf") == 60 * coord.budget.factor()
+
+
+def test_burst_and_backoff():
+    clock = FakeClock()
+    woken = []
+    coord = make_coordinator(clock, burst_s=30, burst_factor=4, stationary_s=100, backoff_max=3)
+    coord.on_wake = woken.append
+    coord.motion("roam")
+    assert woken == ["icmp", "app"] and coord.mode() == "burst"
+    assert coord.interval_s("icmp") == 0.5 and coord.interval_s("iperf") == 60  # iperf doesn't burst
+    clock.advance(200)
+    assert coord.mode() == "stationary" and coord.interval_s("icmp") == 4
+    clock.advance(1000)
+    assert coord.interval_s("icmp") == 6  # Capped at backoff_max
+    # Off by default: standing still keeps the configured rates
+    default = make_coordinator(clock, stationary_s=100)
+    clock.advance(1000)
+    assert default.mode() == "normal" and default.interval_s("icmp") == 2
+
+
+def test_gate_during_load():
+    clock = FakeClock()
+    coord = make_coordinator(clock, guard_s=1.0)
+
+    async def run():
+        async with coord.load():
+            assert coord.gate("icmp")
+        clock.advance(0.5)
+        assert coord.gate("icmp")  # Guard time after the test
+        clock.advance(1)
+        assert not coord.gate("icmp")
+
+    asyncio.run(run())
+    assert coord.gated["icmp"] == 2
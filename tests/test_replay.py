@@ -0,0 +1,144 @@
+import asyncio
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from app_probes import parse_probe, probe_fields
+from icmp_engine import stats_fields
+from replay import (CHECKED, Pacer, ReplayAppEngine, ReplayClock, ReplayPinger, ReplayRadio, field_source, iter_recorded,
+                    iter_scenario, measured_at, source_map, view_targets)
+from survey_log import iter_segment, read_manifest, segment_paths
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def survey_root(tmp_path):
+    # wifi-survey.py keeps config.json and the logs next to itself, so it runs from a copy
+    for name in os.listdir(ROOT):
+        if name.endswith(".py"):
+            shutil.copy(os.path.join(ROOT, name), tmp_path)
+    with open(tmp_path / "config.json", "w") as f:
+        json.dump({"log_dir": "surveys", "export_logs": False, "log_segment_s": 60}, f)
+    return tmp_path
+
+
+def run_survey(root, *args):
+    proc = subprocess.run([sys.executable, "wifi-survey.py", *args, "--no-view", "--check"], cwd=root,
+                          capture_output=True, text=True, timeout=120)
+    return proc.returncode, proc.stdout + proc.stderr
+
+
+def measured(record):
+    return {k: v for k, v in record.items() if field_source(k) or k in CHECKED + ("epoch",)}
+
+
+def replays(root, kind):
+    return sorted(glob.glob(str(root / "surveys" / "replays" / f"survey_*_{kind}-*")))
+
+
+def test_replay_clock():
+    clock = ReplayClock(100.0)
+    assert clock.set(101.2346) == 101_235_000_000
+    assert clock.time() == 101.235 and clock.monotonic_ns() == 101_235_000_000
+    assert clock.set(50.0) == 101_235_000_000  # Never backwards
+
+
+def test_field_sources():
+    assert field_source("rssi_dbm") == "wifi"
+    assert field_source("snr") is None and field_source("age_wifi_ms") is None
+    assert field_source("icmp_lan_p95_ms") == "icmp_lan"
+    assert field_source("icmp_lan_loaded_ms") == "loaded"
+    assert field_source("app_web_connect_ms") == "app_web"
+    assert field_source("something_new") == "replay"
+    sources = source_map(["ssid", "snr", "nic_ip", "iperf_tx_mbps"])
+    assert sources == {"wifi": ["ssid"], "net": ["nic_ip"], "iperf_tx": ["iperf_tx_mbps"]}
+
+
+def test_view_targets():
+    columns = ["icmp_lan_count", "icmp_dc1_count", "icmp_dc1_ms", "app_web_error", "app_web_status",
+               "app_dns1_error", "app_dns1_rcode", "app_ssh_error"]
+    assert view_targets(columns) == (["dc1"], {"web": "http", "dns1": "dns", "ssh": "tcp"})
+
+
+def test_stand_ins_answer_with_the_record():
+    record = next(iter_scenario(1, seed=3))
+    radio = ReplayRadio()
+    radio.feed(record)
+    assert radio.sample()["bssid"] == record["bssid"] and radio.sample_fast() == (record["bssid"], record["rssi_dbm"])
+
+    pinger = ReplayPinger()
+    pinger.feed(record)
+    results = asyncio.run(pinger.probe_many({"lan": "lan", "wan": "wan"}, 4))
+    fields = stats_fields("wan", results["wan"], 4)
+    assert fields == {k: record[k] for k in fields} and results["wan"].sent == 4
+
+    apps = ReplayAppEngine()
+    apps.feed({"app_web_ms": 8.5, "app_web_error": "http", "app_web_status": 503, "app_web_total_ms": 9.0})
+    web = asyncio.run(apps.probe_many({"web": parse_probe("web", "http://intranet/")}))["web"]
+    assert probe_fields("web", "http", web) == {"app_web_ms": 8.5, "app_web_error": "http", "app_web_connect_ms": None,
+                                                "app_web_total_ms": 9.0, "app_web_status": 503}
+
+
+def test_measured_at():
+    record = {"epoch": 100.0, "rssi_dbm": -60, "age_wifi_ms": 250, "icmp_lan_ms": None, "age_icmp_lan_ms": None,
+              "location": "Lab"}
+    assert measured_at(record, source_map(list(record))) == {"wifi": (99_750, {"rssi_dbm": -60}),
+                                                             "location": (100_000, {"location": "Lab"})}
+
+
+def test_pacer():
+    assert Pacer(0).delay_s(1e9) == 0.0
+    pacer = Pacer(10)
+    assert pacer.delay_s(1000.0) <= 0
+    assert 0.9 < pacer.delay_s(1010.0) <= 1.0  # 10 s of survey at 10x
+
+
+def test_simulate_then_replay_is_identical(survey_root):
+    rc, out = run_survey(survey_root, "--simulate", "300", "--seed", "2")
+    assert rc == 0, out
+    assert "bss_transition 0 mismatches, snr 0 mismatches" in out
+    [sim] = replays(survey_root, "sim")
+    recorded = list(iter_recorded(sim))
+    assert len(recorded) == 300
+    # Every measured field as generated, and the computed ones --check compares rebuilt the same
+    assert [measured(r) for r in recorded] == [measured(r) for r in iter_scenario(300, seed=2)]
+
+    rc, out = run_survey(survey_root, "--replay", sim)
+    assert rc == 0, out
+    [replayed] = replays(survey_root, "replay")
+    assert list(iter_recorded(replayed)) == recorded
+    assert read_manifest(replayed)["replay"]
+    # Replays stay out of the survey_* glob analyze.py reads
+    assert not glob.glob(str(survey_root / "surveys" / "survey_*"))
+
+    # Segments follow the recorded time (log_segment_s 60, a 10 minute walk), not the seconds the replay took
+    segments = segment_paths(replayed)
+    assert len(segments) == 10
+    for seg in segments:
+        epochs = [r["epoch"] for r in iter_segment(seg) if "event" not in r]
+        assert epochs[-1] - epochs[0] < 60
+
+
+def test_check_flags_a_changed_record(survey_root):
+    rc, out = run_survey(survey_root, "--simulate", "120")
+    assert rc == 0, out
+    [sim] = replays(survey_root, "sim")
+    seg = segment_paths(sim)[0]
+    with open(seg) as f:
+        lines = f.readlines()
+    for i, line in enumerate(lines):
+        record = json.loads(line)
+        if record.get("snr") is not None:
+            record["snr"] += 7
+            lines[i] = json.dumps(record) + "\n"
+            break
+    with open(seg, "w") as f:
+        f.writelines(lines)
+    rc, out = run_survey(survey_root, "--replay", sim)
+    assert rc == 1 and "snr 1 mismatches" in out, out
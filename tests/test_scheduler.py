@@ -0,0 +1,76 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from scheduler import Scheduler
+
+
+class FakeClock:
+    # Monotonic ns that only moves when a task "works" or the scheduler sleeps
+    def __init__(self):
+        self.ns = 5_000_000_000
+
+    def __call__(self):
+        return self.ns
+
+    def advance(self, s):
+        self.ns += round(s * 1e9)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay, result=None):
+        clock.advance(max(delay, 0))
+        return await real_sleep(0, result)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return clock
+
+
+def run_ticks(clock, durations, interval_s=10.0, **kwargs):
+    # Runs one task whose ticks take the given (fake) seconds, returns (start times, stats)
+    starts = []
+
+    async def run():
+        scheduler = Scheduler(clock_ns=clock)
+
+        async def tick():
+            if len(starts) == len(durations):
+                raise asyncio.CancelledError  # Stops the scheduler, like Ctrl+C would
+            starts.append((clock() - scheduler.start_ns) / 1e9)
+            clock.advance(durations[len(starts) - 1])
+
+        scheduler.every("t", interval_s, tick, timeout_s=1e6, **kwargs)
+        with contextlib.suppress(asyncio.CancelledError):
+            await scheduler.run()
+        return scheduler.tasks["t"].stats.summary()
+
+    return starts, asyncio.run(run())
+
+
+def test_grid_without_drift(clock):
+    starts, stats = run_ticks(clock, [3, 7, 0.5, 9.9, 1])
+    assert starts == [0, 10, 20, 30, 40]
+    assert stats["runs"] == 5 and stats["skipped"] == 0 and stats["lateness_max_ms"] == 0
+
+
+def test_finishing_on_the_next_deadline_is_not_a_skip(clock):
+    starts, stats = run_ticks(clock, [10, 10, 10, 1])
+    assert starts == [0, 10, 20, 30]
+    assert stats["skipped"] == 0
+
+
+def test_overrun_skips_missed_ticks(clock):
+    starts, stats = run_ticks(clock, [10.001, 25, 1, 1])
+    # 10 is missed (runs at 20), 30 and 40 are missed (runs at 50)
+    assert starts == [0, 20, 50, 60]
+    assert stats["skipped"] == 3
+
+
+def test_offset(clock):
+    starts, _ = run_ticks(clock, [1, 1], offset_s=2.5)
+    assert starts == [2.5, 12.5]
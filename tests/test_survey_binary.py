@@ -0,0 +1,81 @@
+import os
+
+from survey_binary import INDEX_EVERY, BinaryReader, Encoder, read_records, repair
+
+COLUMNS = ["epoch", "timestamp", "location", "ssid", "bssid", "rssi_dbm", "snr", "icmp_lan_ms", "tx_rate_mbps"]
+
+
+def make_records(count, epoch0=1_700_000_000.0):
+    return [{"epoch": epoch0 + i * 2, "timestamp": f"2023-11-14 22:13:{i % 60:02d}.000",
+             "location": f"Room {i // 50}", "ssid": "office", "bssid": f"3c:37:86:5e:a1:{i % 3:02x}",
+             "rssi_dbm": -50 - i % 30, "snr": None if i % 7 == 0 else 40 - i % 30,
+             "icmp_lan_ms": None if i % 11 == 0 else round(1.5 + i % 5 * 0.25, 2),
+             "tx_rate_mbps": 866.7} for i in range(count)]
+
+
+def write_segment(path, records, close=True):
+    enc = Encoder(COLUMNS)
+    with open(path, "wb") as f:
+        f.write(enc.header() + enc.encode(records[:len(records) // 2]))
+        f.write(enc.encode([{"event": "metrics", "epoch": records[0]["epoch"]}]))
+        f.write(enc.encode(records[len(records) // 2:]))
+        if close:
+            f.write(enc.footer())
+    return enc
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "seg_00000.srec")
+    records = make_records(600)
+    enc = write_segment(path, records)
+    assert len(enc.strings) < 20  # SSID, BSSIDs and locations stored once
+    with BinaryReader(path) as reader:
+        assert reader.complete and reader.records == 600 and reader.columns == COLUMNS
+        assert list(reader.iter_records(events=False)) == records
+        assert len(reader.index) == -(-600 // INDEX_EVERY)
+    rows, _end = read_records(path)
+    assert rows[300] == {"event": "metrics", "epoch": records[0]["epoch"]}
+    assert [r for r in rows if "event" not in r] == records
+
+
+def test_time_range(tmp_path):
+    path = str(tmp_path / "seg_00000.srec")
+    records = make_records(1000)
+    write_segment(path, records)
+    start, end = records[300]["epoch"], records[700]["epoch"]
+    with BinaryReader(path) as reader:
+        # Seeks through the sparse index instead of decoding from the start
+        assert reader.seek(start) == reader.index[1][1]
+        assert list(reader.time_range(start, end)) == records[300:700]
+        assert list(reader.time_range(end_epoch=records[5]["epoch"])) == records[:5]
+        assert list(reader.time_range(records[-1]["epoch"] + 1)) == []
+
+
+def test_repair_torn_tail(tmp_path):
+    path = str(tmp_path / "seg_00000.srec")
+    records = make_records(400)
+    write_segment(path, records, close=False)
+    size = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write(b"R\x40\x00\x00\x00" + b"\x01" * 17)  # Crash in the middle of a record frame
+    with BinaryReader(path) as reader:
+        assert not reader.complete and reader.records == 400
+        assert list(reader.iter_records(events=False)) == records
+
+    assert repair(path) == (400, records[-1]["epoch"], 22)
+    assert os.path.getsize(path) == size
+    assert [r for r in read_records(path)[0] if "event" not in r] == records
+    assert repair(path) == (400, records[-1]["epoch"], 0)  # Nothing left to cut
+
+
+def test_repair_closed_and_headerless(tmp_path):
+    closed = str(tmp_path / "closed.srec")
+    records = make_records(50)
+    write_segment(closed, records)
+    size = os.path.getsize(closed)
+    assert repair(closed) == (50, records[-1]["epoch"], 0) and os.path.getsize(closed) == size
+
+    torn = str(tmp_path / "torn.srec")
+    with open(torn, "wb") as f:
+        f.write(b"SRVY")  # Died before the header made it to disk
+    assert repair(torn) == (0, None, 4) and os.path.getsize(torn) == 0
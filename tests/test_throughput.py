@@ -0,0 +1,100 @@
+# Native client against the bundled server over loopback, the same pair wifi-survey.py uses with iperf_local_server
+import asyncio
+import json
+import shutil
+import socket
+import subprocess
+import time
+
+import pytest
+
+from throughput import ThroughputServer, run_client
+
+
+def loopback(**kwargs):
+    async def run():
+        server = await ThroughputServer("127.0.0.1", 0).start()
+        try:
+            return await run_client("127.0.0.1", server.port, duration_s=1.0, interval_s=0.25, **kwargs)
+        finally:
+            server.close()
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("direction", ["forward", "reverse"])
+def test_tcp_loopback(direction):
+    result = loopback(direction=direction)
+    assert result.error is None
+    rate = result.tx_mbps if direction == "forward" else result.rx_mbps
+    assert rate and rate > 1
+    assert result.intervals and result.server  # Sub-second samples and the server's own results
+
+
+def test_tcp_bidir_parallel():
+    result = loopback(direction="bidir", parallel=2)
+    assert result.tx_mbps > 1 and result.rx_mbps > 1
+
+
+def test_udp_loopback_paced():
+    result = loopback(protocol="udp", bitrate_bps=20_000_000)
+    assert result.error is None
+    assert 5 < result.tx_mbps < 30  # Paced near the requested 20 Mbit/s
+    assert result.lost_pct is not None and result.lost_pct < 50
+
+
+# --- Interop with the real iperf3 ---
+needs_iperf3 = pytest.mark.skipif(shutil.which("iperf3") is None, reason="iperf3 not installed")
+
+
+def unused_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def client_when_listening(port, timeout_s=5.0, **kwargs):
+    # iperf3 -s takes a moment to bind, retry until it accepts (a probe connection would count as a failed test)
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            return await run_client("127.0.0.1", port, duration_s=1.0, **kwargs)
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+@needs_iperf3
+@pytest.mark.parametrize("protocol, direction", [("tcp", "forward"), ("tcp", "reverse"), ("udp", "forward")])
+def test_client_against_iperf3_server(protocol, direction):
+    port = unused_port()
+    server = subprocess.Popen(["iperf3", "-s", "-p", str(port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        result = asyncio.run(client_when_listening(port, protocol=protocol, direction=direction,
+                                                   bitrate_bps=20_000_000 if protocol == "udp" else 0))
+    finally:
+        server.terminate()
+        server.wait(5)
+    assert result.error is None
+    rate = result.tx_mbps if direction == "forward" else result.rx_mbps
+    assert rate and rate > 1
+    assert result.server  # iperf3 sent its side of the results in the exchange
+
+
+@needs_iperf3
+@pytest.mark.parametrize("reverse", [False, True])
+def test_server_against_iperf3_client(reverse):
+    async def run():
+        server = await ThroughputServer("127.0.0.1", 0).start()
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "iperf3", "-c", "127.0.0.1", "-p", str(server.port), "-t", "1", "--json", *(["-R"] if reverse else []),
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            out, _err = await asyncio.wait_for(proc.communicate(), 15)
+            return proc.returncode, json.loads(out)
+        finally:
+            server.close()
+
+    rc, data = asyncio.run(run())
+    assert rc == 0 and "error" not in data, data.get("error")
+    assert data["end"]["sum_received"]["bits_per_second"] > 1e6
@@ -0,0 +1,610 @@
+#!/usr/bin/env python3
+# Native iperf3-compatible throughput tester (client and lightweight server) on asyncio.
+#
+# Speaks the iperf3 control protocol (cookie, JSON parameter/result exchange, state bytes),
+# so the client works against a real `iperf3 -s` and a real `iperf3 -c` works against
+# `python3 throughput.py -s`. TCP multi-stream, UDP at a target bitrate, forward/reverse/bidir.
+import os
+import sys
+import time
+import json
+import random
+import struct
+import asyncio
+import argparse
+
+DEFAULT_PORT = 5201
+COOKIE_SIZE = 37  # 36 chars + NUL
+TCP_BLKSIZE = 128 * 1024
+UDP_BLKSIZE = 1460
+UDP_DEFAULT_BPS = 1_000_000
+VERSION = "3.16+wifi-survey"
+
+# Control channel states
+TEST_START = 1
+TEST_RUNNING = 2
+TEST_END = 4
+PARAM_EXCHANGE = 9
+CREATE_STREAMS = 10
+SERVER_TERMINATE = 11
+CLIENT_TERMINATE = 12
+EXCHANGE_RESULTS = 13
+DISPLAY_RESULTS = 14
+IPERF_DONE = 16
+ACCESS_DENIED = -1
+SERVER_ERROR = -2
+
+UDP_CONNECT_MSG = 0x36373839
+UDP_CONNECT_REPLY = 0x39383736
+LEGACY_UDP_CONNECT_MSG = 123456789
+LEGACY_UDP_CONNECT_REPLY = 987654321
+
+
+class ThroughputError(Exception):
+    pass
+
+
+def make_cookie():
+    chars = "abcdefghijklmnopqrstuvwxyz234567"
+    return "".join(random.choice(chars) for _ in range(COOKIE_SIZE - 1)).encode() + b"\x00"
+
+
+def stream_ids(n):
+    # iperf3 numbers streams 1, 3, 4, 5... and the peer checks ids when exchanging results
+    return [1] + list(range(3, n + 2))
+
+
+# --- Control channel framing ---
+async def send_state(writer, state):
+    writer.write(struct.pack("b", state))
+    await writer.drain()
+
+
+async def read_state(reader):
+    data = await reader.readexactly(1)
+    return struct.unpack("b", data)[0]
+
+
+async def send_json(writer, obj):
+    data = json.dumps(obj).encode()
+    writer.write(struct.pack("!I", len(data)) + data)
+    await writer.drain()
+
+
+async def read_json(reader):
+    (length,) = struct.unpack("!I", await reader.readexactly(4))
+    return json.loads(await reader.readexactly(length))
+
+
+# --- Per-stream accounting ---
+class StreamStats:
+    __slots__ = ("id", "sender", "bytes", "packets", "errors", "outoforder", "jitter", "prev_transit", "pcount",
+                 "start_time", "end_time")
+
+    def __init__(self, sid, sender):
+        self.id = sid
+        self.sender = sender
+        self.bytes = 0
+        self.packets = 0
+        self.errors = 0
+        self.outoforder = 0
+        self.jitter = 0.0
+        self.prev_transit = None
+        self.pcount = 0
+        self.start_time = 0.0
+        self.end_time = 0.0
+
+    def udp_received(self, packet, counters_64bit):
+        # Same loss/jitter bookkeeping as iperf_udp_recv (RFC 1889 jitter)
+        self.bytes += len(packet)
+        if counters_64bit and len(packet) >= 16:
+            sec, usec, pcount = struct.unpack("!IIQ", packet[:16])
+        elif len(packet) >= 12:
+            sec, usec, pcount = struct.unpack("!III", packet[:12])
+        else:
+            return
+        self.packets += 1
+        if pcount >= self.pcount + 1:
+            if pcount > self.pcount + 1:
+                self.errors += pcount - 1 - self.pcount
+            self.pcount = pcount
+        else:
+            self.outoforder += 1
+            if self.errors > 0:
+                self.errors -= 1
+        transit = time.time() - (sec + usec / 1e6)
+        if self.prev_transit is not None:
+            self.jitter += (abs(transit - self.prev_transit) - self.jitter) / 16.0
+        self.prev_transit = transit
+
+    def result_json(self):
+        return {"id": self.id, "bytes": self.bytes, "retransmits": -1, "jitter": self.jitter,
+                "errors": self.errors, "omitted_errors": 0, "packets": self.packets,
+                "start_time": self.start_time, "end_time": self.end_time}
+
+
+def results_json(streams, cpu):
+    return {"cpu_util_total": cpu[0], "cpu_util_user": cpu[1], "cpu_util_system": cpu[2],
+            "sender_has_retransmits": 0, "streams": [s.result_json() for s in streams]}
+
+
+class CpuMeter:
+    def __init__(self):
+        self.wall = time.monotonic()
+        self.times = os.times()
+
+    def percent(self):
+        wall = max(time.monotonic() - self.wall, 1e-9)
+        now = os.times()
+        user = (now.user - self.times.user) / wall * 100
+        system = (now.system - self.times.system) / wall * 100
+        return [round(user + system, 3), round(user, 3), round(system, 3)]
+
+
+def udp_payload(blksize, pcount, counters_64bit):
+    now = time.time()
+    sec, usec = int(now), int((now % 1) * 1e6)
+    header = struct.pack("!IIQ", sec, usec, pcount) if counters_64bit else struct.pack("!III", sec, usec, pcount & 0xFFFFFFFF)
+    return header + bytes(max(blksize - len(header), 0))
+
+
+# --- Data pumps (shared by client and server) ---
+async def pace(started, sent_bytes, bps):
+    # Sleep until sent_bytes is due at the target rate, 0 means unlimited
+    if bps:
+        ahead = sent_bytes * 8 / bps - (time.monotonic() - started)
+        if ahead > 0:
+            await asyncio.sleep(ahead)
+
+
+async def tcp_send(writer, stats, blksize, bps, stop):
+    block = bytes(blksize)
+    started = time.monotonic()
+    try:
+        while not stop.is_set():
+            writer.write(block)
+            await writer.drain()
+            stats.bytes += blksize
+            stats.packets += 1
+            await pace(started, stats.bytes, bps)
+    except (ConnectionError, OSError):
+        pass
+
+
+async def tcp_recv(reader, stats, stop):
+    try:
+        while not stop.is_set():
+            data = await reader.read(256 * 1024)
+            if not data:
+                break
+            stats.bytes += len(data)
+    except (ConnectionError, OSError):
+        pass
+
+
+async def udp_send(transport, stats, blksize, bps, counters_64bit, stop, addr=None):
+    started = time.monotonic()
+    bps = bps or UDP_DEFAULT_BPS
+    while not stop.is_set():
+        stats.pcount += 1
+        transport.sendto(udp_payload(blksize, stats.pcount, counters_64bit), addr)
+        stats.bytes += blksize
+        stats.packets += 1
+        await pace(started, stats.bytes, bps)
+        if stats.packets % 64 == 0:
+            await asyncio.sleep(0)  # Unlimited rate would otherwise starve the loop
+
+
+class UdpStreamProtocol(asyncio.DatagramProtocol):
+    # One per client UDP stream: completes the connect handshake, then counts incoming data
+    def __init__(self, stats, counters_64bit):
+        self.stats = stats
+        self.counters_64bit = counters_64bit
+        self.connected = asyncio.get_running_loop().create_future()
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if not self.connected.done():
+            if len(data) == 4 and struct.unpack("=I", data)[0] in (UDP_CONNECT_REPLY, LEGACY_UDP_CONNECT_REPLY):
+                self.connected.set_result(True)
+            return
+        self.stats.udp_received(data, self.counters_64bit)
+
+    def error_received(self, exc):
+        pass
+
+
+# --- Client ---
+class ThroughputResult:
+    def __init__(self):
+        self.sent_bytes = 0
+        self.received_bytes = 0
+        self.duration_s = 0.0
+        self.intervals = []  # [{"t": seconds, "tx_mbps": x, "rx_mbps": y}, ...]
+        self.jitter_ms = None
+        self.lost_pct = None
+        self.server = None
+        self.error = None
+
+    @property
+    def tx_mbps(self):
+        return self.sent_bytes * 8 / self.duration_s / 1e6 if self.duration_s and self.sent_bytes else None
+
+    @property
+    def rx_mbps(self):
+        return self.received_bytes * 8 / self.duration_s / 1e6 if self.duration_s and self.received_bytes else None
+
+    def interval_min(self, key):
+        vals = [i[key] for i in self.intervals if i[key] is not None]
+        return round(min(vals), 2) if vals else None
+
+    def as_dict(self):
+        return {"tx_mbps": self.tx_mbps, "rx_mbps": self.rx_mbps, "duration_s": self.duration_s,
+                "jitter_ms": self.jitter_ms, "lost_pct": self.lost_pct, "intervals": self.intervals,
+                "error": self.error}
+
+
+async def sample_intervals(result, streams, interval_s, stop):
+    # Sub-second per-interval rates from the live byte counters
+    t0 = last_t = time.monotonic()
+    last_tx = last_rx = 0
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval_s)
+        except asyncio.TimeoutError:
+            pass
+        now = time.monotonic()
+        tx = sum(s.bytes for s in streams if s.sender)
+        rx = sum(s.bytes for s in streams if not s.sender)
+        dt = now - last_t
+        if dt > 0:
+            result.intervals.append({
+                "t": round(now - t0, 3),
+                "tx_mbps": round((tx - last_tx) * 8 / dt / 1e6, 3) if any(s.sender for s in streams) else None,
+                "rx_mbps": round((rx - last_rx) * 8 / dt / 1e6, 3) if any(not s.sender for s in streams) else None,
+            })
+        last_t, last_tx, last_rx = now, tx, rx
+
+
+async def run_client(host, port=DEFAULT_PORT, duration_s=2.0, protocol="tcp", parallel=1, direction="forward",
+                     bitrate_bps=0, blksize=None, interval_s=0.25, connect_timeout_s=3.0):
+    """Run one test against an iperf3 server; direction is "forward", "reverse" or "bidir"."""
+    result = ThroughputResult()
+    udp = protocol == "udp"
+    blksize = blksize or (UDP_BLKSIZE if udp else TCP_BLKSIZE)
+    cookie = make_cookie()
+    cpu = CpuMeter()
+    stop = asyncio.Event()
+    tasks, closers, streams = [], [], []
+
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), connect_timeout_s)
+    closers.append(writer.close)
+    try:
+        writer.write(cookie)
+        await writer.drain()
+
+        while True:
+            state = await asyncio.wait_for(read_state(reader), connect_timeout_s + duration_s + 5)
+
+            if state == PARAM_EXCHANGE:
+                params = {"tcp" if not udp else "udp": True, "omit": 0, "time": int(max(1, round(duration_s))),
+                          "num": 0, "blockcount": 0, "parallel": parallel, "len": blksize, "pacing_timer": 1000,
+                          "client_version": VERSION}
+                if direction == "reverse":
+                    params["reverse"] = True
+                elif direction == "bidir":
+                    params["bidirectional"] = True
+                if bitrate_bps or udp:
+                    params["bandwidth"] = int(bitrate_bps or UDP_DEFAULT_BPS)
+                if udp:
+                    params["udp_counters_64bit"] = 1
+                await send_json(writer, params)
+
+            elif state == CREATE_STREAMS:
+                # Bidir: the first half of the streams send, the second half receive
+                if direction == "bidir":
+                    roles = [True] * parallel + [False] * parallel
+                else:
+                    roles = [direction == "forward"] * parallel
+                for sid, sender in zip(stream_ids(len(roles)), roles):
+                    stats = StreamStats(sid, sender)
+                    streams.append(stats)
+                    if udp:
+                        proto = UdpStreamProtocol(stats, True)
+                        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                            lambda p=proto: p, remote_addr=(host, port))
+                        closers.append(transport.close)
+                        transport.sendto(struct.pack("=I", UDP_CONNECT_MSG))
+                        await asyncio.wait_for(proto.connected, connect_timeout_s)
+                        if sender:
+                            tasks.append(udp_send(transport, stats, blksize, bitrate_bps, True, stop))
+                    else:
+                        s_reader, s_writer = await asyncio.wait_for(asyncio.open_connection(host, port), connect_timeout_s)
+                        closers.append(s_writer.close)
+                        s_writer.write(cookie)
+                        await s_writer.drain()
+                        tasks.append(tcp_send(s_writer, stats, blksize, bitrate_bps, stop) if sender
+                                     else tcp_recv(s_reader, stats, stop))
+
+            elif state == TEST_START:
+                pass
+
+            elif state == TEST_RUNNING:
+                started = time.monotonic()
+                pumps = [asyncio.create_task(t) for t in tasks]
+                sampler = asyncio.create_task(sample_intervals(result, streams, interval_s, stop))
+                await asyncio.sleep(duration_s)
+                stop.set()
+                result.duration_s = time.monotonic() - started
+                for s in streams:
+                    s.end_time = result.duration_s
+                await sampler
+                for p in pumps:
+                    p.cancel()
+                await asyncio.gather(*pumps, return_exceptions=True)
+                await send_state(writer, TEST_END)
+
+            elif state == EXCHANGE_RESULTS:
+                await send_json(writer, results_json(streams, cpu.percent()))
+                result.server = await read_json(reader)
+
+            elif state == DISPLAY_RESULTS:
+                await send_state(writer, IPERF_DONE)
+                break
+
+            elif state == ACCESS_DENIED:
+                raise ThroughputError("server is busy running a test")
+            elif state in (SERVER_ERROR, SERVER_TERMINATE):
+                raise ThroughputError(f"server aborted the test (state {state})")
+            else:
+                raise ThroughputError(f"unexpected control state {state}")
+    finally:
+        stop.set()
+        for close in closers:
+            close()
+
+    result.sent_bytes = sum(s.bytes for s in streams if s.sender)
+    result.received_bytes = sum(s.bytes for s in streams if not s.sender)
+    if udp:
+        _udp_summary(result, streams)
+    return result
+
+
+def _udp_summary(result, streams):
+    # Loss/jitter of what we received, or what the server received from us
+    received = [s for s in streams if not s.sender]
+    if received:
+        packets = sum(s.packets for s in received)
+        errors = sum(s.errors for s in received)
+        jitter = sum(s.jitter for s in received) / len(received)
+    elif result.server:
+        remote = result.server.get("streams", [])
+        packets = sum(s.get("packets", 0) for s in remote)
+        errors = sum(s.get("errors", 0) for s in remote)
+        jitter = sum(s.get("jitter", 0) for s in remote) / len(remote) if remote else 0.0
+    else:
+        return
+    total = packets + errors
+    result.jitter_ms = round(jitter * 1000, 3)
+    result.lost_pct = round(100.0 * errors / total, 2) if total else None
+
+
+# --- Server ---
+class ServerTest:
+    def __init__(self, cookie):
+        self.cookie = cookie
+        self.params = {}
+        self.expected = 0
+        self.streams = []  # (StreamStats, reader, writer) for TCP, (StreamStats, addr) for UDP
+        self.all_connected = asyncio.get_running_loop().create_future()
+        self.stop = asyncio.Event()
+
+    @property
+    def udp(self):
+        return bool(self.params.get("udp"))
+
+    def add_stream(self, *conn):
+        # Mirror the client: bidir receives on the first half, sends on the second
+        n = len(self.streams)
+        if self.params.get("bidirectional"):
+            sender = n >= self.expected // 2
+        else:
+            sender = bool(self.params.get("reverse"))
+        stats = StreamStats(stream_ids(self.expected)[n], sender)
+        self.streams.append((stats,) + conn)
+        if len(self.streams) == self.expected and not self.all_connected.done():
+            self.all_connected.set_result(True)
+        return stats
+
+
+class ServerUdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.by_addr = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        test = self.server.test
+        if len(data) == 4 and struct.unpack("=I", data)[0] in (UDP_CONNECT_MSG, LEGACY_UDP_CONNECT_MSG):
+            if test and test.udp and addr not in self.by_addr and len(test.streams) < test.expected:
+                self.by_addr[addr] = test.add_stream(addr)
+            self.transport.sendto(struct.pack("=I", UDP_CONNECT_REPLY), addr)
+            return
+        stats = self.by_addr.get(addr)
+        if stats is not None and not stats.sender and test and not test.stop.is_set():
+            stats.udp_received(data, bool(test.params.get("udp_counters_64bit")))
+
+
+class ThroughputServer:
+    """Lightweight iperf3-compatible server, one test at a time like the original."""
+
+    def __init__(self, host="0.0.0.0", port=DEFAULT_PORT, verbose=False):
+        self.host = host
+        self.port = port
+        self.verbose = verbose
+        self.test = None
+        self.tcp_server = None
+        self.udp = None
+        self.udp_transport = None
+
+    async def start(self):
+        self.tcp_server = await asyncio.start_server(self._on_connection, self.host, self.port, reuse_address=True)
+        self.port = self.tcp_server.sockets[0].getsockname()[1]  # Resolve port 0 for tests
+        loop = asyncio.get_running_loop()
+        self.udp = ServerUdpProtocol(self)
+        self.udp_transport, _ = await loop.create_datagram_endpoint(lambda: self.udp, local_addr=(self.host, self.port))
+        return self
+
+    def close(self):
+        if self.tcp_server:
+            self.tcp_server.close()
+        if self.udp_transport:
+            self.udp_transport.close()
+
+    async def serve_forever(self):
+        await self.tcp_server.serve_forever()
+
+    def log(self, msg):
+        if self.verbose:
+            print(msg, flush=True)
+
+    async def _on_connection(self, reader, writer):
+        try:
+            cookie = await asyncio.wait_for(reader.readexactly(COOKIE_SIZE), 5)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        test = self.test
+        if test is not None and cookie == test.cookie:
+            if len(test.streams) < test.expected and not test.udp:
+                test.add_stream(reader, writer)
+                return
+            writer.close()
+            return
+        if test is not None:
+            await send_state(writer, ACCESS_DENIED)
+            writer.close()
+            return
+        self.test = ServerTest(cookie)
+        try:
+            await self._run_test(self.test, reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.TimeoutError, ThroughputError) as e:
+            self.log(f"test aborted: {e}")
+        finally:
+            self.test.stop.set()
+            for conn in self.test.streams:
+                if len(conn) == 3:
+                    conn[2].close()
+            self.udp.by_addr.clear()
+            self.test = None
+            writer.close()
+
+    async def _run_test(self, test, reader, writer):
+        peer = writer.get_extra_info("peername")
+        cpu = CpuMeter()
+        await send_state(writer, PARAM_EXCHANGE)
+        test.params = await asyncio.wait_for(read_json(reader), 5)
+        parallel = int(test.params.get("parallel", 1))
+        test.expected = parallel * (2 if test.params.get("bidirectional") else 1)
+        self.log(f"accepted test from {peer}: {test.params}")
+
+        await send_state(writer, CREATE_STREAMS)
+        await asyncio.wait_for(test.all_connected, 10)
+        await send_state(writer, TEST_START)
+        await send_state(writer, TEST_RUNNING)
+
+        blksize = int(test.params.get("len") or (UDP_BLKSIZE if test.udp else TCP_BLKSIZE))
+        bps = int(test.params.get("bandwidth") or 0)
+        counters_64bit = bool(test.params.get("udp_counters_64bit"))
+        started = time.monotonic()
+        pumps = []
+        for conn in test.streams:
+            stats = conn[0]
+            if test.udp:
+                if stats.sender:
+                    pumps.append(udp_send(self.udp_transport, stats, blksize, bps, counters_64bit, test.stop, conn[1]))
+            elif stats.sender:
+                pumps.append(tcp_send(conn[2], stats, blksize, bps, test.stop))
+            else:
+                pumps.append(tcp_recv(conn[1], stats, test.stop))
+        pumps = [asyncio.create_task(p) for p in pumps]
+
+        # Client decides when the test ends
+        max_time = float(test.params.get("time", 10)) + 10
+        try:
+            state = await asyncio.wait_for(read_state(reader), max_time)
+        finally:
+            test.stop.set()
+            for p in pumps:
+                p.cancel()
+            await asyncio.gather(*pumps, return_exceptions=True)
+        if state != TEST_END:
+            raise ThroughputError(f"client sent state {state}")
+
+        elapsed = time.monotonic() - started
+        for conn in test.streams:
+            conn[0].end_time = elapsed
+        await send_state(writer, EXCHANGE_RESULTS)
+        await asyncio.wait_for(read_json(reader), 5)  # Client results, nothing to print
+        await send_json(writer, results_json([c[0] for c in test.streams], cpu.percent()))
+        await send_state(writer, DISPLAY_RESULTS)
+        try:
+            await asyncio.wait_for(read_state(reader), 5)  # IPERF_DONE
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        total = sum(c[0].bytes for c in test.streams)
+        self.log(f"test from {peer} done: {total * 8 / elapsed / 1e6:.1f} Mbps over {elapsed:.2f} s")
+
+
+# --- CLI ---
+async def _serve(host, port):
+    server = await ThroughputServer(host, port, verbose=True).start()
+    print(f"Server listening on {host}:{server.port} (tcp/udp)")
+    try:
+        await server.serve_forever()
+    finally:
+        server.close()
+
+
+async def _client(args):
+    direction = "bidir" if args.bidir else ("reverse" if args.reverse else "forward")
+    res = await run_client(args.client, args.port, args.time, "udp" if args.udp else "tcp", args.parallel,
+                           direction, int(args.bitrate * 1e6), args.length, args.interval)
+    for i in res.intervals:
+        print(f"{i['t']:7.2f}s  tx {i['tx_mbps']} Mbps  rx {i['rx_mbps']} Mbps")
+    print(json.dumps({k: v for k, v in res.as_dict().items() if k != "intervals"}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="iperf3-compatible throughput tester.")
+    parser.add_argument("-s", "--server", action="store_true", help="run the bundled server")
+    parser.add_argument("-c", "--client", metavar="HOST", help="run a test against HOST")
+    parser.add_argument("-B", "--bind", default="0.0.0.0", help="server bind address")
+    parser.add_argument("-p", "--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-t", "--time", type=float, default=2.0, help="test duration in seconds")
+    parser.add_argument("-u", "--udp", action="store_true")
+    parser.add_argument("-b", "--bitrate", type=float, default=0, help="target bitrate in Mbit/s (0 = unlimited TCP)")
+    parser.add_argument("-P", "--parallel", type=int, default=1)
+    parser.add_argument("-R", "--reverse", action="store_true")
+    parser.add_argument("--bidir", action="store_true")
+    parser.add_argument("-l", "--length", type=int, default=None, help="block size in bytes")
+    parser.add_argument("-i", "--interval", type=float, default=0.25, help="sample interval in seconds")
+    args = parser.parse_args()
+
+    try:
+        if args.server:
+            asyncio.run(_serve(args.bind, args.port))
+        elif args.client:
+            asyncio.run(_client(args))
+        else:
+            parser.print_usage()
+    except KeyboardInterrupt:
+        pass
+    except (OSError, ThroughputError, asyncio.TimeoutError) as e:
+        sys.exit(f"Error: {e}")
@@ -1,13 +1,59 @@
 #!/usr/bin/env python3
-import subprocess
 import time
 import json
 import sys
 import os
-import re
+import signal
 import threading
+import asyncio
+import subprocess
 import shutil
-from datetime import datetime, timezone, timedelta
+import socket
+import glob
+import argparse
+import itertools
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from survey_schema import FIELD_ORDER, NEIGHBOR_SUMMARY_FIELDS, icmp_fields, loaded_fields, app_fields
+from icmp_engine import IcmpEngine, PingResult, stats_fields
+from app_probes import AppProbe, AppProbeEngine, parse_probes, probe_fields
+from scheduler import Scheduler
+from live_view import LiveView
+from sample_store import SampleStore
+from netstate import NetStateWatcher
+from roam_capture import RoamCapture
+from throughput import ThroughputServer, ThroughputError, run_client
+from radio import open_backend, RadioError
+from scan import NeighborCache, NeighborLog, NeighborScanner
+from convert_logs import LiveExporter
+from survey_log import SegmentedLog, recover_orphans
+from metrics import REGISTRY, FAST_BUCKETS, MetricsServer, SamplingProfiler, run_subprocess
+from probe_coordinator import ProbeCoordinator, ping_airtime_s
+from floorplan import Floorplan, load_floorplan
+from collector import StreamAgent, parse_address
+from rollup import RollupWriter, rebuild as rebuild_rollups, rollup_path
+from replay import (ReplayClock, ReplayRadio, ReplayPinger, ReplayAppEngine, Pacer, CHECKED, source_map, measured_at,
+                    view_targets, iter_recorded, iter_scenario)
+
+# --- Command Line ---
+# A survey takes no arguments. --replay / --simulate push recorded or synthetic records through the
+# same store, record, log, rollup, export and live view path on a virtual clock (see replay.py).
+parser = argparse.ArgumentParser(description="Wi-Fi survey logger, settings are in config.json.")
+mode = parser.add_mutually_exclusive_group()
+mode.add_argument("--replay", metavar="SURVEY", help="replay a recorded survey (directory or .jsonl)")
+mode.add_argument("--simulate", type=int, metavar="RECORDS", help="run a synthetic walk of this many records")
+parser.add_argument("--seed", type=int, default=1, help="random seed for --simulate (default 1)")
+parser.add_argument("--speed", type=float, default=0,
+                    help="replay speed, 1 is real time, 0 as fast as possible (default)")
+parser.add_argument("--no-view", action="store_true", help="no live view while replaying, only the summary")
+parser.add_argument("--check", action="store_true",
+                    help="exit 1 if a rebuilt " + " or ".join(CHECKED) + " differs from the replayed record")
+args = parser.parse_args()
+if args.speed < 0 or (args.simulate is not None and args.simulate < 1):
+    parser.error("--speed must be 0 or more and --simulate at least 1 record")
+REPLAY_MODE = "replay" if args.replay else "sim" if args.simulate else None
 
 # --- Configuration ---
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -17,22 +63,80 @@ CONFIG_FILE = os.path.join(SCRIPT_DIR, CONFIG_FILENAME)
 # Default Config (Grouped: Meta, Paths, Targets, Timers, Features)
 DEFAULT_CONFIG = {
     "script_version": "0.3.1",
-    
+
     "log_dir": "surveys",
     "iperf_path": shutil.which("iperf3") or "/usr/bin/iperf3",
-    
+
+    "interface": "",
+    "radio_backend": "auto",
     "iperf_server": "127.0.0.1",
     "icmp_lan_server": "gateway",
     "icmp_wan_server": "8.8.8.8",
-    
+    "icmp_extra_targets": {},
+    "app_probes": {},
+
     "log_interval_s": 2,
+    "render_interval_s": 0.5,
     "wifi_scan_interval_s": 1,
     "icmp_interval_s": 1.5,
     "icmp_packet_count": 4,
+    "app_probe_interval_s": 5,
+    "app_probe_timeout_s": 3,
+    "app_probe_tls_verify": True,
     "iperf_interval_s": 15,
     "iperf_duration_s": 2,
-    
-    "export_logs": True
+    "iperf_engine": "native",
+    "iperf_port": 5201,
+    "iperf_protocol": "tcp",
+    "iperf_parallel": 1,
+    "iperf_bitrate_mbps": 0,
+    "iperf_direction": "both",
+    "iperf_sample_interval_s": 0.25,
+    "iperf_local_server": False,
+    "roam_capture": False,
+    "roam_capture_hz": 25,
+    "roam_buffer_s": 10,
+    "neighbor_scan": False,
+    "neighbor_scan_interval_s": 60,
+    "neighbor_ttl_s": 180,
+
+    "floorplan": "",
+
+    "load_policy": "gate",
+    "probe_airtime_budget_pct": 25,
+    "probe_burst_s": 30,
+    "probe_burst_factor": 3,
+    "probe_stationary_s": 120,
+    "probe_backoff_max": 1,
+
+    "max_sample_age_s": {"wifi": 5, "icmp": 10, "app": 20, "iperf": 60},
+    "stale_policy": "flag",
+
+    "metrics_port": 0,
+    "metrics_bind": "127.0.0.1",
+    "metrics_summary_interval_s": 60,
+    "profile": False,
+    "profile_interval_ms": 10,
+
+    "log_format": "jsonl",
+    "log_segment_mb": 64,
+    "log_segment_s": 3600,
+    "log_fsync": "interval",
+    "log_fsync_interval_s": 5,
+    "log_commit_interval_s": 1,
+    "rollups": True,
+    "raw_retention_h": 0,
+
+    "export_logs": True,
+    "export_columnar": "parquet",
+    "export_finalize_timeout_s": 10,
+
+    "stream_to": "",
+    "stream_agent": "",
+    "stream_token": "",
+    "stream_batch_s": 1,
+    "stream_compress": True,
+    "stream_spool_mb": 64
 }
 
 # Load or Create Config
@@ -57,374 +161,878 @@ else:
 # Apply Config
 SCRIPT_VERSION = config["script_version"]
 LOG_DIR = os.path.join(SCRIPT_DIR, config.get("log_dir", "logs"))
+REPLAY_DIR = os.path.join(LOG_DIR, "replays")  # Out of the survey_* glob, so analyze.py never mixes them in
+NIC_INTERFACE = config.get("interface") or None
+RADIO_BACKEND = config.get("radio_backend", "auto")
 IPERF_PATH = config["iperf_path"]
 IPERF_SERVER = config["iperf_server"]
 ICMP_LAN_SERVER = config["icmp_lan_server"]
 ICMP_WAN_SERVER = config["icmp_wan_server"]
 LOG_INTERVAL_S = config["log_interval_s"]
+RENDER_INTERVAL_S = config.get("render_interval_s", 0.5)
 WIFI_SCAN_INTERVAL_S = config["wifi_scan_interval_s"]
 ICMP_INTERVAL_S = config["icmp_interval_s"]
 ICMP_PACKET_COUNT = config["icmp_packet_count"]
+ICMP_EXTRA_TARGETS = config.get("icmp_extra_targets", {})
+APP_PROBES = config.get("app_probes", {})
+APP_PROBE_INTERVAL_S = config.get("app_probe_interval_s", 5)
+APP_PROBE_TIMEOUT_S = config.get("app_probe_timeout_s", 3)
+APP_PROBE_TLS_VERIFY = config.get("app_probe_tls_verify", True)
 IPERF_INTERVAL_S = config["iperf_interval_s"]
 IPERF_DURATION_S = config["iperf_duration_s"]
+IPERF_ENGINE = config.get("iperf_engine", "native")
+IPERF_PORT = config.get("iperf_port", 5201)
+IPERF_PROTOCOL = config.get("iperf_protocol", "tcp")
+IPERF_PARALLEL = config.get("iperf_parallel", 1)
+IPERF_BITRATE_MBPS = config.get("iperf_bitrate_mbps", 0)
+IPERF_DIRECTION = config.get("iperf_direction", "both")
+IPERF_SAMPLE_INTERVAL_S = config.get("iperf_sample_interval_s", 0.25)
+IPERF_LOCAL_SERVER = config.get("iperf_local_server", False)
+ROAM_CAPTURE = config.get("roam_capture", False)
+ROAM_CAPTURE_HZ = config.get("roam_capture_hz", 25)
+ROAM_BUFFER_S = config.get("roam_buffer_s", 10)
+NEIGHBOR_SCAN = config.get("neighbor_scan", False)
+NEIGHBOR_SCAN_INTERVAL_S = config.get("neighbor_scan_interval_s", 60)
+NEIGHBOR_TTL_S = config.get("neighbor_ttl_s", 180)
+FLOORPLAN = config.get("floorplan", "")
+LOAD_POLICY = config.get("load_policy", "gate")
+PROBE_AIRTIME_BUDGET_PCT = config.get("probe_airtime_budget_pct", 25)
+PROBE_BURST_S = config.get("probe_burst_s", 30)
+PROBE_BURST_FACTOR = config.get("probe_burst_factor", 3)
+PROBE_STATIONARY_S = config.get("probe_stationary_s", 120)
+PROBE_BACKOFF_MAX = config.get("probe_backoff_max", 1)  # 1 = no stationary back-off
+MAX_SAMPLE_AGE_S = config.get("max_sample_age_s", DEFAULT_CONFIG["max_sample_age_s"])
+STALE_POLICY = config.get("stale_policy", "flag")
+METRICS_PORT = config.get("metrics_port", 0)
+METRICS_BIND = config.get("metrics_bind", "127.0.0.1")
+METRICS_SUMMARY_INTERVAL_S = config.get("metrics_summary_interval_s", 60)
+PROFILE = config.get("profile", False)
+PROFILE_INTERVAL_MS = config.get("profile_interval_ms", 10)
+LOG_FORMAT = config.get("log_format", "jsonl")
+LOG_SEGMENT_MB = config.get("log_segment_mb", 64)
+LOG_SEGMENT_S = config.get("log_segment_s", 3600)
+LOG_FSYNC = config.get("log_fsync", "interval")
+LOG_FSYNC_INTERVAL_S = config.get("log_fsync_interval_s", 5)
+LOG_COMMIT_INTERVAL_S = config.get("log_commit_interval_s", 1)
+ROLLUPS = config.get("rollups", True)
+RAW_RETENTION_H = config.get("raw_retention_h", 0)
 EXPORT_LOGS = config.get("export_logs", False)
+EXPORT_COLUMNAR = config.get("export_columnar", "parquet")
+EXPORT_FINALIZE_TIMEOUT_S = config.get("export_finalize_timeout_s", 10)
+STREAM_TO = config.get("stream_to", "")
+STREAM_AGENT = config.get("stream_agent", "") or socket.gethostname()
+STREAM_TOKEN = config.get("stream_token", "")
+STREAM_BATCH_S = config.get("stream_batch_s", 1)
+STREAM_COMPRESS = config.get("stream_compress", True)
+STREAM_SPOOL_MB = config.get("stream_spool_mb", 64)
 
-# --- PyObjC Loading ---
+# --- Radio Backend ---
+# CoreWLAN on macOS, nl80211 on Linux, or a synthetic radio (see radio.py). Replays play back the recorded samples.
 try:
-    import objc
-    objc.loadBundle('CoreWLAN', bundle_path='/System/Library/Frameworks/CoreWLAN.framework', module_globals=globals())
-except ImportError:
-    sys.exit("FATAL ERROR: PyObjC is not installed. Please run 'pip3 install pyobjc-core'")
+    radio = ReplayRadio() if REPLAY_MODE else open_backend(RADIO_BACKEND, NIC_INTERFACE)
+except RadioError as e:
+    sys.exit(f"FATAL ERROR: {e}")
+
+# --- Self Metrics ---
+# How the collector itself is doing, see metrics.py. Served on /metrics if metrics_port is set.
+task_duration = REGISTRY.histogram("task_duration_seconds", "Scheduled task run time", ("task",))
+task_lateness = REGISTRY.histogram("task_lateness_seconds", "Task start delay vs its deadline", ("task",), FAST_BUCKETS)
+task_runs = REGISTRY.counter("task_runs_total", "Scheduled task runs by outcome", ("task", "outcome"))
+probe_errors = REGISTRY.counter("probe_errors_total", "Failed probes by probe and reason", ("probe", "reason"))
+lock_wait = REGISTRY.histogram("store_lock_wait_seconds", "Sample store writer lock wait", ("source",), FAST_BUCKETS)
+lock_hold = REGISTRY.histogram("store_lock_hold_seconds", "Sample store writer lock hold", ("source",), FAST_BUCKETS)
+log_write = REGISTRY.histogram("log_write_seconds", "Group commit: serialize, write, flush (and fsync)", (), FAST_BUCKETS)
+log_commit_records = REGISTRY.histogram("log_commit_records", "Records per group commit", (), (1, 2, 5, 10, 50, 100, 1000))
+stale_records = REGISTRY.counter("stale_records_total", "Logged records with a stale source", ("source",))
+probes_gated = REGISTRY.counter("probes_gated_total", "Probe runs skipped during a throughput test", ("probe",))
+REGISTRY.gauge("probe_airtime_ratio", "Share of airtime spent on measurement (budget window)",
+               fn=lambda: {(): round(coordinator.budget.used(), 4)})
+
+def observe_task(name, lateness_ms, duration_ms, outcome):
+    task_duration.observe(duration_ms / 1e3, name)
+    task_lateness.observe(max(lateness_ms, 0) / 1e3, name)
+    task_runs.inc(name, outcome)
+
+def observe_lock(source, wait_ns, hold_ns):
+    lock_wait.observe(wait_ns / 1e9, source)
+    lock_hold.observe(hold_ns / 1e9, source)
 
 # --- Shared State ---
-data_lock = threading.Lock()
-# Initialize with flattened keys ensuring order for first print
-latest_data = {
-    # Keys will be populated by workers
-    "location": "Initializing...",
-    "ssid": None, "bssid": None, "channel": None, 
-    "tx_rate_mbps": None, "rssi_dbm": None, "noise_dbm": None,
-    # New Fields
-    "nic_ip": None, "nic_gw_ip": None, "auth_mode": None,
-    "country_code": None, "nic_mac": None, "channel_width": None, "phy_mode": None,
-    # Stats
-    "icmp_lan_ms": None, "icmp_lan_lost": None, "icmp_lan_count": None,
-    "icmp_wan_ms": None, "icmp_wan_lost": None, "icmp_wan_count": None,
-    "iperf_rx_mbps": None, "iperf_tx_mbps": None, "iperf_updated_at": None
-}
+# Every metric is stored with its source and measurement time, see sample_store.py.
+# Replays run on a virtual clock, so ages, stale flags and epochs come out as they were recorded.
+clock = ReplayClock() if REPLAY_MODE else time
+store = SampleStore(clock_ns=clock.monotonic_ns, lock_observer=observe_lock)
+REGISTRY.gauge("sample_age_seconds", "Age of the newest sample per source", ("source",),
+               fn=lambda: {(src,): age / 1e3 for src, age in store.snapshot().source_ages_ms().items()})
+store.update("location", {"location": "Initializing..."})
+
+# --- Probe Coordination ---
+# Keeps pings off a link iperf is saturating, tags what overlapped anyway, adapts probe rates (see probe_coordinator.py)
+try:
+    coordinator = ProbeCoordinator(LOAD_POLICY, PROBE_AIRTIME_BUDGET_PCT, PROBE_BURST_S, PROBE_BURST_FACTOR,
+                                   PROBE_STATIONARY_S, PROBE_BACKOFF_MAX, clock_ns=clock.monotonic_ns)
+except ValueError as e:
+    sys.exit(f"FATAL ERROR: {e}")
+probe_state = {"loop": None}
+
+def on_motion(kind):
+    # Roam or location change, from any thread: burst the probes and run them now
+    loop = probe_state["loop"]
+    if loop:
+        loop.call_soon_threadsafe(coordinator.motion, kind)
+
+# --- App Probes ---
+# TCP connect, DNS and HTTP(S) TTFB targets from config.json, {name: url} (see app_probes.py)
+try:
+    app_probes = parse_probes(APP_PROBES)
+except (ValueError, AttributeError) as e:
+    sys.exit(f"FATAL ERROR: Bad app_probes entry: {e}")
+
+# --- Floorplan ---
+# Location names -> x, y for coverage heatmaps, "name @ x, y" at the prompt works without a file
+try:
+    floorplan = Floorplan(load_floorplan(FLOORPLAN) if FLOORPLAN else None)
+except (OSError, ValueError, TypeError, IndexError) as e:
+    sys.exit(f"FATAL ERROR: Cannot read floorplan {FLOORPLAN}: {e}")
+
+def set_location(text):
+    name, x, y = floorplan.resolve(text)
+    store.update("location", {"location": name, "x": x, "y": y})
+    live_view.invalidate()
+    on_motion("location")
 
 # --- Workers ---
 def location_input_thread():
     try:
-        new_location = input("Enter starting location: ")
-        with data_lock: latest_data["location"] = new_location
+        set_location(input("Enter starting location: "))
         while True:
-            new_location = input()
-            with data_lock: latest_data["location"] = new_location
+            set_location(input())
     except EOFError:
         return
 
-def get_gateway_ip():
+wifi_state = {"last_bssid": None, "poll": None}
+# Radio polls get their own thread: a stalled CoreWLAN/nl80211 call holds only this one,
+# not the default executor that iperf and friends use
+wifi_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wifi-poll")
+
+def wifi_poll():
+    # One radio sample, run off the event loop since backend calls may block
+    began = clock.monotonic_ns()
     try:
-        res = subprocess.run(["route", "-n", "get", "default"], capture_output=True, text=True)
-        match = re.search(r"gateway:\s+([\d\.]+)", res.stdout)
-        return match.group(1) if match else None
-    except: return None
-
-def wifi_worker():
-    loop_count = 0
-    last_bssid = None
-    
-    while True:
+        sample = radio.sample()
+    except Exception as e:
+        probe_errors.inc("wifi", type(e).__name__)
+        return  # Keep silent to not span console, user sees N/A in live view, counted in metrics
+    last_bssid, curr_bssid = wifi_state["last_bssid"], sample["bssid"]
+    wifi_state["last_bssid"] = curr_bssid
+    store.update("wifi", sample)
+    coordinator.tag("wifi", began)  # tx_rate_mbps during a test is what iperf pushed it to
+
+    # IP/Gateway come from net_watcher, a roam only re-arms its re-IP timer
+    # (roam capture does this itself, with a much tighter timestamp)
+    if last_bssid and curr_bssid and curr_bssid != last_bssid and not ROAM_CAPTURE:
+        net_watcher.roamed(time.monotonic_ns())
+        on_motion("roam")
+
+async def wifi_task():
+    # A task timeout only cancels the wait, the poll keeps running, so skip ticks until it returns
+    poll = wifi_state["poll"]
+    if poll is not None and not poll.done():
+        probe_errors.inc("wifi", "busy")
+        return
+    poll = wifi_state["poll"] = asyncio.get_running_loop().run_in_executor(wifi_executor, wifi_poll)
+    await asyncio.shield(poll)
+
+def icmp_targets():
+    # Resolve "gateway" to actual IP, targets without an address are skipped this cycle
+    targets = {}
+    for prefix, target in [("lan", ICMP_LAN_SERVER), ("wan", ICMP_WAN_SERVER)] + list(ICMP_EXTRA_TARGETS.items()):
+        if target == "gateway":
+            target = store.get("nic_gw_ip")
+        if target:
+            targets[prefix] = target
+    return targets
+
+# One engine, one socket, every target pinged concurrently
+icmp_engine = ReplayPinger() if REPLAY_MODE else IcmpEngine(spacing_s=0.1, timeout_s=1.0)
+
+async def icmp_task(only=None):
+    if coordinator.gate("icmp"):
+        probes_gated.inc("icmp")
+        return  # Throughput test running, the next tick after it is a clean sample
+    targets = icmp_targets()
+    if only:
+        targets = {k: v for k, v in targets.items() if k in only}
+    began = clock.monotonic_ns()
+    with coordinator.probing():
         try:
-            client = CWWiFiClient.sharedWiFiClient()  # noqa: F821
-            interface = client.interface()
-            
-            if interface:
-                # Helper to safely get attributes that might be missing on older OS
-                def safe_get(obj, attr, default=None):
-                    try:
-                        val = getattr(obj, attr)
-                        return val() if callable(val) else val
-                    except: return default
-
-                # Mappings
-                phy_map = {0:"Unknown", 1:"11a", 2:"11b", 3:"11g", 4:"11n", 5:"11ac", 6:"11ax", 7:"11be"}
-                
-                # Security/Auth Mode Mapping
-                sec_map = {
-                    0: "Open",
-                    1: "WEP",
-                    2: "WPA-PSK",
-                    3: "WPA/2-PSK",
-                    4: "WPA2-PSK",
-                    5: "Personal",
-                    6: "Dynamic WEP",
-                    7: "WPA-EAP",
-                    8: "WPA/2-EAP",
-                    9: "WPA2-EAP", 
-                    10: "Enterprise",
-                    11: "WPA3-SAE",
-                    12: "WPA3-EAP",
-                    13: "WPA3-Mix"
-                }
-                sec_raw = safe_get(interface, 'security')
-                auth_mode = sec_map.get(sec_raw, str(sec_raw) if sec_raw is not None else "Unknown")
-
-                # Channel Width & Band
-                cw_channel = safe_get(interface, 'wlanChannel')
-                chan_band_str = "Unknown"
-                chan_width_str = "Unknown"
-                if cw_channel:
-                    # Band Mapping
-                    b = safe_get(cw_channel, 'channelBand')
-                    if b == 1: chan_band_str = "2.4GHz"
-                    elif b == 2: chan_band_str = "5GHz"
-                    elif b == 3: chan_band_str = "6GHz"
-                    
-                    # Width Mapping
-                    w = safe_get(cw_channel, 'channelWidth')
-                    if w == 1: chan_width_str = "20MHz"
-                    elif w == 2: chan_width_str = "40MHz"
-                    elif w == 3: chan_width_str = "80MHz"
-                    elif w == 4: chan_width_str = "160MHz"
-                    elif w == 5: chan_width_str = "320MHz"
-
-                curr_bssid = interface.bssid()
-                roam_event = (last_bssid and curr_bssid and curr_bssid != last_bssid)
-                last_bssid = curr_bssid
-
-                with data_lock:
-                    latest_data["ssid"] = interface.ssid()
-                    latest_data["bssid"] = curr_bssid
-                    latest_data["channel"] = interface.channel()
-                    latest_data["rssi_dbm"] = interface.rssiValue()
-                    latest_data["noise_dbm"] = interface.noiseMeasurement()
-                    latest_data["tx_rate_mbps"] = interface.transmitRate()
-                    latest_data["phy_mode"] = phy_map.get(safe_get(interface, 'activePHYMode'), "Other")
-                    
-                    # New Metadata
-                    latest_data["auth_mode"] = auth_mode
-                    latest_data["nic_mac"] = safe_get(interface, 'hardwareAddress')
-                    latest_data["country_code"] = safe_get(interface, 'countryCode')
-                    latest_data["channel_band"] = chan_band_str
-                    latest_data["channel_width"] = chan_width_str
-                    
-                # Throttled IP/Gateway Fetch
-                if loop_count % 5 == 0 or roam_event:
-                    try:
-                        # IP Fetch
-                        ip_raw = subprocess.run(["ipconfig", "getifaddr", "en0"], capture_output=True, text=True).stdout.strip()
-                        # Gateway Fetch
-                        gw_ip = get_gateway_ip()
-
-                        with data_lock: 
-                            latest_data["nic_ip"] = ip_raw
-                            latest_data["nic_gw_ip"] = gw_ip
-                    except: pass
-                    
-                loop_count += 1
-                    
-        except Exception as e:
-            pass # Keep silent to not span console, user sees N/A in live view
-
-        time.sleep(WIFI_SCAN_INTERVAL_S)
-
-def icmp_worker(target_config, prefix):
-    while True:
-        # Resolve "gateway" to actual IP
-        if target_config == "gateway":
-            with data_lock:
-                target = latest_data.get("nic_gw_ip")
-            if not target:
-                time.sleep(ICMP_INTERVAL_S)
-                continue  # Gateway not yet detected, skip this cycle
-        else:
-            target = target_config
-        
+            results = await icmp_engine.probe_many(targets, ICMP_PACKET_COUNT)
+        except OSError:
+            icmp_engine.close()  # No ICMP socket permission or interface gone, report everything as lost
+            results = {prefix: None for prefix in targets}
+    coordinator.budget.charge("icmp", ping_airtime_s(sum(r.sent for r in results.values() if r),
+                                                     store.get("tx_rate_mbps")))
+
+    for prefix, result in results.items():
+        store.update(f"icmp_{prefix}", stats_fields(prefix, result, ICMP_PACKET_COUNT))
+        coordinator.tag(f"icmp_{prefix}", began)
+        if result is None:
+            probe_errors.inc(f"icmp_{prefix}", "socket")
+        elif result.error:
+            probe_errors.inc(f"icmp_{prefix}", result.error.split(":")[0])  # resolve / send
+        elif not result.rtts:
+            probe_errors.inc(f"icmp_{prefix}", "no_reply")
+
+# Same loop, keep-alive HTTP connections and one UDP socket per resolver between runs
+app_engine = (ReplayAppEngine() if REPLAY_MODE
+              else AppProbeEngine(timeout_s=APP_PROBE_TIMEOUT_S, verify_tls=APP_PROBE_TLS_VERIFY))
+
+async def app_task(only=None):
+    if coordinator.gate("app"):
+        probes_gated.inc("app")
+        return
+    # "gateway" hosts follow the current gateway, skipped until there is one
+    gateway = store.get("nic_gw_ip")
+    probes = {n: p for n, p in app_probes.items() if p.host != "gateway" or gateway}
+    if only:
+        probes = {n: p for n, p in probes.items() if n in only}
+    began = clock.monotonic_ns()
+    with coordinator.probing():
+        results = await app_engine.probe_many(probes, {n: gateway for n, p in probes.items() if p.host == "gateway"})
+    coordinator.budget.charge("app", sum(r.airtime_s(store.get("tx_rate_mbps")) for r in results.values()))
+
+    for name, result in results.items():
+        store.update(f"app_{name}", probe_fields(name, result.kind, result))
+        coordinator.tag(f"app_{name}", began)
+        if result.error:
+            probe_errors.inc(f"app_{name}", result.error.split(":")[0])  # timeout / refused / rcode / http...
+
+def iperf_run(reverse):
+    # Legacy path: iperf_engine "iperf3" shells out to the binary
+    cmd = [IPERF_PATH, "-c", IPERF_SERVER, "-p", str(IPERF_PORT), "-t", str(IPERF_DURATION_S), "--json"]
+    cmd += ["-R"] if reverse else []
+    try:
+        res = run_subprocess(cmd, capture_output=True, text=True, timeout=IPERF_DURATION_S+2)
+        data = json.loads(res.stdout)
+        if reverse:
+            return data['end']['sum_received']['bits_per_second'] / 1e6
+        return data['end']['sum_sent']['bits_per_second'] / 1e6
+    except Exception as e:
+        probe_errors.inc("iperf", type(e).__name__)
+        return None
+
+async def iperf_native(direction):
+    # In-process test, per-interval samples give the worst sub-second dip alongside the mean
+    try:
+        res = await run_client(IPERF_SERVER, IPERF_PORT, IPERF_DURATION_S, IPERF_PROTOCOL, IPERF_PARALLEL,
+                               direction, int(IPERF_BITRATE_MBPS * 1e6), interval_s=IPERF_SAMPLE_INTERVAL_S)
+    except (OSError, ThroughputError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+        probe_errors.inc("iperf", type(e).__name__)
+        return None, f"{type(e).__name__}: {e}"
+    return res, None
+
+def iperf_fields(res, error, rx, tx):
+    fields = {"iperf_error": error}
+    if rx:
+        fields.update({"iperf_rx_mbps": res.rx_mbps if res else None,
+                       "iperf_rx_min_mbps": res.interval_min("rx_mbps") if res else None})
+    if tx:
+        fields.update({"iperf_tx_mbps": res.tx_mbps if res else None,
+                       "iperf_tx_min_mbps": res.interval_min("tx_mbps") if res else None})
+    if IPERF_PROTOCOL == "udp":
+        fields.update({"iperf_jitter_ms": res.jitter_ms if res else None,
+                       "iperf_lost_pct": res.lost_pct if res else None})
+    return fields
+
+iperf_state = {"running": False, "loaded": {}}
+
+async def iperf_task():
+    # Flagged while a test runs, neighbor scans hold off until it's done
+    iperf_state["running"] = True
+    iperf_state["loaded"] = {}
+    try:
+        await iperf_measure()
+    finally:
+        iperf_state["running"] = False
+    if iperf_state["loaded"]:
+        fields = {}
+        for prefix, result in iperf_state["loaded"].items():
+            stats = result.stats()
+            fields.update(zip(loaded_fields(prefix), (stats["avg"], stats["p95"], stats["lost"])))
+        store.update("loaded", fields)
+
+async def loaded_latency(acc):
+    # Pings alongside a throughput test until cancelled, the gap to idle latency is the bufferbloat
+    targets = icmp_targets()
+    while targets:
         try:
-            # Using -n to avoid DNS lookups for speed
-            cmd = ["ping", "-c", str(ICMP_PACKET_COUNT), "-i", "0.1", "-t", "1", target]
-            icmp_raw = subprocess.run(cmd, capture_output=True, text=True, timeout=2).stdout
-            
-            loss_match = re.search(r"(\d+\.?\d*)%\s+packet\s+loss", icmp_raw)
-            packet_loss = float(loss_match.group(1)) if loss_match else 100.0
-            
-            rtt_match = re.search(r"min/avg/max/stddev\s*=\s*[\d.]+/([\d.]+)/", icmp_raw)
-            avg_ms = round(float(rtt_match.group(1))) if rtt_match else None
-            
-            with data_lock:
-                latest_data[f"icmp_{prefix}_ms"] = avg_ms
-                latest_data[f"icmp_{prefix}_lost"] = round(packet_loss)
-                if prefix == "lan": latest_data["icmp_lan_count"] = ICMP_PACKET_COUNT
-                elif prefix == "wan": latest_data["icmp_wan_count"] = ICMP_PACKET_COUNT
-                
-        except:
-             with data_lock:
-                latest_data[f"icmp_{prefix}_ms"] = None
-                latest_data[f"icmp_{prefix}_lost"] = 100.0
-                if prefix == "lan": latest_data["icmp_lan_count"] = ICMP_PACKET_COUNT
-                elif prefix == "wan": latest_data["icmp_wan_count"] = ICMP_PACKET_COUNT
-
-        time.sleep(ICMP_INTERVAL_S)
-
-def iperf_worker():
-    while True:
-        # Rx
+            results = await icmp_engine.probe_many(targets, ICMP_PACKET_COUNT)
+        except OSError:
+            return
+        for prefix, res in results.items():
+            total = acc.setdefault(prefix, PingResult(res.target))
+            total.sent += res.sent
+            total.rtts += res.rtts
+        coordinator.budget.charge("icmp", ping_airtime_s(sum(r.sent for r in results.values()),
+                                                         store.get("tx_rate_mbps")))
+        if not any(r.sent for r in results.values()):
+            await asyncio.sleep(1.0)  # Nothing went out (resolve or send failed), retry without spinning the loop
+
+async def under_load(run):
+    # One throughput run as a load window for the coordinator, with loaded-latency pings alongside if configured
+    async with coordinator.load():
+        pinger = asyncio.create_task(loaded_latency(iperf_state["loaded"])) if LOAD_POLICY == "loaded" else None
         try:
-            res = subprocess.run([IPERF_PATH, "-c", IPERF_SERVER, "-t", str(IPERF_DURATION_S), "-R", "--json"], 
-                                capture_output=True, text=True, timeout=IPERF_DURATION_S+2)
-            data = json.loads(res.stdout)
-            rx_mbps = data['end']['sum_received']['bits_per_second'] / 1e6
-        except: rx_mbps = None
-        
-        with data_lock:
-            latest_data["iperf_rx_mbps"] = rx_mbps
-            latest_data["iperf_updated_at"] = time.time()
-
-        time.sleep(2)  # Give radio a moment to recover
+            return await run
+        finally:
+            if pinger:
+                pinger.cancel()
+                await asyncio.gather(pinger, return_exceptions=True)
 
+async def iperf_measure():
+    if IPERF_ENGINE == "iperf3":
+        # Rx
+        rx_mbps = await under_load(asyncio.to_thread(iperf_run, True))
+        store.update("iperf_rx", {"iperf_rx_mbps": rx_mbps})
+        await asyncio.sleep(2)  # Give radio a moment to recover
         # Tx
-        try:
-            res = subprocess.run([IPERF_PATH, "-c", IPERF_SERVER, "-t", str(IPERF_DURATION_S), "--json"], 
-                                capture_output=True, text=True, timeout=IPERF_DURATION_S+2)
-            data = json.loads(res.stdout)
-            tx_mbps = data['end']['sum_sent']['bits_per_second'] / 1e6
-        except: tx_mbps = None
-
-        with data_lock:
-            latest_data["iperf_tx_mbps"] = tx_mbps
-            latest_data["iperf_updated_at"] = time.time()
-        
-        time.sleep(IPERF_INTERVAL_S)
+        tx_mbps = await under_load(asyncio.to_thread(iperf_run, False))
+        store.update("iperf_tx", {"iperf_tx_mbps": tx_mbps})
+        return
+
+    if IPERF_DIRECTION == "both":
+        res, error = await under_load(iperf_native("reverse"))
+        store.update("iperf_rx", iperf_fields(res, error, rx=True, tx=False))
+        await asyncio.sleep(2)  # Give radio a moment to recover
+        res, error = await under_load(iperf_native("forward"))
+        store.update("iperf_tx", iperf_fields(res, error, rx=False, tx=True))
+    else:
+        res, error = await under_load(iperf_native(IPERF_DIRECTION))
+        rx, tx = IPERF_DIRECTION in ("reverse", "bidir"), IPERF_DIRECTION in ("forward", "bidir")
+        if rx:
+            store.update("iperf_rx", iperf_fields(res, error, rx=True, tx=False))
+        if tx:
+            store.update("iperf_tx", iperf_fields(res, error, rx=False, tx=True))
+
+# --- Network State ---
+def on_net_change(state, changed, reip_ms):
+    store.update("net", {"nic_ip": state["ip"], "nic_gw_ip": state["gateway"],
+                         "nic_dns": ",".join(state["dns"]) or None})
+    if reip_ms is not None:
+        store.update("reip", {"nic_reip_ms": reip_ms})
+        if roam_state["capture"]:
+            roam_state["capture"].note_ip(time.monotonic_ns())
+    # New gateway after a roam/re-IP: ping it now instead of waiting for the next ICMP tick
+    if "gateway" in changed and state["gateway"]:
+        gw_prefixes = [p for p, t in [("lan", ICMP_LAN_SERVER), ("wan", ICMP_WAN_SERVER)] + list(ICMP_EXTRA_TARGETS.items())
+                       if t == "gateway"]
+        if gw_prefixes:
+            asyncio.get_running_loop().create_task(icmp_task(only=gw_prefixes))
+
+net_watcher = NetStateWatcher(NIC_INTERFACE, on_net_change)
+
+# --- Roam Capture ---
+roam_state = {"capture": None, "path": None}
+
+def start_roam_capture(loop):
+    def on_roam(t_ns):
+        net_watcher.roamed(t_ns)
+        on_motion("roam")
+        # Probe right away so time-to-first-ping isn't bounded by the ICMP interval
+        loop.call_soon_threadsafe(lambda: loop.create_task(icmp_task()))
+
+    capture = RoamCapture(radio.sample_fast, roam_state["path"], ROAM_CAPTURE_HZ, ROAM_BUFFER_S, on_roam,
+                          context_fn=lambda: {"location": store.get("location")})
+    icmp_engine.on_reply = lambda addr, rtt_ms: capture.note_ping(time.monotonic_ns())
+    roam_state["capture"] = capture.start()
+    return capture
+
+# --- Neighbor Scan ---
+scan_state = {"scanner": None, "path": None}
+
+def on_scan(scanner, summary):
+    store.update("scan", summary)
+    coordinator.budget.charge("scan", scanner.last_duration_ms / 1e3)  # Off-channel time
+
+def start_neighbor_scan(scheduler):
+    log = NeighborLog(scan_state["path"], csv_path=scan_state["path"].rsplit(".", 1)[0] + ".csv" if EXPORT_LOGS else None)
+    scanner = NeighborScanner(radio.scan, NeighborCache(NEIGHBOR_TTL_S), log, NEIGHBOR_SCAN_INTERVAL_S,
+                              busy_fn=lambda: iperf_state["running"],
+                              context_fn=lambda: {"location": store.get("location")},
+                              on_scan=lambda summary: on_scan(scanner, summary))
+    scheduler.every("scan", 1, scanner.tick)
+    scan_state["scanner"] = scanner
+    return scanner
 
 # --- Live View ---
-def display_live_view(log_path):
-    os.system('cls' if os.name == 'nt' else 'clear')
+live_view = LiveView(SCRIPT_VERSION, ICMP_EXTRA_TARGETS, {n: p.kind for n, p in app_probes.items()})
+
+async def render_task():
+    # Redraw from the in-memory state, faster than records are logged
+    live_view.render(snapshot_values(store.snapshot()))
+
+# --- Logging ---
+log_state = {"columns": FIELD_ORDER, "writer": None, "previous_bssid": None, "exporter": None, "signal": None, "stream": None, "rollups": None}
+
+def observe_commit(records, seconds):
+    log_write.observe(seconds)
+    log_commit_records.observe(records)
+
+def snapshot_values(snap):
+    # Values plus the age of each source, stale sources flagged (or blanked with stale_policy "drop")
+    values = snap.values()
+    for src, age_ms in snap.source_ages_ms().items():
+        if src != "location":
+            values[f"age_{src}_ms"] = age_ms
+    stale = snap.stale_sources(MAX_SAMPLE_AGE_S)
+    if STALE_POLICY == "drop":
+        for field, sample in snap.samples.items():
+            if sample.source in stale:
+                values[field] = None
+    values["stale"] = ",".join(stale) or None
+    values["under_load"] = ",".join(coordinator.under_load_sources()) or None
+    return values
+
+def build_record(snapshot):
+    # Computed Fields, sub-second wall clock stamp taken when the record is built
+    now = clock.time()
+    snapshot["epoch"] = round(now, 3)
+    snapshot["timestamp"] = datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+    curr_bssid = snapshot.get("bssid")
+    previous_bssid = log_state["previous_bssid"]
+    snapshot["bss_transition"] = 1 if (previous_bssid and curr_bssid and curr_bssid != previous_bssid) else 0
+    if curr_bssid: log_state["previous_bssid"] = curr_bssid
+
+    try: snapshot["snr"] = int(snapshot["rssi_dbm"]) - int(snapshot["noise_dbm"])
+    except: snapshot["snr"] = 0
+
+    # Reconstruct Ordered Dict
+    return {k: snapshot.get(k) for k in log_state["columns"]}
+
+def log_record():
+    # Snapshot data, lock-free
+    final_record = build_record(snapshot_values(store.snapshot()))
+
+    # Write, the log writer thread serializes and group-commits
+    log_state["writer"].write(final_record)
+    if log_state["stream"]:
+        log_state["stream"].write(final_record)
+    if log_state["rollups"]:
+        log_state["rollups"].add(final_record)
+    for src in (final_record["stale"] or "").split(","):
+        if src:
+            stale_records.inc(src)
+
+    live_view.push(final_record)
+    if log_state["exporter"]:
+        log_state["exporter"].add(final_record)
+    return final_record
+
+async def log_task():
+    log_record()
+
+async def metrics_task():
+    # Periodic self-metrics line in the survey log, readers skip lines with an "event" key
+    log_state["writer"].write({"event": "metrics", "epoch": round(clock.time(), 3), **REGISTRY.summary(),
+                               "radio": radio.cost.summary()})
+
+async def run_survey(scheduler):
+    # Per-task timeouts: a hung probe is abandoned, the next tick starts on schedule
+    scheduler.every("wifi", WIFI_SCAN_INTERVAL_S, wifi_task, timeout_s=max(WIFI_SCAN_INTERVAL_S, 2))
+    # Probes that cost airtime run at the coordinator's current rate (burst, back-off, the budget only stretches iperf)
+    coordinator.register("icmp", ICMP_INTERVAL_S)
+    scheduler.every("icmp", ICMP_INTERVAL_S, icmp_task, timeout_s=ICMP_INTERVAL_S + 2,
+                    interval_fn=lambda: coordinator.interval_s("icmp"))
+    if app_probes:
+        coordinator.register("app", APP_PROBE_INTERVAL_S)
+        scheduler.every("app", APP_PROBE_INTERVAL_S, app_task, timeout_s=APP_PROBE_TIMEOUT_S + 2,
+                        interval_fn=lambda: coordinator.interval_s("app"))
+    # iperf_interval_s is the idle gap between tests, so the period includes both runs.
+    # A new location gets a test right away, more tests than that would eat the airtime.
+    coordinator.register("iperf", IPERF_INTERVAL_S + 2 * IPERF_DURATION_S + 2, burst=False, wake_on=("location",),
+                         heavy=True)
+    scheduler.every("iperf", IPERF_INTERVAL_S + 2 * IPERF_DURATION_S + 2, iperf_task,
+                    timeout_s=2 * (IPERF_DURATION_S + 2) + 4 + (4 if LOAD_POLICY != "tag" else 0),
+                    interval_fn=lambda: coordinator.interval_s("iperf"))
+    coordinator.on_wake = scheduler.wake
+    probe_state["loop"] = asyncio.get_running_loop()
+    scheduler.every("log", LOG_INTERVAL_S, log_task, timeout_s=LOG_INTERVAL_S, offset_s=LOG_INTERVAL_S)
+    scheduler.every("render", RENDER_INTERVAL_S, render_task, timeout_s=RENDER_INTERVAL_S)
+    scanner = start_neighbor_scan(scheduler) if NEIGHBOR_SCAN else None
+    if METRICS_SUMMARY_INTERVAL_S:
+        scheduler.every("metrics", METRICS_SUMMARY_INTERVAL_S, metrics_task, offset_s=METRICS_SUMMARY_INTERVAL_S)
+    metrics_server = await MetricsServer(REGISTRY, METRICS_BIND, METRICS_PORT).start() if METRICS_PORT else None
+    # Bundled server for loopback/self tests, no iperf3 needed on this host
+    server = await ThroughputServer("127.0.0.1", IPERF_PORT).start() if IPERF_LOCAL_SERVER else None
+    await net_watcher.start()
+    capture = start_roam_capture(asyncio.get_running_loop()) if ROAM_CAPTURE else None
+
+    # SIGTERM (shutdown, kill) and SIGHUP (terminal closed) stop the survey like Ctrl+C does
+    def on_signal(sig):
+        log_state["signal"] = sig.name
+        scheduler.cancel()
+    for sig in (signal.SIGTERM, signal.SIGHUP):
+        asyncio.get_running_loop().add_signal_handler(sig, on_signal, sig)
     try:
-        # Read last line
-        with open(log_path, 'rb') as f:
-            try:  # Handle empty file
-                f.seek(-4096, 2)
-            except IOError: 
-                f.seek(0)
-            last_line = f.readlines()[-1].decode()
-            record = json.loads(last_line)
-    except:
-        print("Waiting for data...")
-        return
+        await scheduler.run()
+    except asyncio.CancelledError:
+        if not log_state["signal"]:
+            raise
+    finally:
+        icmp_engine.close()
+        app_engine.close()
+        wifi_executor.shutdown(wait=False)
+        net_watcher.close()
+        if capture:
+            capture.stop()
+        if scanner:
+            scanner.cancel()
+            scanner.log.close()
+        if server:
+            server.close()
+        if metrics_server:
+            metrics_server.close()
+
+
+# --- Replay ---
+# Recorded or synthetic records instead of probes: every source is replayed at the time it was measured
+# (epoch minus its age). Radio, ping and app probe samples go through wifi_poll, icmp_task and app_task
+# (and on_net_change) from the replay stand-ins, then the record is built, logged and shown like a live one.
+replay_state = {"records": 0, "roams": 0, "mismatches": collections.Counter(), "examples": [], "fed": {}}
+
+
+async def replay_source(src, values):
+    # One new measurement, through the code that took it live, at the current (virtual) time
+    if src == "wifi":
+        radio.feed(values)
+        wifi_poll()
+    elif src == "net":
+        state = {"ip": values.get("nic_ip"), "gateway": values.get("nic_gw_ip"),
+                 "dns": [d for d in (values.get("nic_dns") or "").split(",") if d]}
+        on_net_change(state, (), None)  # No ping target follows the gateway in a replay, re-IP times are replayed as is
+    elif src.startswith("icmp_"):
+        await icmp_task(only=[src[5:]])
+    else:
+        await app_task(only=[src[4:]])
+
+
+def replayed_by_task(src):
+    return src in ("wifi", "net") or (src.startswith("icmp_") and src[5:] in icmp_targets()) or \
+        (src.startswith("app_") and src[4:] in app_probes)
+
+
+async def replay_record(rec, sources):
+    icmp_engine.feed(rec)
+    app_engine.feed(rec)
+    measured = measured_at(rec, sources)
+    fed = replay_state["fed"]
+    for src in sorted(measured, key=lambda src: measured[src][0]):
+        if fed.get(src) == measured[src]:
+            continue  # Same sample as in the last record
+        fed[src] = measured[src]
+        t_ms, values = measured[src]
+        if replayed_by_task(src) and t_ms * 1_000_000 >= clock.monotonic_ns():
+            clock.set(t_ms / 1000)
+            await replay_source(src, values)
+        else:
+            # Location, re-IP times, iperf, scans and loaded pings (no stand-ins for those), or a sample older
+            # than the replay already is (the first record's, synthetic dropouts): straight into the store
+            store.update(src, values, t_ms * 1_000_000)
+    # Load tags as the coordinator set them, no throughput test runs in a replay
+    clock.set(rec["epoch"])
+    coordinator.under_load = {src: True for src in (rec.get("under_load") or "").split(",") if src}
+
+    record = log_record()
+    replay_state["records"] += 1
+    replay_state["roams"] += record["bss_transition"]
+    for field in CHECKED:
+        if field in rec and rec[field] != record.get(field):
+            replay_state["mismatches"][field] += 1
+            if len(replay_state["examples"]) < 5:
+                replay_state["examples"].append((record["timestamp"], field, rec[field], record.get(field)))
+
+
+def stop_on_signals(task):
+    # SIGTERM / SIGHUP end a replay like Ctrl+C, the records so far are saved
+    def on_signal(sig):
+        log_state["signal"] = sig.name
+        task.cancel()
+
+    for sig in (signal.SIGTERM, signal.SIGHUP):
+        asyncio.get_running_loop().add_signal_handler(sig, on_signal, sig)
 
-    print(f"--- Definitive Wi-Fi Survey v{SCRIPT_VERSION} ---\n")
-    
-    # Header Info
-    print(f"Time: {record.get('timestamp', '?')[11:19]}  |  Location: {record.get('location', 'Unknown')}")
-    print("-" * 60)
-    
-    # Network ID Section (The "Identifiers")
-    roam = "!! ROAM !!" if record.get('bss_transition') else ""
-    # Safe getters for text alignment
-    ssid_str = record.get('ssid') or "N/A"
-    bssid_str = record.get('bssid') or "N/A"
-    auth_str = record.get('auth_mode') or "N/A"
-    
-    chan_str = str(record.get('channel'))
-    if record.get('channel_band') and record.get('channel_width'):
-        chan_str += f" ({record.get('channel_band')}, {record.get('channel_width')})"
-
-    print(f"SSID:    {ssid_str:<20}  BSSID:   {bssid_str} {roam}")
-    print(f"Channel: {chan_str:<20}  Mode:    {record.get('phy_mode')}")
-    print(f"Country: {record.get('country_code', 'N/A'):<20}  Auth:    {auth_str}")
-    print(f"NIC IP:  {record.get('nic_ip', 'N/A'):<20}  NIC MAC: {record.get('nic_mac', 'N/A')}")
-    
-    # RF Section
-    print("-" * 60)
-    print(f"RSSI:    {record.get('rssi_dbm', 0)} dBm {'(Good)' if record.get('rssi_dbm', -100) > -65 else '(Poor)'}")
-    print(f"Noise:   {record.get('noise_dbm', 0)} dBm")
-    print(f"SNR:     {int(record.get('rssi_dbm', 0)) - int(record.get('noise_dbm', 0))} dB")
-    print(f"Tx Rate: {record.get('tx_rate_mbps', 0)} Mbps")
-    
-    # Performance Section
-    print("-" * 60)
-    print(f"LAN Ping: {record.get('icmp_lan_ms', 'N/A')} ms (Lost: {record.get('icmp_lan_lost')}%)")
-    print(f"WAN Ping: {record.get('icmp_wan_ms', 'N/A')} ms (Lost: {record.get('icmp_wan_lost')}%)")
-    
-    # Iperf Staleness Check
-    iperf_time = record.get('iperf_updated_at')
-    stale_label = ""
-    if iperf_time and (time.time() - iperf_time > 10):
-        stale_label = " (cached)"
-    
-    rx = int(record.get('iperf_rx_mbps', 0) or 0)
-    tx = int(record.get('iperf_tx_mbps', 0) or 0)
-    print(f"Speed:    Rx {rx} Mbps  /  Tx {tx} Mbps{stale_label}")
-    
-    print("\n")
-    print("Enter new location and press Enter, or Ctrl+C to save and quit > ", end="", flush=True)
+
+async def replay_survey(records, sources, view):
+    stop_on_signals(asyncio.current_task())
+    pacer = Pacer(args.speed)
+    next_render = 0.0
+    try:
+        for n, rec in enumerate(records):
+            delay = pacer.delay_s(rec["epoch"])
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif n % 256 == 0:
+                await asyncio.sleep(0)  # Flat out, still let signals in
+            await replay_record(rec, sources)
+            # Redraws are paced on real time, at 1000x most records are never shown
+            if view and time.monotonic() >= next_render:
+                await render_task()
+                next_render = time.monotonic() + RENDER_INTERVAL_S
+        if view:
+            await render_task()
+    except asyncio.CancelledError:
+        if not log_state["signal"]:
+            raise
+
+
+def print_replay_stats(first_epoch, wall_s):
+    st = replay_state
+    span_s = clock.time() - first_epoch
+    print(f"Replayed {st['records']} records ({span_s / 60:.1f} min of survey) in {wall_s:.1f}s"
+          + (f", {span_s / wall_s:.0f}x real time" if wall_s > 0 else "") + f", {st['roams']} roams")
+    print("Check: " + ", ".join(f"{field} {st['mismatches'][field]} mismatches" for field in CHECKED))
+    for timestamp, field, recorded, rebuilt in st["examples"]:
+        print(f"  {timestamp} {field}: recorded {recorded}, rebuilt {rebuilt}")
+
+
+def print_scheduler_stats(scheduler):
+    print("Scheduler (lateness avg/p95/max ms, runs, timeouts, skipped):")
+    for name, st in scheduler.stats().items():
+        print(f"  {name:<6} {st['lateness_avg_ms']}/{st['lateness_p95_ms']}/{st['lateness_max_ms']}  "
+              f"runs {st['runs']}  timeouts {st['timeouts']}  skipped {st['skipped']}")
+
+def print_radio_cost():
+    cost = radio.cost.summary()
+    spawns = cost.pop("spawns")
+    print(f"Radio ({radio.name}, avg/max us per call, calls):")
+    for kind, c in cost.items():
+        print(f"  {kind:<12} {c['avg_us']}/{c['max_us']}  calls {c['calls']}")
+    if spawns:
+        print(f"  subprocesses {spawns}")
+
+def print_probe_stats():
+    st = coordinator.stats()
+    print(f"Probes ({st['policy']}, {st['mode']}): airtime {st['airtime_pct']}% of the last "
+          f"{coordinator.budget.window_ns // 10**9}s, budget x{st['budget_factor']}, "
+          + ", ".join(f"{k} {v}s" for k, v in st["airtime_s"].items()))
+    if st["gated"] or st["tagged"]:
+        print(f"  gated {st['gated'] or 0}, under load {st['tagged'] or 0}")
+
+def print_scan_stats():
+    st = scan_state["scanner"].stats()
+    print(f"Neighbor scans: {st['scans']} done, {st['deferred']} deferred, {st['errors']} failed"
+          + (f", log at {st['log_ratio']:.0%} of full tables" if "log_ratio" in st else "")
+          + (f" (last error: {st['last_error']})" if st['last_error'] else ""))
+
+def print_stream_stats(stream, survey):
+    st = stream.stats()
+    print(f"Streamed {st['sent']} records to {STREAM_TO}"
+          + (f" ({st['ratio']:.0%} of raw size)" if st["ratio"] else "")
+          + (f", {st['connects']} connections" if st["connects"] > 1 else ""))
+    if st["pending"] or st["spool_bytes"] or st["dropped"]:
+        # Everything is in the local log anyway, send it once the collector is reachable
+        print(f"  {st['pending'] + st['dropped']} records did not reach the collector ({st['last_error']}), backfill with:")
+        print(f"  python3 collector.py send {STREAM_TO} {survey} --agent {STREAM_AGENT}")
 
 # --- Main ---
 if __name__ == "__main__":
-    if not os.path.exists(IPERF_PATH): print(f"WARNING: iperf3 not found at {IPERF_PATH}")
+    if IPERF_ENGINE == "iperf3" and not os.path.exists(IPERF_PATH): print(f"WARNING: iperf3 not found at {IPERF_PATH}")
+
+    if REPLAY_MODE:
+        # The records bring their own columns, probes, watchers, metrics and the collector stay off
+        if args.replay and not os.path.exists(args.replay):
+            sys.exit(f"FATAL ERROR: No survey at {args.replay}")
+        if args.replay:
+            records = iter_recorded(args.replay)
+        else:
+            records = iter_scenario(args.simulate, args.seed, interval_s=LOG_INTERVAL_S)
+        first = next(records, None)
+        if first is None:
+            sys.exit(f"FATAL ERROR: No records in {args.replay}")
+        records = itertools.chain([first], records)
+        replay_columns = list(first)
+        clock.set(first["epoch"])
+        ping_targets, app_kinds = view_targets(replay_columns)
+        # The stand-ins answer for the recorded prefixes and probe names
+        ICMP_LAN_SERVER, ICMP_WAN_SERVER = "lan", "wan"
+        ICMP_EXTRA_TARGETS = {prefix: prefix for prefix in ping_targets}
+        ICMP_PACKET_COUNT = first.get("icmp_lan_count") or ICMP_PACKET_COUNT
+        app_probes = {name: AppProbe(name, kind, "replay", "replay", 0) for name, kind in app_kinds.items()}
+        live_view = LiveView(SCRIPT_VERSION, ping_targets, app_kinds, prompt="", clock=clock.time)
+        ROAM_CAPTURE = NEIGHBOR_SCAN = False
+        METRICS_PORT = 0
+        STREAM_TO = ""
+    else:
+        # Extra ping targets (DNS servers, AP management IPs...) get their own columns
+        for prefix in ICMP_EXTRA_TARGETS:
+            FIELD_ORDER = FIELD_ORDER + icmp_fields(prefix) + [f"age_icmp_{prefix}_ms"]
+        # Application probes too, the columns depend on the kind of probe
+        for name, probe in app_probes.items():
+            FIELD_ORDER = FIELD_ORDER + app_fields(name, probe.kind) + [f"age_app_{name}_ms"]
+        if NEIGHBOR_SCAN:
+            FIELD_ORDER = FIELD_ORDER + NEIGHBOR_SUMMARY_FIELDS + ["age_scan_ms"]
+        if LOAD_POLICY == "loaded":
+            for prefix in ["lan", "wan"] + list(ICMP_EXTRA_TARGETS):
+                FIELD_ORDER = FIELD_ORDER + loaded_fields(prefix)
+            FIELD_ORDER = FIELD_ORDER + ["age_loaded_ms"]
+    columns = log_state["columns"] = replay_columns if REPLAY_MODE else FIELD_ORDER
 
-    # Start Daemons
-    threading.Thread(target=location_input_thread, daemon=True).start()
-    threading.Thread(target=wifi_worker, daemon=True).start()
-    threading.Thread(target=icmp_worker, args=(ICMP_LAN_SERVER, "lan"), daemon=True).start()
-    threading.Thread(target=icmp_worker, args=(ICMP_WAN_SERVER, "wan"), daemon=True).start()
-    threading.Thread(target=iperf_worker, daemon=True).start()
+    # Raw retention: the 1 h rollup needs its raw records until its hour is over (and a crash rebuild after that)
+    if RAW_RETENTION_H and not ROLLUPS:
+        sys.exit("FATAL ERROR: raw_retention_h needs rollups on, pruned records would be gone for good")
+    if 0 < RAW_RETENTION_H < 2:
+        sys.exit(f"FATAL ERROR: raw_retention_h must be 0 (keep everything) or at least 2, got {RAW_RETENTION_H}")
+
+    if not (isinstance(LOG_SEGMENT_MB, (int, float)) and LOG_SEGMENT_MB > 0):
+        sys.exit(f"FATAL ERROR: log_segment_mb must be a number above 0, got {LOG_SEGMENT_MB!r}")
+    if not (isinstance(STREAM_SPOOL_MB, (int, float)) and STREAM_SPOOL_MB >= 0):
+        sys.exit(f"FATAL ERROR: stream_spool_mb must be a number, 0 or more, got {STREAM_SPOOL_MB!r}")
 
-    previous_bssid = None
-    
     # Dynamic Filename Setup
     if not os.path.exists(LOG_DIR): os.makedirs(LOG_DIR)
-    
-    start_epoch = int(time.time())
-    current_log_file = os.path.join(LOG_DIR, f"survey_{start_epoch}_running.jsonl")
-    
-    print(f"Logging to {current_log_file}...")
-    
-    # Ordered Field Keys for consistent JSON/CSV look
-    # Order: Time, Loc, NIC, Radio, Signal, Perf
-    FIELD_ORDER = [
-        "epoch", "timestamp", 
-        "location", "country_code", "ssid", "bssid", "bss_transition",
-        "nic_mac", "nic_ip", "nic_gw_ip",
-        "auth_mode", "phy_mode", "channel", "channel_band", "channel_width", "tx_rate_mbps",
-        "rssi_dbm", "noise_dbm", "snr",
-        "iperf_rx_mbps", "iperf_tx_mbps", 
-        "icmp_lan_count", "icmp_lan_ms", "icmp_lan_lost", 
-        "icmp_wan_count", "icmp_wan_ms", "icmp_wan_lost"
-    ]
-
-    with open(current_log_file, "a") as f:
-        while True:
-            try:
-                time.sleep(LOG_INTERVAL_S)
-                
-                # Snapshot data
-                with data_lock:
-                    snapshot = latest_data.copy()
-                
-                # Computed Fields
-                ts = int(time.time())
-                snapshot["epoch"] = ts
-                snapshot["timestamp"] = datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
-                
-                curr_bssid = snapshot.get("bssid")
-                snapshot["bss_transition"] = 1 if (previous_bssid and curr_bssid and curr_bssid != previous_bssid) else 0
-                if curr_bssid: previous_bssid = curr_bssid
-                
-                try: snapshot["snr"] = int(snapshot["rssi_dbm"]) - int(snapshot["noise_dbm"])
-                except: snapshot["snr"] = 0
-
-                # Reconstruct Ordered Dict
-                final_record = {k: snapshot.get(k) for k in FIELD_ORDER}
-                
-                # Write
-                f.write(json.dumps(final_record) + "\n")
-                f.flush()
-                
-                display_live_view(current_log_file)
-                
-            except KeyboardInterrupt:
-                print("\n\n--- Survey Stopped ---")
-                
-                # Rename file with final epoch
-                end_epoch = int(time.time())
-                final_filename = os.path.join(LOG_DIR, f"survey_{start_epoch}-{end_epoch}.jsonl")
-                try:
-                    os.rename(current_log_file, final_filename)
-                    print(f"Log saved to: {final_filename}")
-                    
-                    if EXPORT_LOGS:
-                        print("Exporting logs...")
-                        converter_script = os.path.join(SCRIPT_DIR, "convert_logs.py")
-                        subprocess.run([sys.executable, converter_script, final_filename])
-
-                except OSError as e:
-                    print(f"Error handling log file: {e}")
-                    print(f"Log saved to: {current_log_file}")
-                
-                sys.exit(0)
-            except Exception as e:
-                # print(f"Error: {e}") 
-                pass
+    if REPLAY_MODE:
+        os.makedirs(REPLAY_DIR, exist_ok=True)
+
+    # Surveys that never got to finish (crash, power loss): repair, finalize and export them in the background
+    for path, count, dropped in ([] if REPLAY_MODE else recover_orphans(LOG_DIR)):
+        print(f"Recovered unfinished survey {path} ({count} records"
+              + (f", dropped a {dropped} byte partial line)" if dropped else ")"))
+        if os.path.exists(rollup_path(path, "1m")):
+            # The periods still open at the crash, from the raw records
+            added = rebuild_rollups(path, max_gap_s=max(10, 3 * LOG_INTERVAL_S))
+            print("  rollups rebuilt: " + ", ".join(f"{n} {tier} rows" for tier, n in added.items()))
+        if EXPORT_LOGS:
+            subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, "convert_logs.py"), path],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+    # Location prompt blocks on input(), everything else runs on the scheduler
+    if not REPLAY_MODE:
+        threading.Thread(target=location_input_thread, daemon=True).start()
+
+    # Replays go to their own directory, named after the survey time with "_replay" / "_sim"
+    start_epoch = int(clock.time())
+    if REPLAY_MODE:
+        run_name = os.path.join(REPLAY_DIR, f"survey_{start_epoch}_{REPLAY_MODE}")
+    else:
+        run_name = os.path.join(LOG_DIR, f"survey_{start_epoch}")
+    current_log_file = run_name + "_running"
+    if REPLAY_MODE:
+        # A replay can always be redone from its source, so an earlier one of the same survey is replaced
+        for old in glob.glob(glob.escape(run_name) + "[-_]*"):
+            if os.path.isdir(old):
+                shutil.rmtree(old)
+            else:
+                os.remove(old)
+
+    print(f"Logging to {current_log_file}/...")
+    if ROAM_CAPTURE:
+        roam_state["path"] = os.path.join(LOG_DIR, f"roams_{start_epoch}.jsonl")
+        print(f"Roam events to {roam_state['path']} ({ROAM_CAPTURE_HZ} Hz)")
+    if NEIGHBOR_SCAN:
+        scan_state["path"] = os.path.join(LOG_DIR, f"neighbors_{start_epoch}.jsonl")
+        print(f"Neighbor scans to {scan_state['path']} (every {NEIGHBOR_SCAN_INTERVAL_S}s)")
+
+    if METRICS_PORT:
+        print(f"Metrics on http://{METRICS_BIND}:{METRICS_PORT}/metrics")
+    profiler = SamplingProfiler(interval_s=PROFILE_INTERVAL_MS / 1000).start() if PROFILE else None
+
+    # Exports are written as the survey runs, stopping only has to close them
+    if EXPORT_LOGS:
+        log_state["exporter"] = LiveExporter(current_log_file, columns, EXPORT_COLUMNAR).start()
+
+    # Agent mode: records also go to a collector, spooled next to the log while it can't be reached
+    if STREAM_TO:
+        try:
+            address = parse_address(STREAM_TO)
+        except ValueError:
+            sys.exit(f"FATAL ERROR: stream_to must be host:port, got {STREAM_TO!r}")
+        log_state["stream"] = StreamAgent(address, STREAM_AGENT, start_epoch,
+                                          os.path.join(LOG_DIR, f"spool_{start_epoch}.bin"), STREAM_BATCH_S,
+                                          compress=STREAM_COMPRESS, spool_max_bytes=int(STREAM_SPOOL_MB * 2**20),
+                                          token=STREAM_TOKEN).start()
+        REGISTRY.gauge("stream_pending_records", "Records not yet acknowledged by the collector",
+                       fn=lambda: {(): log_state["stream"].pending()})
+        REGISTRY.gauge("stream_sent_records", "Records acknowledged by the collector",
+                       fn=lambda: {(): log_state["stream"].sent})
+        print(f"Streaming to {address[0]}:{address[1]} as agent '{STREAM_AGENT}'")
+
+    scheduler = Scheduler(observer=observe_task)
+    writer = log_state["writer"] = SegmentedLog(
+        current_log_file, start_epoch, int(LOG_SEGMENT_MB * 2**20), LOG_SEGMENT_S, LOG_FSYNC, LOG_FSYNC_INTERVAL_S,
+        LOG_COMMIT_INTERVAL_S, on_commit=observe_commit, fmt=LOG_FORMAT, columns=columns,
+        retention_s=RAW_RETENTION_H * 3600, clock=clock.monotonic).start()
+    if REPLAY_MODE:
+        writer.manifest["replay"] = args.replay or f"simulate {args.simulate} seed {args.seed}"
+    # 1 m / 1 h summaries next to the raw log, they outlive raw_retention_h
+    if ROLLUPS:
+        log_state["rollups"] = RollupWriter(current_log_file, columns, max_gap_s=max(10, 3 * LOG_INTERVAL_S),
+                                            fsync=LOG_FSYNC != "never").start()
+    began = time.monotonic()
+    try:
+        if REPLAY_MODE:
+            asyncio.run(replay_survey(records, source_map(columns), not args.no_view))
+        else:
+            asyncio.run(run_survey(scheduler))
+    except KeyboardInterrupt:
+        pass
+    print(f"\n\n--- Survey Stopped{' (' + log_state['signal'] + ')' if log_state['signal'] else ''} ---")
+    if REPLAY_MODE:
+        print_replay_stats(first["epoch"], time.monotonic() - began)
+    else:
+        print_scheduler_stats(scheduler)
+        print_radio_cost()
+        print_probe_stats()
+    if scan_state["scanner"]:
+        print_scan_stats()
+    writer.close()
+    if writer.error:
+        print(f"Log writer error: {writer.error}")
+    rollups = log_state["rollups"]
+    if rollups:
+        rollups.close()
+        print("Rollups: " + ", ".join(f"{rollups.rows[tier]} {tier} rows" for tier in ("1m", "1h"))
+              + (f" (error: {rollups.error})" if rollups.error else ""))
+    if writer.pruned:
+        print(f"Raw retention: {writer.pruned} segments ({writer.pruned_bytes / 1e6:.1f} MB) "
+              f"older than {RAW_RETENTION_H} h pruned")
+    if profiler:
+        profiler.stop()
+        profile_path = os.path.join(LOG_DIR, f"profile_{start_epoch}.folded")
+        profiler.write(profile_path)
+        print(f"Profile ({profiler.samples} samples) saved to {profile_path}, top functions:")
+        for fn, count, share in profiler.top():
+            print(f"  {share:6.1%}  {fn}")
+
+    # Rename with final epoch
+    end_epoch = int(clock.time())
+    final_filename = f"{run_name}-{end_epoch}"
+    try:
+        writer.finalize(final_filename, end_epoch)
+        print(f"Log saved to: {final_filename}/ ({writer.records} records, {len(writer.manifest['segments'])} segments)")
+
+        exporter = log_state["exporter"]
+        if exporter:
+            print("Finishing exports...")
+            saved = exporter.finish(final_filename, EXPORT_FINALIZE_TIMEOUT_S)
+            if saved is None:
+                print(f"Export incomplete ({exporter.error or 'timed out'}), "
+                      f"redo it with: python3 convert_logs.py {final_filename}")
+            for path in saved or []:
+                print(f"-> Saved {path}")
+            if scan_state["path"] and EXPORT_LOGS:
+                print(f"-> Saved {scan_state['path'].rsplit('.', 1)[0]}.csv")
+
+    except OSError as e:
+        print(f"Error handling log file: {e}")
+        print(f"Log saved to: {current_log_file}")
+        final_filename = current_log_file
+
+    stream = log_state["stream"]
+    if stream:
+        stream.close()
+        print_stream_stats(stream, final_filename)
+        if stream.spool_path and os.path.exists(stream.spool_path):
+            os.remove(stream.spool_path)  # Backfill reads the log, the spool has nothing it doesn't
+
+    sys.exit(1 if args.check and replay_state["mismatches"] else 0)